@@ -1,10 +1,42 @@
 import re
 from enum import Enum
 import os
-from time import sleep
+import sys
+import shlex
+import argparse
+from time import perf_counter, monotonic
 import json
+import csv
+import gzip
+import functools
+import hashlib
+import base64
+import cProfile
+from collections import Counter, defaultdict, deque
+from itertools import islice
+import threading
+import asyncio
+import socket
+import signal
+import unicodedata
+import sqlite3
+import weakref
+import mmap
+import struct
+from contextlib import contextmanager, nullcontext
+import ipaddress
+import bisect
+import heapq
+import math
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+try:
+    import numpy as np
+except ImportError:   # NumPy es opcional: sin él validar_ips_lote valida de a una IP
+    np = None
+
 # 🌈 Paleta de colores y estilos
 class Color:
     PURPLE = '\033[95m'
@@ -18,17 +50,83 @@ class Color:
     UNDERLINE = '\033[4m'
     END = '\033[0m'
 
+# 🖥️ Terminal
+SECUENCIA_LIMPIAR = '\033[H\033[2J\033[3J'   # cursor al inicio, borrar pantalla y historial
+
+class Terminal:
+    """Compone cada pantalla en memoria y la escribe de una sola vez al pedir datos"""
+    def __init__(self, flujo):
+        self.flujo = flujo
+        # Sin terminal (salida redirigida o TERM=dumb) no se limpia ni se colorea
+        self.es_tty = bool(flujo and flujo.isatty()) and os.environ.get('TERM') != 'dumb'
+        self.color = self.es_tty and 'NO_COLOR' not in os.environ
+        self.avisos = []
+        self._partes = []
+        self._candado = threading.Lock()
+        if self.es_tty and os.name == 'nt':
+            os.system('')   # activa las secuencias ANSI en la consola de Windows
+
+    def write(self, texto):
+        with self._candado:
+            self._partes.append(texto)
+        return len(texto)
+
+    def flush(self):
+        # input() vacía sys.stdout antes del prompt: un cuadro, una escritura
+        with self._candado:
+            texto, self._partes = ''.join(self._partes), []
+        if not texto:
+            return
+        self.flujo.flush()
+        crudo = getattr(self.flujo, 'buffer', None)
+        if crudo is None:
+            self.flujo.write(texto)
+        else:
+            crudo.write(texto.encode(self.flujo.encoding or 'utf-8', self.flujo.errors or 'strict'))
+        self.flujo.flush()
+
+    def isatty(self):
+        return self.flujo.isatty()
+
+    def fileno(self):
+        return self.flujo.fileno()
+
+    def __getattr__(self, nombre):
+        return getattr(self.flujo, nombre)
+
+    @contextmanager
+    def pantalla(self):
+        """Desvía print() al búfer de cuadros mientras dura la interfaz interactiva"""
+        anterior, sys.stdout = sys.stdout, self
+        try:
+            yield self
+        finally:
+            sys.stdout = anterior
+            self.flush()
+
+TERMINAL = Terminal(sys.stdout)
+if not TERMINAL.color:
+    for _atributo in [a for a in vars(Color) if a.isupper()]:
+        setattr(Color, _atributo, '')
+
 # 🎨 Diseño de la interfaz
 def limpiar_pantalla():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    if TERMINAL.es_tty:
+        print(SECUENCIA_LIMPIAR, end='')
 
 def mostrar_titulo(titulo):
     limpiar_pantalla()
     print(f"{Color.BLUE}{'═' * 60}{Color.END}")
     print(f"{Color.BOLD}{Color.PURPLE}{titulo.center(60)}{Color.END}")
     print(f"{Color.BLUE}{'═' * 60}{Color.END}\n")
+    mostrar_avisos()
 
-def mostrar_mensaje(mensaje, tipo="info"):
+def mostrar_avisos():
+    avisos, TERMINAL.avisos = TERMINAL.avisos, []
+    for aviso in avisos:
+        print(aviso)
+
+def formatear_mensaje(mensaje, tipo="info"):
     icono = ""
     color = Color.BLUE
     if tipo == "error":
@@ -42,8 +140,99 @@ def mostrar_mensaje(mensaje, tipo="info"):
         color = Color.YELLOW
     elif tipo == "info":
         icono = "ℹ️ "
-    
-    print(f"{color}{Color.BOLD}{icono}{mensaje}{Color.END}\n")
+    return f"{color}{Color.BOLD}{icono}{mensaje}{Color.END}\n"
+
+def mostrar_mensaje(mensaje, tipo="info"):
+    print(formatear_mensaje(mensaje, tipo))
+
+def avisar(mensaje, tipo="info"):
+    """Línea de estado que no detiene la interfaz: aparece bajo el título de la próxima pantalla"""
+    if TERMINAL.es_tty:
+        TERMINAL.avisos.append(formatear_mensaje(mensaje, tipo))
+    else:
+        mostrar_mensaje(mensaje, tipo)
+
+# 📈 Instrumentación opcional (P1_PERFIL=1 o --perfil)
+INSTRUMENTACION = {
+    'activa': os.environ.get('P1_PERFIL', '') not in ('', '0'),
+    'cprofile': os.environ.get('P1_CPROFILE') or None,   # etiqueta de la única acción a perfilar
+    'archivo': os.environ.get('P1_PERFIL_ARCHIVO', 'perfil.json'),
+    'perfilador': None
+}
+MUESTRAS_MAXIMAS = 10000
+ESTADISTICAS = {}   # etiqueta -> {'llamadas', 'total', 'muestras'}
+
+def registrar_tiempo(etiqueta, segundos):
+    datos = ESTADISTICAS.get(etiqueta)
+    if datos is None:
+        datos = ESTADISTICAS.setdefault(etiqueta, {'llamadas': 0, 'total': 0.0, 'muestras': deque(maxlen=MUESTRAS_MAXIMAS)})
+    datos['llamadas'] += 1
+    datos['total'] += segundos
+    datos['muestras'].append(segundos)
+
+def medir(etiqueta=None):
+    """Decorador: si la instrumentación está activa acumula llamadas y latencias"""
+    def decorador(funcion):
+        nombre = etiqueta or funcion.__name__
+        
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not INSTRUMENTACION['activa']:
+                return funcion(*args, **kwargs)
+            perfilar = INSTRUMENTACION['cprofile'] == nombre
+            if perfilar and INSTRUMENTACION['perfilador'] is None:
+                INSTRUMENTACION['perfilador'] = cProfile.Profile()
+            inicio = perf_counter()
+            try:
+                if perfilar:
+                    return INSTRUMENTACION['perfilador'].runcall(funcion, *args, **kwargs)
+                return funcion(*args, **kwargs)
+            finally:
+                registrar_tiempo(nombre, perf_counter() - inicio)
+        return envoltura
+    return decorador
+
+def _percentil(ordenadas, fraccion):
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(round(fraccion * (len(ordenadas) - 1))))]
+
+def resumen_estadisticas():
+    resumen = {}
+    for etiqueta, datos in sorted(ESTADISTICAS.items()):
+        ordenadas = sorted(datos['muestras'])
+        resumen[etiqueta] = {
+            'llamadas': datos['llamadas'],
+            'total_ms': datos['total'] * 1000,
+            'p50_ms': _percentil(ordenadas, 0.50) * 1000,
+            'p95_ms': _percentil(ordenadas, 0.95) * 1000,
+            'p99_ms': _percentil(ordenadas, 0.99) * 1000
+        }
+    return resumen
+
+def volcar_estadisticas():
+    """Escribe el resumen en JSON y, si se pidió, el perfil cProfile de la acción elegida"""
+    if not INSTRUMENTACION['activa']:
+        return None
+    with open(INSTRUMENTACION['archivo'], 'w') as f:
+        json.dump(resumen_estadisticas(), f, indent=4, ensure_ascii=False)
+    if INSTRUMENTACION['perfilador'] is not None:
+        INSTRUMENTACION['perfilador'].dump_stats(os.path.splitext(INSTRUMENTACION['archivo'])[0] + '.prof')
+    return INSTRUMENTACION['archivo']
+
+def extraer_opciones_perfil(argv):
+    """Quita --perfil y --cprofile ETIQUETA de la línea de comandos y los aplica"""
+    restantes = []
+    iterador = iter(argv)
+    for argumento in iterador:
+        if argumento == '--perfil':
+            INSTRUMENTACION['activa'] = True
+        elif argumento == '--cprofile':
+            INSTRUMENTACION['activa'] = True
+            INSTRUMENTACION['cprofile'] = next(iterador, None)
+        else:
+            restantes.append(argumento)
+    return restantes
 
 # 🔧 Definición de constantes y validaciones
 SERVICIOS_VALIDOS = {
@@ -64,188 +253,4651 @@ TIPOS_DISPOSITIVO = {
     'IMPRESORA': '🖨️ Impresora'
 }
 
-CAPAS_RED = {
-    'NUCLEO': '💎 Núcleo (Core)',
-    'DISTRIBUCION': '📦 Distribución',
-    'ACCESO': '🔌 Acceso'
-}
+CAPAS_RED = {
+    'NUCLEO': '💎 Núcleo (Core)',
+    'DISTRIBUCION': '📦 Distribución',
+    'ACCESO': '🔌 Acceso'
+}
+
+# Tipos a los que el menú pide capa de red o servicios
+TIPOS_CON_CAPA = [TIPOS_DISPOSITIVO['ROUTER'], TIPOS_DISPOSITIVO['SWITCH']]
+TIPOS_CON_SERVICIOS = [TIPOS_DISPOSITIVO['SERVIDOR'], TIPOS_DISPOSITIVO['ROUTER'], TIPOS_DISPOSITIVO['FIREWALL']]
+
+# 📦 Modelo de dispositivo
+class Dispositivo:
+    """Registro en memoria de un dispositivo; el formato ANSI solo se genera al mostrarlo"""
+    __slots__ = ('tipo', 'nombre', 'ip', 'capa', 'servicios', 'ultima_modificacion', 'salud', '__weakref__')
+
+    def __init__(self, tipo, nombre, ip=None, capa=None, servicios=None, ultima_modificacion=None, salud=None):
+        self.tipo = tipo
+        self.nombre = nombre
+        self.ip = ip or None
+        self.capa = capa or None
+        self.servicios = list(servicios) if servicios else []
+        self.ultima_modificacion = ultima_modificacion
+        self.salud = salud or None   # resultado de la última revisión de alcance (ver revisar_salud)
+
+    def __repr__(self):
+        return f"Dispositivo({self.tipo!r}, {self.nombre!r}, ip={self.ip!r}, capa={self.capa!r}, servicios={self.servicios!r})"
+
+    def tocar(self):
+        # Marcar el registro como modificado
+        self.ultima_modificacion = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def separar_servicios(texto):
+    """Convierte la cadena SERVICIOS del JSON en una lista de servicios"""
+    if isinstance(texto, list):
+        return [s for s in texto if s]
+    servicios = []
+    resto = (texto or '').strip()
+    # Los nombres visibles contienen espacios, así que se reconocen por prefijo
+    conocidos = sorted(SERVICIOS_VALIDOS.values(), key=len, reverse=True)
+    while resto:
+        servicio = next((s for s in conocidos if resto.startswith(s)), None)
+        if servicio is None:
+            servicio = resto.split(' ', 1)[0]
+        servicios.append(servicio)
+        resto = resto[len(servicio):].strip()
+    return servicios
+
+def dispositivo_a_dict(disp):
+    disp_dict = {'TIPO': disp.tipo, 'NOMBRE': disp.nombre}
+    if disp.ip:
+        disp_dict['IP'] = disp.ip
+    if disp.capa:
+        disp_dict['CAPA'] = disp.capa
+    if disp.servicios:
+        disp_dict['SERVICIOS'] = ' '.join(disp.servicios)
+    if disp.ultima_modificacion:
+        disp_dict['ultima_modificacion'] = disp.ultima_modificacion
+    if disp.salud:
+        disp_dict['SALUD'] = disp.salud
+    return disp_dict
+
+def dispositivo_desde_dict(disp_dict):
+    return Dispositivo(
+        disp_dict.get('TIPO', ''),
+        disp_dict.get('NOMBRE', ''),
+        disp_dict.get('IP'),
+        disp_dict.get('CAPA'),
+        separar_servicios(disp_dict.get('SERVICIOS')),
+        disp_dict.get('ultima_modificacion'),
+        disp_dict.get('SALUD')
+    )
+
+# Estados de la revisión de alcance
+SALUD_ACTIVO = 'activo'
+SALUD_CAIDO = 'caido'
+SALUD_SIN_REVISAR = 'sin-revisar'
+SALUD_SIN_SONDA = 'sin-sonda'
+ESTADOS_SALUD = (SALUD_ACTIVO, SALUD_CAIDO, SALUD_SIN_REVISAR)
+
+def estado_salud(disp):
+    return disp.salud.get('estado', SALUD_SIN_REVISAR) if disp.salud else SALUD_SIN_REVISAR
+
+def validar_salud(salud):
+    """Un resultado de revisión que llega de fuera: None o un objeto con un estado conocido"""
+    if not salud:
+        return True
+    if not isinstance(salud, dict) or salud.get('estado') not in ESTADOS_SALUD:
+        raise ValueError(f"Resultado de revisión inválido: se espera un objeto con 'estado' entre {', '.join(ESTADOS_SALUD)}")
+    latencia = salud.get('latencia_ms')
+    if latencia is not None and (isinstance(latencia, bool) or not isinstance(latencia, (int, float))):
+        raise ValueError("Resultado de revisión inválido: 'latencia_ms' debe ser un número")
+    servicios = salud.get('servicios', {})
+    if not isinstance(servicios, dict) or not all(isinstance(datos, dict) for datos in servicios.values()):
+        raise ValueError("Resultado de revisión inválido: 'servicios' debe tener un objeto por servicio")
+    return True
+
+def texto_salud(salud):
+    """'🟢 activo (0.4 ms) · WEB 🟢 · DNS 🔴 - revisado 2024-01-01 10:00:00'"""
+    iconos = {SALUD_ACTIVO: '🟢', SALUD_CAIDO: '🔴'}
+    estado = salud.get('estado', SALUD_SIN_REVISAR)
+    partes = [f"{iconos.get(estado, '⚪')} {estado}" + (f" ({salud['latencia_ms']} ms)" if salud.get('latencia_ms') is not None else "")]
+    partes += [f"{servicio} {iconos.get(datos.get('estado'), '⚪')}" for servicio, datos in salud.get('servicios', {}).items()]
+    return ' · '.join(partes) + (f" - revisado {salud['fecha']}" if salud.get('fecha') else "")
+
+def formatear_dispositivo(disp):
+    """Genera el bloque con colores que se muestra en pantalla"""
+    lineas = [
+        f"{Color.CYAN}🔧 {Color.BOLD}TIPO:{Color.END} {disp.tipo}",
+        f"{Color.CYAN}🏷️ {Color.BOLD}NOMBRE:{Color.END} {disp.nombre}"
+    ]
+    if disp.ip:
+        lineas.append(f"{Color.CYAN}🌍 {Color.BOLD}IP:{Color.END} {disp.ip}")
+    if disp.capa:
+        lineas.append(f"{Color.CYAN}📊 {Color.BOLD}CAPA:{Color.END} {disp.capa}")
+    if disp.servicios:
+        lineas.append(f"{Color.CYAN}🛠️ {Color.BOLD}SERVICIOS:{Color.END} {' '.join(disp.servicios)}")
+    if disp.salud:
+        lineas.append(f"{Color.CYAN}🩺 {Color.BOLD}SALUD:{Color.END} {texto_salud(disp.salud)}")
+    
+    separador = f"{Color.BLUE}{'═' * 60}{Color.END}"
+    return f"\n{separador}\n" + "\n".join(lineas) + f"\n{separador}"
+
+# 🗂️ Inventario indexado
+def normalizar_catalogo(catalogo, valor):
+    """Acepta la clave ('ROUTER') o el valor visible ('📶 Router') de un catálogo"""
+    if valor is None:
+        return None
+    if valor in catalogo:
+        return catalogo[valor]
+    clave = str(valor).upper()
+    return catalogo.get(clave, valor)
+
+def clave_catalogo(catalogo, valor):
+    """Operación inversa: '📶 Router' -> 'ROUTER'"""
+    return next((clave for clave, visible in catalogo.items() if visible == valor), valor)
+
+# 🔤 Índice de trigramas para la búsqueda aproximada de nombres
+def trigramas(texto):
+    """Trigramas de un nombre con relleno: '  sw-core ' pesa más el comienzo que el final"""
+    texto = f"  {texto} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceNombres:
+    """Nombres en minúsculas indexados por trigramas y en orden alfabético.
+
+    Cada trigrama guarda en un array compacto los ids de los nombres que lo contienen. Quitar un
+    nombre deja su id como hueco, que las consultas descartan; cuando hay más huecos que nombres
+    el índice se reconstruye. Los parecidos salen primero de los nombres a una edición del texto,
+    que se buscan en el diccionario sin recorrer listas; con el peor de ellos como piso se leen
+    solo las listas más raras que pueden esconder uno mejor, si caben en el presupuesto de ids.
+    Ninguna etapa lee más ids que el presupuesto, así el costo no depende del tamaño del inventario.
+    """
+
+    PRESUPUESTO = 1000   # ids leídos como máximo por etapa de una búsqueda
+    MAXIMO_VECINOS = 32   # textos más largos no generan los nombres a una edición
+
+    def __init__(self, nombres=()):
+        self._reconstruir(nombres)
+
+    def _reconstruir(self, nombres):
+        self._nombres = []     # id -> nombre, None si se quitó
+        self._ids = {}         # nombre -> id
+        self._trigramas = defaultdict(lambda: array('I'))   # trigrama -> ids en orden creciente
+        self._huecos = 0
+        self._medios = None    # par de letras -> letras que van entre ellas en algún trigrama
+        for nombre in nombres:
+            self._indexar(nombre)
+        self._ordenados = sorted(self._ids)
+
+    def _indexar(self, nombre):
+        id_nombre = len(self._nombres)
+        self._nombres.append(nombre)
+        self._ids[nombre] = id_nombre
+        listas = self._trigramas
+        for trigrama in trigramas(nombre):
+            listas[trigrama].append(id_nombre)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def agregar(self, nombre):
+        nombre = nombre.lower()
+        if nombre not in self._ids:
+            self._indexar(nombre)
+            bisect.insort(self._ordenados, nombre)
+            if self._medios is not None:
+                for trigrama in trigramas(nombre):
+                    self._medios[trigrama[0] + trigrama[2]].add(trigrama[1])
+
+    def quitar(self, nombre):
+        nombre = nombre.lower()
+        id_nombre = self._ids.pop(nombre, None)
+        if id_nombre is None:
+            return
+        self._nombres[id_nombre] = None
+        del self._ordenados[bisect.bisect_left(self._ordenados, nombre)]
+        self._huecos += 1
+        if self._huecos > max(1000, len(self._ids)):
+            self._reconstruir(list(self._ids))
+
+    # Consultas
+    def prefijo(self, texto, limite=None):
+        """Nombres que empiezan por el texto, en orden alfabético"""
+        texto = texto.lower()
+        inicio = bisect.bisect_left(self._ordenados, texto)
+        fin = bisect.bisect_left(self._ordenados, texto + '\U0010ffff', inicio)
+        return self._ordenados[inicio:fin if limite is None else min(fin, inicio + limite)]
+
+    def contienen(self, texto, limite=None, presupuesto=None):
+        """Nombres que contienen el texto; None si es tan corto que el índice no sirve.
+        Con presupuesto solo se miran los primeros ids de la lista más corta"""
+        texto = texto.lower()
+        if len(texto) < 3:
+            return None
+        listas = [self._trigramas.get(texto[i:i + 3]) for i in range(len(texto) - 2)]
+        if not all(listas):
+            return []
+        # Todo nombre que contiene el texto está en las dos listas más cortas de sus trigramas; como
+        # los ids van en orden, de la segunda basta el tramo hasta el último id de la primera
+        listas.sort(key=len)
+        candidatos = listas[0] if presupuesto is None else listas[0][:presupuesto]
+        if len(listas) > 1:
+            segunda = listas[1][:bisect.bisect_right(listas[1], candidatos[-1])]
+            candidatos = sorted(set(candidatos).intersection(segunda))
+        encontrados = []
+        for id_nombre in candidatos:
+            nombre = self._nombres[id_nombre]
+            if nombre is not None and texto in nombre:
+                encontrados.append(nombre)
+                if len(encontrados) == limite:
+                    break
+        return encontrados
+
+    def vecinos(self, texto):
+        """Nombres a una edición del texto: un carácter de menos, de más, cambiado o dos traspuestos"""
+        texto = texto.lower()
+        if len(texto) > self.MAXIMO_VECINOS:
+            return []
+        if self._medios is None:
+            self._medios = defaultdict(set)
+            for trigrama in self._trigramas:
+                self._medios[trigrama[0] + trigrama[2]].add(trigrama[1])
+        medios = self._medios
+        relleno = f"  {texto} "
+        variantes = set()
+        for i in range(len(texto) + 1):
+            inicio, fin = texto[:i], texto[i:]
+            # Solo se prueban letras que formen con sus vecinas un trigrama de algún nombre
+            variantes.update(inicio + letra + fin for letra in medios.get(relleno[i + 1:i + 3], ()))
+            if fin:
+                variantes.add(inicio + fin[1:])
+                variantes.update(inicio + letra + fin[1:] for letra in medios.get(relleno[i + 1] + relleno[i + 3], ()))
+                if len(fin) > 1:
+                    variantes.add(inicio + fin[1] + fin[0] + fin[2:])
+        variantes.discard(texto)
+        return list(self._ids.keys() & variantes)
+
+    def similares(self, texto, limite=10, umbral=0.3):
+        """[(nombre, similitud)] con similitud de Jaccard entre trigramas >= umbral, de mayor a menor"""
+        texto = texto.lower()
+        buscados = trigramas(texto)
+        
+        def similitud(nombre):
+            propios = trigramas(nombre)
+            comunes = len(buscados & propios)
+            return comunes / (len(buscados) + len(propios) - comunes)
+        
+        # Una errata deja el nombre a una edición: esos candidatos salen del diccionario
+        puntajes = {nombre: similitud(nombre) for nombre in self.vecinos(texto)}
+        mejores = heapq.nlargest(limite, puntajes.values())
+        # Un nombre que comparte c de los q trigramas buscados tiene similitud <= c/q: para superar
+        # el piso necesita c >= minimo, y entonces está en alguna de las q - minimo + 1 listas más
+        # raras (los trigramas que nadie usa cuentan como listas vacías)
+        q = len(buscados)
+        if len(mejores) == limite:
+            minimo = math.floor(max(mejores[-1], umbral) * q) + 1
+        else:
+            minimo = math.ceil(umbral * q)
+        listas = [self._trigramas.get(trigrama) for trigrama in buscados]
+        necesarias = q - minimo + 1 - sum(1 for lista in listas if not lista)
+        listas = sorted((lista for lista in listas if lista), key=len)[:max(necesarias, 0)]
+        if len(mejores) == limite and sum(map(len, listas)) > self.PRESUPUESTO:
+            # Leídas a medias, esas listas solo aportarían nombres al azar que comparten un trigrama
+            listas = []
+        
+        contados = Counter()
+        leidos = 0
+        for lista in listas:
+            if leidos >= self.PRESUPUESTO:
+                break
+            contados.update(lista[:self.PRESUPUESTO - leidos])
+            leidos += len(lista)
+        for id_nombre, _ in contados.most_common(limite * 2):
+            nombre = self._nombres[id_nombre]
+            if nombre is not None and nombre not in puntajes:
+                puntajes[nombre] = similitud(nombre)
+        elegidos = heapq.nlargest(limite, ((valor, nombre) for nombre, valor in puntajes.items() if valor >= umbral),
+                                  key=lambda par: (par[0], -len(par[1])))
+        return [(nombre, valor) for valor, nombre in elegidos]
+
+    def buscar(self, texto, limite=10):
+        """Los 'limite' mejores nombres: exacto, por prefijo, por subcadena y luego aproximados"""
+        texto = texto.strip().lower()
+        if not texto:
+            return []
+        resultado = dict.fromkeys([texto] if texto in self._ids else [])
+        resultado.update(dict.fromkeys(self.prefijo(texto, limite)))
+        if len(resultado) < limite:
+            resultado.update(dict.fromkeys(self.contienen(texto, limite, self.PRESUPUESTO) or []))
+        if len(resultado) < limite and len(texto) >= 2:
+            resultado.update(dict.fromkeys(nombre for nombre, _ in self.similares(texto, limite)))
+        return list(resultado)[:limite]
+
+class Inventario:
+    """Dispositivos en orden de inserción con índices hash para búsquedas O(1)"""
+
+    def __init__(self, dispositivos=None):
+        self._dispositivos = {}   # dict usado como conjunto ordenado
+        self._lista = None
+        self.por_ip = {}
+        self.por_nombre = {}
+        self.por_tipo = {}
+        self.por_capa = {}
+        self.por_servicio = {}
+        self.por_salud = {}
+        self.version = 0
+        self.oyentes = []   # funciones oyente(operacion, disp, datos) avisadas en cada cambio
+        self.diario = None
+        self.subredes = None
+        self.topologia = None
+        self.historial = None
+        self.vigilante = None
+        self._indice_nombres = None
+        self.error_carga = None
+        self._cargado = threading.Event()
+        self._cargado.set()
+        for disp in dispositivos or []:
+            self.agregar(disp)
+
+    # Acceso tipo lista para el menú
+    def __len__(self):
+        return len(self._dispositivos)
+
+    def __iter__(self):
+        return iter(list(self._dispositivos))
+
+    def __contains__(self, disp):
+        return disp in self._dispositivos
+
+    def __getitem__(self, posicion):
+        if self._lista is None:
+            self._lista = list(self._dispositivos)
+        return self._lista[posicion]
+
+    def cargando(self):
+        return not self._cargado.is_set()
+
+    def esperar_carga(self):
+        """Bloquea hasta que termine la carga en segundo plano, si la hay"""
+        self._cargado.wait()
+        if self.error_carga:
+            mostrar_mensaje(f"Error al cargar dispositivos: {self.error_carga}", "error")
+            self.error_carga = None
+
+    def _cambio(self, operacion, disp, **datos):
+        self._lista = None
+        self.version += 1
+        if self._indice_nombres is not None:
+            # Todas las variantes del inventario pasan por aquí: el índice de nombres sigue al día
+            if operacion in ('eliminar', 'renombrar'):
+                self._indice_nombres.quitar(datos.get('anterior') if operacion == 'renombrar' else disp.nombre)
+            if operacion in ('agregar', 'renombrar'):
+                self._indice_nombres.agregar(disp.nombre)
+        for oyente in self.oyentes:
+            oyente(operacion, disp, datos)
+
+    @staticmethod
+    def _indexar(indice, clave, disp):
+        if clave:
+            indice.setdefault(clave, {})[disp] = None
+
+    @staticmethod
+    def _desindexar(indice, clave, disp):
+        grupo = indice.get(clave)
+        if grupo is not None:
+            grupo.pop(disp, None)
+            if not grupo:
+                del indice[clave]
+
+    # Consultas
+    def ips(self):
+        return list(self.por_ip)
+
+    def buscar_por_ip(self, ip):
+        return self.por_ip.get(ip)
+
+    def buscar_por_nombre(self, nombre):
+        return self.por_nombre.get(nombre.lower())
+
+    def buscar_texto(self, texto):
+        """Dispositivos cuyo nombre contiene el texto, sin distinguir mayúsculas"""
+        texto = texto.lower()
+        return [disp for disp in self._dispositivos if texto in disp.nombre.lower()]
+
+    def _claves_nombres(self):
+        return list(self.por_nombre)
+
+    def indice_nombres(self):
+        """Índice de trigramas de los nombres; se construye en la primera búsqueda que lo usa"""
+        if self._indice_nombres is None:
+            self._indice_nombres = IndiceNombres(self._claves_nombres())
+        return self._indice_nombres
+
+    def buscar_nombres(self, texto, limite=10):
+        """Hasta 'limite' dispositivos ordenados por parecido del nombre; tolera errores de tipeo"""
+        return [self.buscar_por_nombre(nombre) for nombre in self.indice_nombres().buscar(texto, limite)]
+
+    def filtrar(self, tipo=None, capa=None, servicio=None, salud=None):
+        """Dispositivos que cumplen todos los criterios indicados, p. ej. ROUTER + NUCLEO + VPN"""
+        grupos = []
+        if tipo:
+            grupos.append(self.por_tipo.get(normalizar_catalogo(TIPOS_DISPOSITIVO, tipo), {}))
+        if capa:
+            grupos.append(self.por_capa.get(normalizar_catalogo(CAPAS_RED, capa), {}))
+        if servicio:
+            grupos.append(self.por_servicio.get(normalizar_catalogo(SERVICIOS_VALIDOS, servicio), {}))
+        if salud:
+            grupos.append(self.por_salud.get(salud, {}))
+        if not grupos:
+            return list(self._dispositivos)
+        
+        # Recorrer el grupo más pequeño y comprobar pertenencia en los demás
+        grupos.sort(key=len)
+        base, resto = grupos[0], grupos[1:]
+        return [disp for disp in base if all(disp in grupo for grupo in resto)]
+
+    # Modificaciones
+    def agregar(self, disp):
+        if disp.ip and disp.ip in self.por_ip:
+            raise ValueError(f"La IP {disp.ip} ya está en uso por el dispositivo: {self.por_ip[disp.ip].nombre}")
+        if disp.nombre.lower() in self.por_nombre:
+            raise ValueError(f"El nombre '{disp.nombre}' ya está en uso por otro dispositivo")
+        
+        self._dispositivos[disp] = None
+        if disp.ip:
+            self.por_ip[disp.ip] = disp
+        self.por_nombre[disp.nombre.lower()] = disp
+        self._indexar(self.por_tipo, disp.tipo, disp)
+        self._indexar(self.por_capa, disp.capa, disp)
+        for servicio in disp.servicios:
+            self._indexar(self.por_servicio, servicio, disp)
+        self._indexar(self.por_salud, estado_salud(disp), disp)
+        self._cambio('agregar', disp)
+        return disp
+
+    def cambiar_ip(self, disp, nueva_ip):
+        nueva_ip = nueva_ip or None
+        propietario = self.por_ip.get(nueva_ip) if nueva_ip else None
+        if propietario is not None and propietario is not disp:
+            raise ValueError(f"La IP {nueva_ip} ya está en uso por el dispositivo: {propietario.nombre}")
+        
+        anterior = disp.ip
+        if anterior:
+            self.por_ip.pop(anterior, None)
+        disp.ip = nueva_ip
+        if nueva_ip:
+            self.por_ip[nueva_ip] = disp
+        disp.tocar()
+        self._cambio('ip', disp, anterior=anterior)
+
+    def agregar_servicio(self, disp, servicio):
+        disp.servicios.append(servicio)
+        self._indexar(self.por_servicio, servicio, disp)
+        disp.tocar()
+        self._cambio('servicio', disp, servicio=servicio)
+
+    def quitar_servicio(self, disp, servicio):
+        if servicio not in disp.servicios:
+            raise ValueError(f"'{disp.nombre}' no tiene el servicio {servicio}")
+        disp.servicios.remove(servicio)
+        if servicio not in disp.servicios:
+            self._desindexar(self.por_servicio, servicio, disp)
+        disp.tocar()
+        self._cambio('quitar_servicio', disp, servicio=servicio)
+
+    def cambiar_capa(self, disp, capa):
+        capa = capa or None
+        anterior = disp.capa
+        self._desindexar(self.por_capa, anterior, disp)
+        disp.capa = capa
+        self._indexar(self.por_capa, capa, disp)
+        disp.tocar()
+        self._cambio('capa', disp, anterior=anterior)
+
+    def editar_lote(self, accion, valor, simular=False, **criterios):
+        """Aplica una edición masiva a los dispositivos que cumplen los criterios, todo o nada.
+        Devuelve los cambios [(disp, antes, después)]; con simular=True solo los calcula"""
+        cambios = planificar_edicion(self, accion, valor, **criterios)
+        if not simular:
+            aplicar_edicion(self, accion, cambios)
+        return cambios
+
+    def renombrar(self, disp, nuevo_nombre):
+        propietario = self.por_nombre.get(nuevo_nombre.lower())
+        if propietario is not None and propietario is not disp:
+            raise ValueError(f"El nombre '{nuevo_nombre}' ya está en uso por otro dispositivo")
+        
+        anterior = disp.nombre
+        del self.por_nombre[anterior.lower()]
+        disp.nombre = nuevo_nombre
+        self.por_nombre[nuevo_nombre.lower()] = disp
+        disp.tocar()
+        self._cambio('renombrar', disp, anterior=anterior)
+
+    def eliminar(self, disp):
+        del self._dispositivos[disp]
+        if disp.ip and self.por_ip.get(disp.ip) is disp:
+            del self.por_ip[disp.ip]
+        self.por_nombre.pop(disp.nombre.lower(), None)
+        self._desindexar(self.por_tipo, disp.tipo, disp)
+        self._desindexar(self.por_capa, disp.capa, disp)
+        for servicio in set(disp.servicios):
+            self._desindexar(self.por_servicio, servicio, disp)
+        self._desindexar(self.por_salud, estado_salud(disp), disp)
+        self._cambio('eliminar', disp)
+        return disp
+
+    def registrar_salud(self, disp, salud):
+        """Guarda el resultado de una revisión de alcance; no cuenta como modificación del registro"""
+        self._desindexar(self.por_salud, estado_salud(disp), disp)
+        disp.salud = salud or None
+        self._indexar(self.por_salud, estado_salud(disp), disp)
+        self._cambio('salud', disp, salud=disp.salud)
+
+    def cerrar(self):
+        if self.diario is not None:
+            self.diario.cerrar()
+
+# 📂 Funciones para manejo de archivos JSON
+# Un registro real ocupa unos cientos de caracteres: más que esto es un archivo dañado
+MAXIMO_REGISTRO_JSON = 1 << 20
+
+def _corte_de_bloque(error, buffer):
+    # El registro sigue en el próximo bloque solo si el error está en el final del buffer: un texto
+    # sin cerrar, o un literal o número cortado ('nul', '1.', '\\u00') a pocos caracteres del final
+    return error.msg.startswith('Unterminated string') or len(buffer) - error.pos < 6
+
+def iterar_registros_json(archivo, tam_bloque=1 << 16, estricto=False, al_truncar=None):
+    """Recorre el arreglo JSON de nivel superior registro a registro sin leerlo entero.
+
+    Un registro mal formado es un ValueError con su posición en el archivo. Si el archivo
+    termina a mitad de un registro o sin cerrar el arreglo, con estricto=True también es un
+    error; si no, se conservan los registros completos y se avisa a al_truncar(mensaje)."""
+    decodificador = json.JSONDecoder()
+    with open(archivo, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        inicio = 0   # carácter del archivo donde empieza el buffer, para los mensajes
+        en_arreglo = False
+        
+        def truncado(detalle):
+            mensaje = f"El archivo JSON está incompleto: {detalle} (carácter {inicio + pos})"
+            if estricto:
+                raise ValueError(mensaje)
+            if al_truncar is not None:
+                al_truncar(mensaje)
+        
+        while True:
+            # Descartar lo ya consumido para mantener acotada la memoria
+            if pos > tam_bloque:
+                inicio += pos
+                buffer = buffer[pos:]
+                pos = 0
+            
+            separadores = ' \t\r\n,' if en_arreglo else ' \t\r\n'
+            while pos < len(buffer) and buffer[pos] in separadores:
+                pos += 1
+            if pos == len(buffer):
+                bloque = f.read(tam_bloque)
+                if not bloque:
+                    truncado("termina sin cerrar el arreglo" if en_arreglo else "está vacío")
+                    return
+                inicio += len(buffer)
+                buffer = bloque
+                pos = 0
+                continue
+            
+            if not en_arreglo:
+                if buffer[pos] != '[':
+                    raise ValueError("El archivo no contiene un arreglo JSON")
+                en_arreglo = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            
+            try:
+                registro, pos_fin = decodificador.raw_decode(buffer, pos)
+            except json.JSONDecodeError as error:
+                if not _corte_de_bloque(error, buffer):
+                    raise ValueError(f"Registro mal formado en el carácter {inicio + error.pos} del archivo: {error.msg}")
+                if len(buffer) - pos > MAXIMO_REGISTRO_JSON:
+                    raise ValueError(f"El registro del carácter {inicio + pos} supera {MAXIMO_REGISTRO_JSON} caracteres")
+                # El registro continúa en el siguiente bloque
+                bloque = f.read(tam_bloque)
+                if not bloque:
+                    truncado("termina a mitad de un registro")
+                    return
+                inicio += pos
+                buffer = buffer[pos:] + bloque
+                pos = 0
+                continue
+            yield registro
+            pos = pos_fin
+
+def fragmentos_json(registros, ensure_ascii=True):
+    """Arreglo JSON por tandas de registros, con el mismo formato que json.dump(indent=4)"""
+    yield '['
+    vacio = True
+    registros = iter(registros)
+    while True:
+        tanda = list(islice(registros, 1000))
+        if not tanda:
+            break
+        # json.dumps(tanda) es '[<registros>\n]': se conservan solo los registros
+        yield ('' if vacio else ',') + json.dumps(tanda, indent=4, ensure_ascii=ensure_ascii)[1:-2]
+        vacio = False
+    yield ']' if vacio else '\n]'
+
+def escribir_json_atomico(archivo, datos):
+    """Escribe en un temporal y lo renombra para no dejar nunca un archivo a medias"""
+    temporal = archivo + '.tmp'
+    with open(temporal, 'w') as f:
+        if isinstance(datos, (list, dict)):
+            json.dump(datos, f, indent=4)
+        else:
+            # Iterador: se escribe por tandas sin armar la lista completa
+            for fragmento in fragmentos_json(datos):
+                f.write(fragmento)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, archivo)
+
+def agregar_registros(inventario, datos, avisar=True):
+    """Añade diccionarios del JSON al inventario omitiendo los que chocan con otros"""
+    for disp_dict in datos:
+        try:
+            inventario.agregar(dispositivo_desde_dict(disp_dict))
+        except ValueError as e:
+            if avisar:
+                mostrar_mensaje(f"Registro omitido: {e}", "advertencia")
+    return inventario
+
+# 📤 Exportación a JSON, CSV, YAML e inventario de Ansible
+# Cada formato es un generador de fragmentos de texto: nunca se arma el documento completo
+FORMATOS_EXPORTACION = ('json', 'csv', 'yaml', 'ansible')
+CAMPOS_EXPORTACION = ('nombre', 'tipo', 'ip', 'capa', 'servicios', 'ultima_modificacion', 'salud')
+
+def registro_exportable(disp):
+    """Campos planos con las claves de los catálogos ('ROUTER', 'NUCLEO', ['DNS'])"""
+    return {
+        'nombre': disp.nombre,
+        'tipo': clave_catalogo(TIPOS_DISPOSITIVO, disp.tipo),
+        'ip': disp.ip,
+        'capa': clave_catalogo(CAPAS_RED, disp.capa),
+        'servicios': [clave_catalogo(SERVICIOS_VALIDOS, servicio) for servicio in disp.servicios],
+        'ultima_modificacion': disp.ultima_modificacion,
+        'salud': estado_salud(disp)
+    }
+
+class _Eco:
+    # csv.writer devuelve lo que devuelve write(): así cada fila sale como texto
+    def write(self, texto):
+        return texto
+
+def fragmentos_csv(dispositivos):
+    escritor = csv.writer(_Eco(), lineterminator='\n')
+    yield escritor.writerow(CAMPOS_EXPORTACION)
+    for disp in dispositivos:
+        registro = registro_exportable(disp)
+        registro['servicios'] = ','.join(registro['servicios'])
+        yield escritor.writerow(['' if registro[campo] is None else registro[campo] for campo in CAMPOS_EXPORTACION])
+
+def fragmentos_yaml(dispositivos):
+    # Los escalares y listas en notación JSON también son YAML válido
+    vacio = True
+    for disp in dispositivos:
+        vacio = False
+        yield ''.join(f"{'- ' if i == 0 else '  '}{campo}: {json.dumps(valor, ensure_ascii=False)}\n"
+                      for i, (campo, valor) in enumerate(registro_exportable(disp).items()))
+    if vacio:
+        yield '[]\n'
+
+def fragmentos_ansible(inventario, tipo=None, capa=None, servicio=None, salud=None, nombre=None):
+    """Inventario INI de Ansible: un grupo por tipo (con las variables de cada host) y uno por capa.
+    Cada grupo se consulta aparte a los índices, así que solo hay un grupo en memoria a la vez"""
+    criterios = {'tipo': tipo, 'capa': capa, 'servicio': servicio, 'salud': salud}
+    for campo, catalogo in (('tipo', TIPOS_DISPOSITIVO), ('capa', CAPAS_RED)):
+        for clave, visible in catalogo.items():
+            if criterios[campo] and normalizar_catalogo(catalogo, criterios[campo]) != visible:
+                continue
+            miembros = filtrar_por_nombre(inventario.filtrar(**{**criterios, campo: visible}), nombre)
+            if not miembros:
+                continue
+            yield f"[{clave.lower()}]\n"
+            for disp in miembros:
+                variables = []
+                if campo == 'tipo':
+                    registro = registro_exportable(disp)
+                    if disp.ip:
+                        variables.append(f"ansible_host={disp.ip}")
+                    if registro['capa']:
+                        variables.append(f"capa={registro['capa']}")
+                    if registro['servicios']:
+                        variables.append(f"servicios={','.join(registro['servicios'])}")
+                yield ' '.join([disp.nombre] + variables) + '\n'
+            yield '\n'
+
+def filtrar_por_nombre(dispositivos, nombre=None):
+    if not nombre:
+        return dispositivos
+    texto = nombre.lower()
+    return [disp for disp in dispositivos if texto in disp.nombre.lower()]
+
+def dispositivos_a_exportar(inventario, tipo=None, capa=None, servicio=None, salud=None, nombre=None):
+    """Los mismos filtros que 'list' y 'search'; sin ninguno se recorre el inventario sin copiarlo"""
+    if any((tipo, capa, servicio, salud)):
+        return filtrar_por_nombre(inventario.filtrar(tipo, capa, servicio, salud), nombre)
+    if nombre:
+        return inventario.buscar_texto(nombre)
+    return iter(inventario)
+
+def fragmentos_exportacion(inventario, formato='json', **criterios):
+    if formato == 'ansible':
+        return fragmentos_ansible(inventario, **criterios)
+    dispositivos = dispositivos_a_exportar(inventario, **criterios)
+    if formato == 'json':
+        return fragmentos_json((dispositivo_a_dict(disp) for disp in dispositivos), ensure_ascii=False)
+    if formato == 'csv':
+        return fragmentos_csv(dispositivos)
+    if formato == 'yaml':
+        return fragmentos_yaml(dispositivos)
+    raise ValueError(f"Formato inválido: {formato} (opciones: {', '.join(FORMATOS_EXPORTACION)})")
+
+def formato_por_extension(archivo):
+    """'inventario.csv.gz' -> 'csv'; json si la extensión no corresponde a ningún formato"""
+    base = archivo[:-3] if archivo.endswith('.gz') else archivo
+    extension = os.path.splitext(base)[1].lower()
+    return {'.csv': 'csv', '.yaml': 'yaml', '.yml': 'yaml', '.ini': 'ansible'}.get(extension, 'json')
+
+def escribir_fragmentos(salida, fragmentos, tam_bloque=1 << 16):
+    """Escribe en una salida binaria juntando los fragmentos en bloques de unos 64 KiB"""
+    bloque, tam = [], 0
+    for fragmento in fragmentos:
+        bloque.append(fragmento)
+        tam += len(fragmento)
+        if tam >= tam_bloque:
+            salida.write(''.join(bloque).encode('utf-8'))
+            bloque, tam = [], 0
+    if bloque:
+        salida.write(''.join(bloque).encode('utf-8'))
+
+@medir()
+def exportar(inventario, formato='json', destino=None, comprimir=False, salida=None, **criterios):
+    """Escribe el inventario filtrado a medida que se generan los registros; con destino, en un
+    temporal que se renombra al terminar; comprimir=True lo guarda en gzip"""
+    fragmentos = fragmentos_exportacion(inventario, formato, **criterios)
+    if destino is None:
+        salida = salida or sys.stdout
+        if not comprimir:
+            for fragmento in fragmentos:
+                salida.write(fragmento)
+            return
+        crudo = getattr(salida, 'buffer', None)
+        if crudo is None:
+            raise ValueError("La salida comprimida necesita un archivo o una salida binaria")
+        salida.flush()
+        with gzip.GzipFile(fileobj=crudo, mode='wb') as comprimido:
+            escribir_fragmentos(comprimido, fragmentos)
+        crudo.flush()
+        return
+    
+    temporal = destino + '.tmp'
+    try:
+        with open(temporal, 'wb') as f:
+            if comprimir:
+                nombre = os.path.basename(destino[:-3] if destino.endswith('.gz') else destino)
+                with gzip.GzipFile(nombre, mode='wb', fileobj=f) as comprimido:
+                    escribir_fragmentos(comprimido, fragmentos)
+            else:
+                escribir_fragmentos(f, fragmentos)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    os.replace(temporal, destino)
+
+# 🗄️ Almacenamiento SQLite
+EXTENSIONES_SQLITE = ('.db', '.sqlite', '.sqlite3')
+
+def es_sqlite(archivo):
+    return os.path.splitext(archivo)[1].lower() in EXTENSIONES_SQLITE
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS dispositivos (
+    id INTEGER PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    ip TEXT,
+    capa TEXT,
+    servicios TEXT NOT NULL DEFAULT '[]',
+    ultima_modificacion TEXT,
+    salud TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_dispositivos_ip ON dispositivos(ip);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_dispositivos_nombre ON dispositivos(lower(nombre));
+CREATE INDEX IF NOT EXISTS ix_dispositivos_tipo ON dispositivos(tipo);
+CREATE INDEX IF NOT EXISTS ix_dispositivos_capa ON dispositivos(capa);
+CREATE TABLE IF NOT EXISTS servicios (
+    dispositivo_id INTEGER NOT NULL REFERENCES dispositivos(id) ON DELETE CASCADE,
+    servicio TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_servicios_servicio ON servicios(servicio, dispositivo_id);
+CREATE INDEX IF NOT EXISTS ix_servicios_dispositivo ON servicios(dispositivo_id);
+"""
+
+class InventarioSQLite(Inventario):
+    """Inventario guardado en SQLite (modo WAL); búsquedas y unicidad se resuelven con índices
+    de la base y solo se crean en memoria los dispositivos que se consultan"""
+
+    COLUMNAS = "nombre, tipo, ip, capa, servicios, ultima_modificacion, salud"
+
+    def __init__(self, archivo):
+        super().__init__()
+        self.archivo = archivo
+        self._lock = threading.RLock()
+        self._conexion = sqlite3.connect(archivo, isolation_level=None, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute("PRAGMA foreign_keys=ON")
+        self._conexion.executescript(ESQUEMA_SQLITE)
+        if 'salud' not in {fila[1] for fila in self._conexion.execute("PRAGMA table_info(dispositivos)")}:
+            # Bases creadas antes de la revisión de alcance
+            self._conexion.execute("ALTER TABLE dispositivos ADD COLUMN salud TEXT")
+        # Mapa de identidad: una fila siempre devuelve el mismo objeto mientras siga vivo
+        self._vivos = weakref.WeakValueDictionary()
+
+    def _consultar(self, sql, parametros=()):
+        with self._lock:
+            return self._conexion.execute(sql, parametros).fetchall()
+
+    def _dispositivo(self, fila):
+        nombre, tipo, ip, capa, servicios, fecha, salud = fila
+        disp = self._vivos.get(nombre.lower())
+        if disp is None:
+            disp = Dispositivo(tipo, nombre, ip, capa, json.loads(servicios), fecha, json.loads(salud) if salud else None)
+            self._vivos[nombre.lower()] = disp
+        return disp
+
+    @contextmanager
+    def transaccion(self):
+        """Agrupa varios cambios en una sola escritura (todo o nada); admite anidarse"""
+        with self._lock:
+            if self._conexion.in_transaction:
+                yield self
+                return
+            self._conexion.execute("BEGIN")
+            try:
+                yield self
+            except BaseException:
+                self._conexion.execute("ROLLBACK")
+                self._vivos.clear()
+                raise
+            self._conexion.execute("COMMIT")
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+    # Acceso tipo lista para el menú
+    def __len__(self):
+        return self._consultar("SELECT count(*) FROM dispositivos")[0][0]
+
+    def __iter__(self, tanda=1000):
+        # Se lee por tandas para no cargar toda la tabla
+        ultimo = 0
+        while True:
+            filas = self._consultar(f"SELECT id, {self.COLUMNAS} FROM dispositivos WHERE id > ? ORDER BY id LIMIT ?", (ultimo, tanda))
+            if not filas:
+                return
+            for fila in filas:
+                yield self._dispositivo(fila[1:])
+            ultimo = filas[-1][0]
+
+    def __contains__(self, disp):
+        return self.buscar_por_nombre(disp.nombre) is disp
+
+    def __getitem__(self, posicion):
+        if isinstance(posicion, slice):
+            inicio, fin, _ = posicion.indices(len(self))
+            filas = self._consultar(f"SELECT {self.COLUMNAS} FROM dispositivos ORDER BY id LIMIT ? OFFSET ?", (max(0, fin - inicio), inicio))
+            return [self._dispositivo(fila) for fila in filas]
+        if posicion < 0:
+            posicion += len(self)
+        filas = self._consultar(f"SELECT {self.COLUMNAS} FROM dispositivos ORDER BY id LIMIT 1 OFFSET ?", (posicion,))
+        if not filas:
+            raise IndexError(posicion)
+        return self._dispositivo(filas[0])
+
+    # Consultas resueltas por la base
+    def ips(self):
+        return [fila[0] for fila in self._consultar("SELECT ip FROM dispositivos WHERE ip IS NOT NULL")]
+
+    def buscar_por_ip(self, ip):
+        filas = self._consultar(f"SELECT {self.COLUMNAS} FROM dispositivos WHERE ip = ?", (ip,))
+        return self._dispositivo(filas[0]) if filas else None
+
+    def buscar_por_nombre(self, nombre):
+        filas = self._consultar(f"SELECT {self.COLUMNAS} FROM dispositivos WHERE lower(nombre) = lower(?)", (nombre,))
+        return self._dispositivo(filas[0]) if filas else None
+
+    def buscar_texto(self, texto):
+        patron = '%' + texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        filas = self._consultar(f"SELECT {self.COLUMNAS} FROM dispositivos WHERE nombre LIKE ? ESCAPE '\\' ORDER BY id", (patron,))
+        return [self._dispositivo(fila) for fila in filas]
+
+    def _claves_nombres(self):
+        return [fila[0] for fila in self._consultar("SELECT lower(nombre) FROM dispositivos")]
+
+    def filtrar(self, tipo=None, capa=None, servicio=None, salud=None):
+        condiciones, parametros = [], []
+        if tipo:
+            condiciones.append("tipo = ?")
+            parametros.append(normalizar_catalogo(TIPOS_DISPOSITIVO, tipo))
+        if capa:
+            condiciones.append("capa = ?")
+            parametros.append(normalizar_catalogo(CAPAS_RED, capa))
+        if servicio:
+            condiciones.append("id IN (SELECT dispositivo_id FROM servicios WHERE servicio = ?)")
+            parametros.append(normalizar_catalogo(SERVICIOS_VALIDOS, servicio))
+        if salud:
+            condiciones.append("coalesce(json_extract(salud, '$.estado'), ?) = ?")
+            parametros.extend([SALUD_SIN_REVISAR, salud])
+        donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        filas = self._consultar(f"SELECT {self.COLUMNAS} FROM dispositivos {donde} ORDER BY id", parametros)
+        return [self._dispositivo(fila) for fila in filas]
+
+    # Modificaciones
+    def _guardar_servicios(self, disp):
+        self._conexion.execute("UPDATE dispositivos SET servicios = ?, ultima_modificacion = ? WHERE lower(nombre) = lower(?)",
+                               (json.dumps(disp.servicios), disp.ultima_modificacion, disp.nombre))
+
+    def agregar(self, disp):
+        with self._lock:
+            propietario = self.buscar_por_ip(disp.ip) if disp.ip else None
+            if propietario is not None:
+                raise ValueError(f"La IP {disp.ip} ya está en uso por el dispositivo: {propietario.nombre}")
+            if self.buscar_por_nombre(disp.nombre) is not None:
+                raise ValueError(f"El nombre '{disp.nombre}' ya está en uso por otro dispositivo")
+            
+            cursor = self._conexion.execute(
+                "INSERT INTO dispositivos (nombre, tipo, ip, capa, servicios, ultima_modificacion, salud) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (disp.nombre, disp.tipo, disp.ip, disp.capa, json.dumps(disp.servicios), disp.ultima_modificacion,
+                 json.dumps(disp.salud) if disp.salud else None))
+            self._conexion.executemany("INSERT INTO servicios (dispositivo_id, servicio) VALUES (?, ?)",
+                                       [(cursor.lastrowid, servicio) for servicio in disp.servicios])
+            self._vivos[disp.nombre.lower()] = disp
+        self._cambio('agregar', disp)
+        return disp
+
+    def agregar_lote(self, dispositivos):
+        """Inserta muchos dispositivos en una única transacción"""
+        with self.transaccion():
+            for disp in dispositivos:
+                self.agregar(disp)
+
+    def cambiar_ip(self, disp, nueva_ip):
+        nueva_ip = nueva_ip or None
+        with self._lock:
+            propietario = self.buscar_por_ip(nueva_ip) if nueva_ip else None
+            if propietario is not None and propietario is not disp:
+                raise ValueError(f"La IP {nueva_ip} ya está en uso por el dispositivo: {propietario.nombre}")
+            anterior = disp.ip
+            disp.ip = nueva_ip
+            disp.tocar()
+            self._conexion.execute("UPDATE dispositivos SET ip = ?, ultima_modificacion = ? WHERE lower(nombre) = lower(?)",
+                                   (nueva_ip, disp.ultima_modificacion, disp.nombre))
+        self._cambio('ip', disp, anterior=anterior)
+
+    def agregar_servicio(self, disp, servicio):
+        with self._lock:
+            disp.servicios.append(servicio)
+            disp.tocar()
+            self._guardar_servicios(disp)
+            self._conexion.execute("INSERT INTO servicios (dispositivo_id, servicio) "
+                                   "SELECT id, ? FROM dispositivos WHERE lower(nombre) = lower(?)", (servicio, disp.nombre))
+        self._cambio('servicio', disp, servicio=servicio)
+
+    def quitar_servicio(self, disp, servicio):
+        with self._lock:
+            if servicio not in disp.servicios:
+                raise ValueError(f"'{disp.nombre}' no tiene el servicio {servicio}")
+            disp.servicios.remove(servicio)
+            disp.tocar()
+            self._guardar_servicios(disp)
+            self._conexion.execute("DELETE FROM servicios WHERE rowid = (SELECT rowid FROM servicios WHERE servicio = ? AND dispositivo_id = "
+                                   "(SELECT id FROM dispositivos WHERE lower(nombre) = lower(?)) LIMIT 1)", (servicio, disp.nombre))
+        self._cambio('quitar_servicio', disp, servicio=servicio)
+
+    def cambiar_capa(self, disp, capa):
+        capa = capa or None
+        with self._lock:
+            anterior = disp.capa
+            disp.capa = capa
+            disp.tocar()
+            self._conexion.execute("UPDATE dispositivos SET capa = ?, ultima_modificacion = ? WHERE lower(nombre) = lower(?)",
+                                   (capa, disp.ultima_modificacion, disp.nombre))
+        self._cambio('capa', disp, anterior=anterior)
+
+    def renombrar(self, disp, nuevo_nombre):
+        with self._lock:
+            propietario = self.buscar_por_nombre(nuevo_nombre)
+            if propietario is not None and propietario is not disp:
+                raise ValueError(f"El nombre '{nuevo_nombre}' ya está en uso por otro dispositivo")
+            anterior = disp.nombre
+            disp.nombre = nuevo_nombre
+            disp.tocar()
+            self._conexion.execute("UPDATE dispositivos SET nombre = ?, ultima_modificacion = ? WHERE lower(nombre) = lower(?)",
+                                   (nuevo_nombre, disp.ultima_modificacion, anterior))
+            self._vivos.pop(anterior.lower(), None)
+            self._vivos[nuevo_nombre.lower()] = disp
+        self._cambio('renombrar', disp, anterior=anterior)
+
+    def eliminar(self, disp):
+        with self._lock:
+            self._conexion.execute("DELETE FROM dispositivos WHERE lower(nombre) = lower(?)", (disp.nombre,))
+            self._vivos.pop(disp.nombre.lower(), None)
+        self._cambio('eliminar', disp)
+        return disp
+
+    def registrar_salud(self, disp, salud):
+        with self._lock:
+            disp.salud = salud or None
+            self._conexion.execute("UPDATE dispositivos SET salud = ? WHERE lower(nombre) = lower(?)",
+                                   (json.dumps(disp.salud) if disp.salud else None, disp.nombre))
+        self._cambio('salud', disp, salud=disp.salud)
+
+def migrar_almacen(origen, destino):
+    """Copia el inventario entre JSON, binario, SQLite y zonas (en cualquier sentido); devuelve la cantidad"""
+    if os.path.abspath(origen) == os.path.abspath(destino):
+        raise ValueError("El origen y el destino son el mismo archivo")
+    inventario = cargar_dispositivos(origen, con_diario=not es_sqlite(origen))
+    if es_sqlite(destino):
+        if os.path.exists(destino):
+            raise ValueError(f"La base {destino} ya existe; elimínela o elija otro destino")
+        base = InventarioSQLite(destino)
+        base.agregar_lote(inventario)
+        cantidad = len(base)
+        base.cerrar()
+    elif es_zonificado(destino):
+        # Cada dispositivo va a la zona cuya subred contiene su IP (las de un manifiesto existente)
+        zonas = InventarioZonas(destino)
+        for disp in inventario:
+            zonas.agregar(Dispositivo(disp.tipo, disp.nombre, disp.ip, disp.capa, disp.servicios, disp.ultima_modificacion, disp.salud))
+        zonas.guardar()
+        cantidad = len(zonas)
+    else:
+        # Se recorre el origen sin volcarlo entero a una lista
+        escribir_instantanea(destino, inventario)
+        cantidad = len(inventario)
+    # Subredes y enlaces se guardan junto a cada inventario: se copian si el destino no tiene
+    # (las zonas no cargan subredes). El origen se descarta enseguida, así que basta redirigirlos
+    copiar = [(inventario.topologia, Topologia(inventario, destino).ruta)]
+    if not es_zonificado(destino):
+        copiar.append((inventario.subredes, GestorSubredes(inventario, destino).ruta))
+    for gestor, ruta in copiar:
+        if gestor is not None and len(gestor) and not os.path.exists(ruta):
+            gestor.ruta = ruta
+            gestor.guardar()
+    inventario.cerrar()
+    return cantidad
+
+# 💾 Instantánea binaria con mmap
+EXTENSIONES_BINARIAS = ('.bin',)
+MAGIA_BINARIA = b'P1INVBIN'
+VERSION_BINARIA = 1
+# magia, versión, reservado, total, total_ips y desplazamientos de registros, ips, posiciones_ip, nombres, cadenas, metadatos
+CABECERA_BINARIA = struct.Struct('<8sHHIIQQQQQQ')
+# ip, banderas, tipo, capa, reservado, máscara de servicios y (desplazamiento, largo) de nombre, fecha y extra
+REGISTRO_BINARIO = struct.Struct('<IBBBBQIIIIII')
+CON_IP = 1
+CON_EXTRA = 2   # el registro tiene valores que no caben en los códigos (van en JSON en 'extra')
+
+def es_binario(archivo):
+    return os.path.splitext(archivo)[1].lower() in EXTENSIONES_BINARIAS
+
+def _empaquetar_ip(ip):
+    """'10.0.0.1' -> entero de 32 bits; None si no es una IPv4 en forma canónica"""
+    try:
+        empaquetada = socket.inet_aton(ip)
+    except (OSError, UnicodeError):
+        return None
+    # inet_aton también acepta '10.1' o '010.0.0.1': solo vale si vuelve a dar el mismo texto
+    if socket.inet_ntoa(empaquetada) != ip:
+        return None
+    return int.from_bytes(empaquetada, 'big')
+
+def _desempaquetar_ip(valor):
+    return f"{valor >> 24}.{(valor >> 16) & 255}.{(valor >> 8) & 255}.{valor & 255}"
+
+def _alinear(desplazamiento):
+    return (desplazamiento + 7) & ~7
+
+def _arreglo_u32(valores):
+    arreglo = array('I', valores)
+    if sys.byteorder != 'little':
+        arreglo.byteswap()
+    return arreglo.tobytes()
+
+@medir()
+def escribir_binario(archivo, dispositivos):
+    """Escribe la instantánea binaria en un temporal y la renombra, como escribir_json_atomico"""
+    # Los códigos siguen el orden de los catálogos; los valores desconocidos se agregan al final
+    tablas = {'tipos': list(TIPOS_DISPOSITIVO.values()), 'capas': list(CAPAS_RED.values()), 'servicios': list(SERVICIOS_VALIDOS.values())}
+    codigos = {nombre: {valor: i for i, valor in enumerate(tabla)} for nombre, tabla in tablas.items()}
+    
+    def codigo(tabla, valor):
+        if valor not in codigos[tabla]:
+            codigos[tabla][valor] = len(tablas[tabla])
+            tablas[tabla].append(valor)
+        return codigos[tabla][valor]
+    
+    cadenas = bytearray()
+    compartidas = {}
+    
+    def cadena(texto, compartir=False):
+        if not texto:
+            return 0, 0
+        if compartir and texto in compartidas:
+            return compartidas[texto]
+        datos = texto.encode('utf-8')
+        ubicacion = (len(cadenas), len(datos))
+        cadenas.extend(datos)
+        if compartir:
+            compartidas[texto] = ubicacion
+        return ubicacion
+    
+    canonicos = {}   # máscara -> servicios en el orden del catálogo
+    registros = bytearray()
+    indice_ips = []
+    nombres = []
+    ips_raras = {}
+    for posicion, disp in enumerate(dispositivos):
+        banderas = 0
+        extra = {}
+        ip = 0
+        if disp.ip:
+            empaquetada = _empaquetar_ip(disp.ip)
+            if empaquetada is None:
+                extra['IP'] = disp.ip
+                ips_raras[disp.ip] = posicion
+            else:
+                banderas |= CON_IP
+                ip = empaquetada
+                indice_ips.append((empaquetada, posicion))
+        capa = codigo('capas', disp.capa) + 1 if disp.capa else 0
+        mascara = 0
+        for servicio in disp.servicios:
+            mascara |= 1 << codigo('servicios', servicio)
+        if mascara not in canonicos:
+            canonicos[mascara] = [servicio for i, servicio in enumerate(tablas['servicios']) if mascara >> i & 1]
+        if disp.servicios != canonicos[mascara]:
+            # Orden distinto al del catálogo o repetidos: se guarda la lista tal cual
+            extra['SERVICIOS'] = disp.servicios
+        if disp.salud:
+            extra['SALUD'] = disp.salud
+        if extra:
+            banderas |= CON_EXTRA
+        tipo = codigo('tipos', disp.tipo)
+        if tipo > 255 or len(tablas['capas']) > 255 or len(tablas['servicios']) > 64:
+            raise ValueError("Demasiados tipos, capas o servicios distintos para el formato binario")
+        registros += REGISTRO_BINARIO.pack(ip, banderas, tipo, capa, 0, mascara, *cadena(disp.nombre),
+                                           *cadena(disp.ultima_modificacion, compartir=True),
+                                           *cadena(json.dumps(extra, ensure_ascii=False) if extra else '', compartir=True))
+        nombres.append((disp.nombre.lower(), posicion))
+    
+    total = len(nombres)
+    indice_ips.sort()
+    nombres.sort()
+    metadatos = json.dumps({**tablas, 'ips_raras': ips_raras}, ensure_ascii=False).encode('utf-8')
+    
+    desplazamiento_registros = _alinear(CABECERA_BINARIA.size)
+    desplazamiento_ips = _alinear(desplazamiento_registros + len(registros))
+    desplazamiento_posiciones = _alinear(desplazamiento_ips + 4 * len(indice_ips))
+    desplazamiento_nombres = _alinear(desplazamiento_posiciones + 4 * len(indice_ips))
+    desplazamiento_cadenas = _alinear(desplazamiento_nombres + 4 * total)
+    desplazamiento_metadatos = desplazamiento_cadenas + len(cadenas)
+    cabecera = CABECERA_BINARIA.pack(MAGIA_BINARIA, VERSION_BINARIA, 0, total, len(indice_ips), desplazamiento_registros,
+                                     desplazamiento_ips, desplazamiento_posiciones, desplazamiento_nombres,
+                                     desplazamiento_cadenas, desplazamiento_metadatos)
+    
+    temporal = archivo + '.tmp'
+    with open(temporal, 'wb') as f:
+        for desplazamiento, bloque in ((0, cabecera), (desplazamiento_registros, registros),
+                                       (desplazamiento_ips, _arreglo_u32(ip for ip, _ in indice_ips)),
+                                       (desplazamiento_posiciones, _arreglo_u32(posicion for _, posicion in indice_ips)),
+                                       (desplazamiento_nombres, _arreglo_u32(posicion for _, posicion in nombres)),
+                                       (desplazamiento_cadenas, cadenas), (desplazamiento_metadatos, metadatos)):
+            f.write(b'\0' * (desplazamiento - f.tell()))
+            f.write(bloque)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, archivo)
+
+class InstantaneaBinaria:
+    """Vista de solo lectura sobre una instantánea binaria abierta con mmap.
+
+    Contar, leer un registro por posición y buscar por IP (índice ordenado de uint32) o por
+    nombre (posiciones ordenadas por nombre) no recorren el archivo ni crean objetos de más.
+    """
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self._f = open(archivo, 'rb')
+        try:
+            self._mapa = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._mapa.size() < CABECERA_BINARIA.size:
+                raise ValueError("archivo truncado")
+        except ValueError:
+            self._f.close()
+            raise ValueError(f"'{archivo}' no es una instantánea binaria válida")
+        (magia, version, _, self.total, total_ips, self._registros, desplazamiento_ips, desplazamiento_posiciones,
+         desplazamiento_nombres, self._cadenas, desplazamiento_metadatos) = CABECERA_BINARIA.unpack_from(self._mapa, 0)
+        if magia != MAGIA_BINARIA or version != VERSION_BINARIA:
+            self.cerrar()
+            raise ValueError(f"'{archivo}' no es una instantánea binaria válida (versión {VERSION_BINARIA})")
+        metadatos = json.loads(self._mapa[desplazamiento_metadatos:].decode('utf-8'))
+        self.tipos = metadatos['tipos']
+        self.capas = metadatos['capas']
+        self.servicios = metadatos['servicios']
+        self.ips_raras = metadatos['ips_raras']
+        self._vista = memoryview(self._mapa)
+        self._ips = self._arreglo(desplazamiento_ips, total_ips)
+        self._posiciones_ip = self._arreglo(desplazamiento_posiciones, total_ips)
+        self._nombres = self._arreglo(desplazamiento_nombres, self.total)
+
+    def _arreglo(self, inicio, cantidad):
+        vista = self._vista[inicio:inicio + 4 * cantidad]
+        if sys.byteorder == 'little':
+            return vista.cast('I')
+        copia = array('I', vista.tobytes())
+        copia.byteswap()
+        return copia
+
+    def cerrar(self):
+        for nombre in ('_ips', '_posiciones_ip', '_nombres', '_vista'):
+            vista = self.__dict__.pop(nombre, None)
+            if isinstance(vista, memoryview):
+                vista.release()
+        if hasattr(self, '_mapa'):
+            self._mapa.close()
+        self._f.close()
+
+    def _cadena(self, desplazamiento, largo):
+        if not largo:
+            return None
+        inicio = self._cadenas + desplazamiento
+        return self._mapa[inicio:inicio + largo].decode('utf-8')
+
+    def campos(self, posicion):
+        return REGISTRO_BINARIO.unpack_from(self._mapa, self._registros + posicion * REGISTRO_BINARIO.size)
+
+    def nombre(self, posicion):
+        campos = self.campos(posicion)
+        return self._cadena(campos[6], campos[7])
+
+    def leer(self, posicion):
+        ip, banderas, tipo, capa, _, mascara, *ubicaciones = self.campos(posicion)
+        nombre = self._cadena(*ubicaciones[0:2])
+        fecha = self._cadena(*ubicaciones[2:4])
+        extra = json.loads(self._cadena(*ubicaciones[4:6])) if banderas & CON_EXTRA else {}
+        servicios = extra.get('SERVICIOS')
+        if servicios is None:
+            servicios = [servicio for i, servicio in enumerate(self.servicios) if mascara >> i & 1]
+        return Dispositivo(self.tipos[tipo], nombre or '', _desempaquetar_ip(ip) if banderas & CON_IP else extra.get('IP'),
+                           self.capas[capa - 1] if capa else None, servicios, fecha, extra.get('SALUD'))
+
+    def posicion_ip(self, ip):
+        empaquetada = _empaquetar_ip(ip)
+        if empaquetada is None:
+            return self.ips_raras.get(ip)
+        i = bisect.bisect_left(self._ips, empaquetada)
+        if i < len(self._ips) and self._ips[i] == empaquetada:
+            return self._posiciones_ip[i]
+        return None
+
+    def posicion_nombre(self, nombre):
+        # Búsqueda binaria sobre las posiciones ordenadas por nombre en minúsculas
+        nombre = nombre.lower()
+        bajo, alto = 0, self.total
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self.nombre(self._nombres[medio]).lower() < nombre:
+                bajo = medio + 1
+            else:
+                alto = medio
+        if bajo < self.total and self.nombre(self._nombres[bajo]).lower() == nombre:
+            return self._nombres[bajo]
+        return None
+
+    def ips(self):
+        return [_desempaquetar_ip(ip) for ip in self._ips] + list(self.ips_raras)
+
+    def filtrar(self, tipo=None, capa=None, servicio=None):
+        """Posiciones que cumplen los criterios, leyendo solo los códigos de cada registro"""
+        try:
+            codigo_tipo = self.tipos.index(tipo) if tipo else None
+            codigo_capa = self.capas.index(capa) + 1 if capa else None
+            bit = 1 << self.servicios.index(servicio) if servicio else 0
+        except ValueError:
+            return []   # valor que ningún registro usa
+        if np is not None:
+            tabla = np.frombuffer(self._mapa, dtype=np.dtype([('ip', '<u4'), ('banderas', 'u1'), ('tipo', 'u1'), ('capa', 'u1'),
+                                                               ('reservado', 'u1'), ('servicios', '<u8'), ('cadenas', '<u4', 6)]),
+                                  count=self.total, offset=self._registros)
+            filas = np.ones(self.total, dtype=bool)
+            if codigo_tipo is not None:
+                filas &= tabla['tipo'] == codigo_tipo
+            if codigo_capa is not None:
+                filas &= tabla['capa'] == codigo_capa
+            if bit:
+                filas &= (tabla['servicios'] & np.uint64(bit)) != 0
+            posiciones = np.flatnonzero(filas).tolist()
+            del tabla   # soltar la referencia al mmap antes de poder cerrarlo
+            return posiciones
+        posiciones = []
+        for posicion in range(self.total):
+            _, _, tipo_registro, capa_registro, _, mascara = self.campos(posicion)[:6]
+            if (codigo_tipo is None or tipo_registro == codigo_tipo) and (codigo_capa is None or capa_registro == codigo_capa) \
+                    and (not bit or mascara & bit):
+                posiciones.append(posicion)
+        return posiciones
+
+class InventarioBinario(Inventario):
+    """Inventario sobre una instantánea binaria: hasta el primer cambio las consultas leen el
+    mmap y solo se crean los dispositivos que se piden; al primer cambio se cargan todos en los
+    índices en memoria y el resto funciona como Inventario"""
+
+    def __init__(self, archivo):
+        super().__init__()
+        self.archivo = archivo
+        self._instantanea = InstantaneaBinaria(archivo) if os.path.exists(archivo) else None
+        # Mapa de identidad: la misma posición devuelve siempre el mismo objeto
+        self._vivos = weakref.WeakValueDictionary()
+
+    def _dispositivo(self, posicion):
+        disp = self._vivos.get(posicion)
+        if disp is None:
+            disp = self._vivos[posicion] = self._instantanea.leer(posicion)
+        return disp
+
+    def _materializar(self):
+        instantanea = self._instantanea
+        if instantanea is None:
+            return
+        registros = [self._dispositivo(posicion) for posicion in range(instantanea.total)]
+        self._instantanea = None
+        # Llenar los índices sin avisar a los oyentes: no son cambios
+        oyentes, self.oyentes = self.oyentes, []
+        try:
+            for disp in registros:
+                try:
+                    Inventario.agregar(self, disp)
+                except ValueError:
+                    pass   # duplicado dentro del archivo: queda el primero, igual que al leer JSON
+        finally:
+            self.oyentes = oyentes
+        instantanea.cerrar()
+
+    def cerrar(self):
+        super().cerrar()
+        if self._instantanea is not None:
+            self._instantanea.cerrar()
+            self._instantanea = None
+
+    # Acceso tipo lista para el menú
+    def __len__(self):
+        if self._instantanea is None:
+            return super().__len__()
+        return self._instantanea.total
+
+    def __iter__(self):
+        if self._instantanea is None:
+            return super().__iter__()
+        return (self._dispositivo(posicion) for posicion in range(self._instantanea.total))
+
+    def __contains__(self, disp):
+        if self._instantanea is None:
+            return super().__contains__(disp)
+        return self.buscar_por_nombre(disp.nombre) is disp
+
+    def __getitem__(self, posicion):
+        if self._instantanea is None:
+            return super().__getitem__(posicion)
+        if isinstance(posicion, slice):
+            return [self._dispositivo(i) for i in range(*posicion.indices(self._instantanea.total))]
+        if posicion < 0:
+            posicion += self._instantanea.total
+        if not 0 <= posicion < self._instantanea.total:
+            raise IndexError(posicion)
+        return self._dispositivo(posicion)
+
+    # Consultas resueltas sobre el mmap
+    def ips(self):
+        if self._instantanea is None:
+            return super().ips()
+        return self._instantanea.ips()
+
+    def buscar_por_ip(self, ip):
+        if self._instantanea is None:
+            return super().buscar_por_ip(ip)
+        posicion = self._instantanea.posicion_ip(ip)
+        return None if posicion is None else self._dispositivo(posicion)
+
+    def buscar_por_nombre(self, nombre):
+        if self._instantanea is None:
+            return super().buscar_por_nombre(nombre)
+        posicion = self._instantanea.posicion_nombre(nombre)
+        return None if posicion is None else self._dispositivo(posicion)
+
+    def buscar_texto(self, texto):
+        if self._instantanea is None:
+            return super().buscar_texto(texto)
+        texto = texto.lower()
+        return [self._dispositivo(posicion) for posicion in range(self._instantanea.total)
+                if texto in self._instantanea.nombre(posicion).lower()]
+
+    def _claves_nombres(self):
+        if self._instantanea is None:
+            return super()._claves_nombres()
+        return [self._instantanea.nombre(posicion).lower() for posicion in range(self._instantanea.total)]
+
+    def filtrar(self, tipo=None, capa=None, servicio=None, salud=None):
+        if self._instantanea is None:
+            return super().filtrar(tipo, capa, servicio, salud)
+        posiciones = self._instantanea.filtrar(normalizar_catalogo(TIPOS_DISPOSITIVO, tipo), normalizar_catalogo(CAPAS_RED, capa),
+                                               normalizar_catalogo(SERVICIOS_VALIDOS, servicio))
+        encontrados = [self._dispositivo(posicion) for posicion in posiciones]
+        if salud:
+            encontrados = [disp for disp in encontrados if estado_salud(disp) == salud]
+        return encontrados
+
+    # Modificaciones: antes de la primera se pasa a memoria
+    def agregar(self, disp):
+        self._materializar()
+        return super().agregar(disp)
+
+    def cambiar_ip(self, disp, nueva_ip):
+        self._materializar()
+        super().cambiar_ip(disp, nueva_ip)
+
+    def agregar_servicio(self, disp, servicio):
+        self._materializar()
+        super().agregar_servicio(disp, servicio)
+
+    def quitar_servicio(self, disp, servicio):
+        self._materializar()
+        super().quitar_servicio(disp, servicio)
+
+    def cambiar_capa(self, disp, capa):
+        self._materializar()
+        super().cambiar_capa(disp, capa)
+
+    def renombrar(self, disp, nuevo_nombre):
+        self._materializar()
+        super().renombrar(disp, nuevo_nombre)
+
+    def eliminar(self, disp):
+        self._materializar()
+        return super().eliminar(disp)
+
+    def registrar_salud(self, disp, salud):
+        self._materializar()
+        super().registrar_salud(disp, salud)
+
+def iterar_instantanea(archivo, estricto=False):
+    """Registros (diccionarios) de una instantánea JSON o binaria"""
+    if not es_binario(archivo):
+        yield from iterar_registros_json(archivo, estricto=estricto)
+        return
+    instantanea = InstantaneaBinaria(archivo)
+    try:
+        for posicion in range(instantanea.total):
+            yield dispositivo_a_dict(instantanea.leer(posicion))
+    finally:
+        instantanea.cerrar()
+
+def escribir_instantanea(archivo, dispositivos):
+    """Escribe los dispositivos en el formato que indica la extensión del archivo"""
+    if es_binario(archivo):
+        escribir_binario(archivo, dispositivos)
+    else:
+        escribir_json_atomico(archivo, (dispositivo_a_dict(disp) for disp in dispositivos))
+
+# 🗺️ Inventario particionado por zonas
+EXTENSIONES_ZONAS = ('.zonas',)
+ZONA_POR_DEFECTO = 'general'
+
+def es_zonificado(archivo):
+    return os.path.splitext(archivo.rstrip('/\\'))[1].lower() in EXTENSIONES_ZONAS
+
+class FiltroBloom:
+    """Conjunto aproximado de claves: 'no está' es seguro; 'puede estar' se equivoca ~1% de las
+    veces con 10 bits por clave y 7 funciones de hash"""
+    HASHES = 7
+
+    def __init__(self, capacidad=0, bits=None):
+        self.bits = bits if bits is not None else bytearray(max(8, (capacidad * 10 + 7) // 8))
+        self._tam = len(self.bits) * 8
+
+    @staticmethod
+    def huella(clave):
+        """Par de hashes de la clave (blake2b: estable entre procesos, a diferencia de hash());
+        se calcula una vez y sirve para consultar cualquier filtro"""
+        resumen = hashlib.blake2b(clave.encode('utf-8'), digest_size=16).digest()
+        return int.from_bytes(resumen[:8], 'little'), int.from_bytes(resumen[8:], 'little') | 1
+
+    def agregar(self, clave):
+        a, b = self.huella(clave)
+        for i in range(self.HASHES):
+            posicion = (a + i * b) % self._tam
+            self.bits[posicion >> 3] |= 1 << (posicion & 7)
+
+    def contiene(self, huella):
+        a, b = huella
+        for i in range(self.HASHES):
+            posicion = (a + i * b) % self._tam
+            if not self.bits[posicion >> 3] & (1 << (posicion & 7)):
+                return False
+        return True
+
+    def __contains__(self, clave):
+        return self.contiene(self.huella(clave))
+
+    def a_texto(self):
+        return base64.b64encode(bytes(self.bits)).decode('ascii')
+
+    @classmethod
+    def desde_texto(cls, texto):
+        return cls(bits=bytearray(base64.b64decode(texto)))
+
+def _firma_archivo(ruta):
+    if not os.path.exists(ruta):
+        return None
+    estado = os.stat(ruta)
+    return [estado.st_size, estado.st_mtime_ns]
+
+def _leer_zona(ruta):
+    # En un proceso aparte: se devuelven tuplas, que viajan más rápido que los diccionarios
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return [(r.get('TIPO', ''), r.get('NOMBRE', ''), r.get('IP'), r.get('CAPA'), separar_servicios(r.get('SERVICIOS')),
+                 r.get('ultima_modificacion'), r.get('SALUD')) for r in json.load(f)]
+
+class InventarioZonas(Inventario):
+    """Inventario repartido en una carpeta .zonas: un JSON por zona y un manifiesto pequeño.
+
+    El manifiesto guarda por zona la cantidad, sus subredes y filtros de Bloom de nombres e
+    IPs. Una búsqueda o una validación de unicidad solo abre las zonas cuyo filtro dice que la
+    clave puede estar; listar o filtrar todo carga en paralelo las que falten. Al guardar se
+    reescriben solo las zonas modificadas, y el manifiesto al final.
+    """
+
+    def __init__(self, directorio, procesos=None):
+        super().__init__()
+        self.archivo = directorio
+        self.procesos = procesos
+        self.ruta_manifiesto = os.path.join(directorio, 'manifiesto.json')
+        self.manifiesto = {}
+        self.zona_de = {}      # dispositivo -> zona, solo de las zonas cargadas
+        self._cargadas = set()
+        self._sucias = set()   # zonas cuyo archivo hay que reescribir
+        self._filtros = {}     # zona -> (filtro de nombres, filtro de IPs)
+        self._redes = []       # (red, zona) para ubicar a los dispositivos nuevos por su IP
+        if os.path.exists(self.ruta_manifiesto):
+            with open(self.ruta_manifiesto, 'r') as f:
+                self.manifiesto = json.load(f)['zonas']
+        for zona, datos in self.manifiesto.items():
+            self._preparar(zona, datos)
+            if datos.get('firma') != _firma_archivo(self.ruta_zona(zona)):
+                # El archivo cambió sin el manifiesto (corte entre ambas escrituras): no fiarse del filtro
+                self.cargar_zonas([zona])
+                self._sucias.add(zona)
+
+    def _preparar(self, zona, datos):
+        if 'nombres' in datos:
+            self._filtros[zona] = (FiltroBloom.desde_texto(datos['nombres']), FiltroBloom.desde_texto(datos['ips']))
+        else:
+            self._filtros[zona] = (FiltroBloom(), FiltroBloom())
+        for cidr in datos.get('subredes', []):
+            self._redes.append((ipaddress.ip_network(cidr), zona))
+
+    def ruta_zona(self, zona):
+        return os.path.join(self.archivo, f"{zona}.json")
+
+    def crear_zona(self, zona, subredes=()):
+        """Crea la zona (si no existe) y le asocia subredes"""
+        if not re.match(r'^[a-zA-Z0-9\-_]+$', zona):
+            raise ValueError("El nombre de la zona solo puede contener letras, números, guiones y guiones bajos")
+        redes = [ipaddress.ip_network(cidr, strict=False) for cidr in subredes]
+        for red in redes:
+            for otra, duena in self._redes:
+                if red.overlaps(otra) and duena != zona:
+                    raise ValueError(f"La subred {red} se superpone con {otra} de la zona '{duena}'")
+        datos = self.manifiesto.get(zona)
+        if datos is None:
+            datos = self.manifiesto[zona] = {'cantidad': 0, 'subredes': []}
+            self._preparar(zona, datos)
+            self._cargadas.add(zona)
+        for red in redes:
+            if str(red) not in datos['subredes']:
+                datos['subredes'].append(str(red))
+                self._redes.append((red, zona))
+        self._sucias.add(zona)
+
+    def zona_de_ip(self, ip):
+        """Zona con una subred que contiene la IP; None si ninguna la tiene"""
+        if ip:
+            direccion = ipaddress.ip_address(ip)
+            for red, zona in self._redes:
+                if direccion in red:
+                    return zona
+        return None
+
+    def zona_para(self, disp):
+        """Zona de un dispositivo nuevo: la de la subred que contiene su IP o la zona por defecto"""
+        return self.zona_de_ip(disp.ip) or ZONA_POR_DEFECTO
+
+    def cargar_zonas(self, zonas=None):
+        """Carga las zonas pedidas (o todas) que falten; varias a la vez en procesos aparte"""
+        pendientes = [zona for zona in (self.manifiesto if zonas is None else zonas) if zona in self.manifiesto and zona not in self._cargadas]
+        if not pendientes:
+            return
+        rutas = [self.ruta_zona(zona) for zona in pendientes]
+        # Con un solo núcleo los procesos solo suman el costo de pasar los registros de vuelta
+        if len(pendientes) > 1 and self.procesos != 1 and (os.cpu_count() or 1) > 1:
+            with ProcessPoolExecutor(max_workers=self.procesos) as grupo:
+                leidas = list(grupo.map(_leer_zona, rutas))
+        else:
+            leidas = [_leer_zona(ruta) for ruta in rutas]
+        # Llenar los índices sin avisar a los oyentes: no son cambios
+        oyentes, self.oyentes = self.oyentes, []
+        try:
+            for zona, filas in zip(pendientes, leidas):
+                self._cargadas.add(zona)
+                for fila in filas:
+                    disp = Dispositivo(*fila)
+                    try:
+                        Inventario.agregar(self, disp)
+                    except ValueError:
+                        continue   # duplicado: queda el primero, igual que al leer JSON
+                    self.zona_de[disp] = zona
+        finally:
+            self.oyentes = oyentes
+
+    def _cargar_posibles(self, clave, cual):
+        # Solo las zonas sin cargar cuyo filtro no descarta la clave
+        if len(self._cargadas) == len(self.manifiesto):
+            return
+        huella = FiltroBloom.huella(clave)
+        self.cargar_zonas([zona for zona, filtros in self._filtros.items() if zona not in self._cargadas and filtros[cual].contiene(huella)])
+
+    def _cambio(self, operacion, disp, **datos):
+        # Los filtros de una zona cargada no se consultan: se rehacen al guardarla
+        zona = self.zona_de.get(disp)
+        if zona is not None:
+            self._sucias.add(zona)
+            if operacion in ('agregar', 'eliminar'):
+                self.manifiesto[zona]['cantidad'] += 1 if operacion == 'agregar' else -1
+        super()._cambio(operacion, disp, **datos)
+
+    def zonas(self):
+        """(zona, cantidad, subredes, cargada) de cada zona"""
+        return [(zona, datos['cantidad'], datos['subredes'], zona in self._cargadas) for zona, datos in self.manifiesto.items()]
+
+    # Acceso tipo lista para el menú: el total sale del manifiesto, el resto necesita todo
+    def __len__(self):
+        return super().__len__() + sum(datos['cantidad'] for zona, datos in self.manifiesto.items() if zona not in self._cargadas)
+
+    def __iter__(self):
+        self.cargar_zonas()
+        return super().__iter__()
+
+    def __contains__(self, disp):
+        return disp in self.zona_de
+
+    def __getitem__(self, posicion):
+        self.cargar_zonas()
+        return super().__getitem__(posicion)
+
+    # Consultas
+    def ips(self):
+        self.cargar_zonas()
+        return super().ips()
+
+    def buscar_por_ip(self, ip):
+        encontrado = super().buscar_por_ip(ip)
+        if encontrado is None and ip:
+            self._cargar_posibles(ip, 1)
+            encontrado = super().buscar_por_ip(ip)
+        return encontrado
+
+    def buscar_por_nombre(self, nombre):
+        encontrado = super().buscar_por_nombre(nombre)
+        if encontrado is None:
+            self._cargar_posibles(nombre.lower(), 0)
+            encontrado = super().buscar_por_nombre(nombre)
+        return encontrado
+
+    def buscar_texto(self, texto):
+        self.cargar_zonas()
+        return super().buscar_texto(texto)
+
+    def _claves_nombres(self):
+        self.cargar_zonas()
+        return super()._claves_nombres()
+
+    def filtrar(self, tipo=None, capa=None, servicio=None, salud=None):
+        self.cargar_zonas()
+        return super().filtrar(tipo, capa, servicio, salud)
+
+    # Modificaciones: la unicidad entre zonas se comprueba con los filtros del manifiesto
+    def agregar(self, disp, zona=None):
+        if self.buscar_por_nombre(disp.nombre) is not None:
+            raise ValueError(f"El nombre '{disp.nombre}' ya está en uso por otro dispositivo")
+        if disp.ip:
+            propietario = self.buscar_por_ip(disp.ip)
+            if propietario is not None:
+                raise ValueError(f"La IP {disp.ip} ya está en uso por el dispositivo: {propietario.nombre}")
+        zona = zona or self.zona_para(disp)
+        if zona not in self.manifiesto:
+            self.crear_zona(zona)
+        # La zona destino se reescribirá entera: tiene que estar en memoria
+        self.cargar_zonas([zona])
+        self.zona_de[disp] = zona
+        try:
+            return super().agregar(disp)
+        except ValueError:
+            del self.zona_de[disp]
+            raise
+
+    def cambiar_ip(self, disp, nueva_ip):
+        """Si la IP nueva cae en una subred de otra zona, el dispositivo se muda a esa zona"""
+        anterior = self.zona_de.get(disp)
+        destino = self.zona_de_ip(nueva_ip)
+        mudanza = destino is not None and destino != anterior
+        if mudanza:
+            # La zona destino se reescribirá entera al guardar: tiene que estar en memoria
+            self.cargar_zonas([destino])
+        if nueva_ip:
+            self.buscar_por_ip(nueva_ip)   # trae la zona que pudiera tenerla
+        super().cambiar_ip(disp, nueva_ip)
+        if mudanza:
+            self.zona_de[disp] = destino
+            self._sucias.update((anterior, destino))
+            self.manifiesto[anterior]['cantidad'] -= 1
+            self.manifiesto[destino]['cantidad'] += 1
+
+    def renombrar(self, disp, nuevo_nombre):
+        self.buscar_por_nombre(nuevo_nombre)
+        super().renombrar(disp, nuevo_nombre)
+
+    def eliminar(self, disp):
+        super().eliminar(disp)
+        del self.zona_de[disp]
+        return disp
+
+    def guardar(self):
+        """Reescribe las zonas modificadas y después el manifiesto, cada uno de forma atómica"""
+        os.makedirs(self.archivo, exist_ok=True)
+        por_zona = {zona: [] for zona in self._sucias}
+        for disp, zona in self.zona_de.items():
+            if zona in por_zona:
+                por_zona[zona].append(disp)
+        for zona, dispositivos in por_zona.items():
+            escribir_instantanea(self.ruta_zona(zona), dispositivos)
+            # Filtros nuevos sin las claves que ya no están
+            nombres, ips = FiltroBloom(len(dispositivos)), FiltroBloom(len(dispositivos))
+            for disp in dispositivos:
+                nombres.agregar(disp.nombre.lower())
+                if disp.ip:
+                    ips.agregar(disp.ip)
+            self._filtros[zona] = (nombres, ips)
+            self.manifiesto[zona].update(cantidad=len(dispositivos), nombres=nombres.a_texto(), ips=ips.a_texto(),
+                                         firma=_firma_archivo(self.ruta_zona(zona)))
+        escribir_json_atomico(self.ruta_manifiesto, {'zonas': self.manifiesto})
+        self._sucias.clear()
+
+# 📝 Diario de cambios (write-ahead) con compactación
+def leer_diario(ruta):
+    if not os.path.exists(ruta):
+        return
+    with open(ruta, 'r') as f:
+        for linea in f:
+            try:
+                yield json.loads(linea)
+            except json.JSONDecodeError:
+                # Línea incompleta por un corte a mitad de escritura
+                continue
+
+def _anexar_diario(origen, destino):
+    with open(origen, 'rb') as f:
+        datos = f.read()
+    with open(destino, 'ab+') as f:
+        # Una última línea cortada no se puede pegar a la primera entrada anexada
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                datos = b'\n' + datos
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+
+def aplicar_entrada_diario(inventario, entrada):
+    """Reaplica una entrada del diario; repetirla no cambia el resultado"""
+    operacion = entrada.get('op')
+    if operacion == 'agregar':
+        agregar_registros(inventario, [entrada['registro']], avisar=False)
+        return
+    
+    disp = inventario.buscar_por_nombre(entrada.get('nombre', ''))
+    if disp is None:
+        return
+    try:
+        if operacion == 'ip':
+            inventario.cambiar_ip(disp, entrada.get('ip'))
+        elif operacion == 'servicio':
+            if entrada['servicio'] not in disp.servicios:
+                inventario.agregar_servicio(disp, entrada['servicio'])
+        elif operacion == 'quitar_servicio':
+            if entrada['servicio'] in disp.servicios:
+                inventario.quitar_servicio(disp, entrada['servicio'])
+        elif operacion == 'capa':
+            inventario.cambiar_capa(disp, entrada.get('capa'))
+        elif operacion == 'salud':
+            inventario.registrar_salud(disp, entrada.get('salud'))
+        elif operacion == 'renombrar':
+            inventario.renombrar(disp, entrada['nuevo'])
+        elif operacion == 'eliminar':
+            inventario.eliminar(disp)
+            return
+    except ValueError:
+        return
+    disp.ultima_modificacion = entrada.get('fecha', disp.ultima_modificacion)
+
+class Diario:
+    """Anexa una línea por cambio junto a dispositivos.json y la pliega en segundo plano"""
+
+    def __init__(self, archivo='dispositivos.json', umbral_compactacion=500):
+        self.archivo = archivo
+        self.ruta = archivo + '.diario'
+        self.ruta_compactando = archivo + '.diario.compactando'
+        self.umbral_compactacion = umbral_compactacion
+        self.entradas = sum(1 for _ in leer_diario(self.ruta))
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._f = None
+        self._agrupando = 0
+        self._sin_grupos = threading.Condition(self._lock)   # avisa al cerrarse el grupo exterior
+        self._plegando = threading.Lock()
+        self.error = None   # fallo del último plegado en segundo plano
+        self.al_escribir = None   # función(firma_antes, firma, huellas) tras cada instantánea propia
+
+    def __call__(self, operacion, disp, datos):
+        entrada = {'op': operacion, 'nombre': disp.nombre, 'fecha': disp.ultima_modificacion}
+        if operacion == 'agregar':
+            entrada = {'op': operacion, 'registro': dispositivo_a_dict(disp)}
+        elif operacion == 'ip':
+            entrada['ip'] = disp.ip
+        elif operacion in ('servicio', 'quitar_servicio'):
+            entrada['servicio'] = datos['servicio']
+        elif operacion == 'capa':
+            entrada['capa'] = disp.capa
+        elif operacion == 'salud':
+            entrada['salud'] = datos['salud']
+        elif operacion == 'renombrar':
+            entrada['nombre'] = datos['anterior']
+            entrada['nuevo'] = disp.nombre
+        self.registrar(entrada)
+
+    def registrar(self, entrada):
+        with self._lock:
+            if self._f is None:
+                self._f = open(self.ruta, 'a')
+            self._f.write(json.dumps(entrada) + '\n')
+            self.entradas += 1
+            if self._agrupando:
+                return
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            compactar = self.entradas >= self.umbral_compactacion
+        if compactar:
+            self.compactar()
+
+    @contextmanager
+    def agrupado(self):
+        """Muchos cambios seguidos con un único fsync (y a lo sumo un plegado) al terminar"""
+        with self._lock:
+            self._agrupando += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._agrupando -= 1
+                if not self._agrupando:
+                    # Despierta al plegado (el del guardado automático) que esperaba al grupo
+                    self._sin_grupos.notify_all()
+                pendiente = not self._agrupando and self._f is not None
+                if pendiente:
+                    self._f.flush()
+                    os.fsync(self._f.fileno())
+                compactar = pendiente and self.entradas >= self.umbral_compactacion
+            if compactar:
+                self.compactar()
+
+    def reproducir(self, inventario):
+        # Primero un plegado interrumpido y luego el diario actual
+        for ruta in (self.ruta_compactando, self.ruta):
+            for entrada in leer_diario(ruta):
+                aplicar_entrada_diario(inventario, entrada)
+        return inventario
+
+    def compactar(self, esperar=False):
+        """Pliega el diario en una instantánea nueva de dispositivos.json.
+        Esperando, un fallo del plegado se relanza aquí"""
+        # Un solo plegado a la vez aunque lo pidan el umbral y el guardado automático juntos
+        if not self._plegando.acquire(blocking=esperar):
+            return
+        try:
+            if self._hilo is not None and self._hilo.is_alive():
+                if not esperar:
+                    return
+                self._hilo.join()
+            
+            with self._lock:
+                # Un grupo abierto está a medio aplicar: no se rota hasta que se cierre. Sin
+                # esperar basta con salir, porque el cierre del grupo vuelve a mirar el umbral
+                if self._agrupando and not esperar:
+                    return
+                while self._agrupando:
+                    self._sin_grupos.wait()
+                # Rotar el diario: los cambios nuevos siguen anexándose mientras se pliega
+                if self._f is not None:
+                    self._f.close()
+                    self._f = None
+                if os.path.exists(self.ruta):
+                    if os.path.exists(self.ruta_compactando):
+                        # Quedó un plegado interrumpido: el diario actual va detrás del rotado,
+                        # que es el orden en que se reproducen. Si se corta antes de borrarlo, las
+                        # entradas repetidas al final no cambian el resultado
+                        _anexar_diario(self.ruta, self.ruta_compactando)
+                        os.remove(self.ruta)
+                    else:
+                        os.replace(self.ruta, self.ruta_compactando)
+                self.entradas = 0
+            
+            self._hilo = threading.Thread(target=self._plegar, daemon=True)
+            self._hilo.start()
+            if esperar:
+                self._hilo.join()
+        finally:
+            self._plegando.release()
+        if esperar and self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _plegar(self):
+        # Se trabaja sobre los archivos, no sobre el inventario en memoria. Si falla, el
+        # diario rotado queda en su lugar y el próximo plegado lo retoma
+        try:
+            while True:
+                firma = _firma_archivo(self.archivo)
+                inventario = Inventario()
+                if os.path.exists(self.archivo):
+                    # Estricto: un archivo a medio escribir por otro no se pliega como si estuviera vacío
+                    agregar_registros(inventario, iterar_instantanea(self.archivo, estricto=True), avisar=False)
+                for entrada in leer_diario(self.ruta_compactando):
+                    aplicar_entrada_diario(inventario, entrada)
+                if _firma_archivo(self.archivo) == firma:
+                    break
+                # Alguien escribió el archivo mientras se leía: se relee para no pisar su cambio
+            escribir_instantanea(self.archivo, inventario)
+            self._escrita(firma, inventario)
+            if os.path.exists(self.ruta_compactando):
+                os.remove(self.ruta_compactando)
+        except Exception as e:
+            self.error = e
+
+    def guardar_instantanea(self, inventario):
+        """Escribe el inventario en memoria como instantánea y vacía el diario"""
+        if self._hilo is not None:
+            self._hilo.join()
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+            firma = _firma_archivo(self.archivo)
+            escribir_instantanea(self.archivo, inventario)
+            self._escrita(firma, inventario)
+            for ruta in (self.ruta, self.ruta_compactando):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            self.entradas = 0
+
+    def _escrita(self, firma_antes, inventario):
+        # Avisar qué quedó escrito, para no confundir la escritura propia con una ajena
+        if self.al_escribir is not None:
+            self.al_escribir(firma_antes, _firma_archivo(self.archivo),
+                             {clave: huella_dispositivo(disp) for clave, disp in inventario.por_nombre.items()})
+
+    def descartar(self):
+        """Borra los cambios aún no plegados (salir sin guardar)"""
+        if self._hilo is not None:
+            self._hilo.join()
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+            if os.path.exists(self.ruta):
+                os.remove(self.ruta)
+            self.entradas = 0
+
+    def cerrar(self):
+        if self._hilo is not None:
+            self._hilo.join()
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+@contextmanager
+def agrupar_cambios(inventario):
+    """Agrupa muchos cambios seguidos en una sola escritura durable"""
+    if isinstance(inventario, InventarioSQLite):
+        with inventario.transaccion():
+            yield inventario
+    elif inventario.diario is not None:
+        with inventario.diario.agrupado():
+            yield inventario
+    else:
+        yield inventario
+
+# 👀 Cambios hechos en el archivo desde fuera de la sesión
+def huella_dispositivo(disp):
+    """Hash del contenido de un registro; solo se compara dentro del mismo proceso"""
+    salud = json.dumps(disp.salud, sort_keys=True) if disp.salud else None
+    return hash((disp.tipo, disp.nombre, disp.ip, disp.capa, tuple(disp.servicios), disp.ultima_modificacion, salud))
+
+class Vigilante:
+    """Detecta lo que otro proceso o una persona cambió en la instantánea mientras la sesión sigue
+    abierta y lo trae a memoria registro por registro, sin volver a cargar el inventario.
+
+    Guarda la firma (tamaño y fecha) del archivo y la huella de cada registro tal como estaba en
+    él. Si la firma cambia, se recorre el archivo y solo los registros con otra huella se comparan
+    con la memoria: cambiados solo afuera se aplican; cambiados también en la sesión son un
+    conflicto que decide quien llama. Las instantáneas que escribe el propio diario se adoptan
+    sin recorrer nada.
+    """
+
+    def __init__(self, inventario, archivo, firma, base=None):
+        self.inventario = inventario
+        self.archivo = archivo
+        self.firma = firma
+        self.base = base   # clave -> huella del registro en el archivo; None mientras se calcula
+        self._propias = []   # (firma antes, firma después, huellas) de escrituras del diario
+        self._lock = threading.Lock()
+        self._hilo = None
+        if base is None:
+            # La instantánea binaria no se lee entera al abrir: las huellas se sacan aparte
+            self._hilo = threading.Thread(target=self._calcular_base, daemon=True)
+            self._hilo.start()
+
+    def _calcular_base(self):
+        firma = self.firma
+        base = {}
+        try:
+            for registro in iterar_instantanea(self.archivo):
+                disp = dispositivo_desde_dict(registro)
+                base.setdefault(disp.nombre.lower(), huella_dispositivo(disp))
+        except (OSError, ValueError):
+            base = {}
+        if _firma_archivo(self.archivo) != firma:
+            # Cambió mientras se leía: sin referencia fiable, todo lo distinto se comparará con la memoria
+            base = {}
+        with self._lock:
+            if self.base is None:   # una escritura propia ya pudo dejar una más nueva
+                self.base = base
+
+    def adoptar(self, firma_antes, firma, huellas):
+        """Escritura propia del diario (puede llegar desde su hilo de plegado)"""
+        with self._lock:
+            if self._propias and self._propias[-1][1] == firma_antes:
+                # Encadenada con la anterior: basta con la última
+                firma_antes = self._propias.pop()[0]
+            self._propias.append((firma_antes, firma, huellas))
+
+    def _adoptar_propias(self):
+        # Una escritura propia sobre el archivo conocido pasa a ser la nueva referencia; si antes
+        # hubo una ajena se descarta y la diferencia la encuentra revisar()
+        with self._lock:
+            propias, self._propias = self._propias, []
+            for antes, despues, huellas in propias:
+                if antes == self.firma:
+                    self.firma, self.base = despues, huellas
+
+    def cambiado(self):
+        """True si el archivo cambió desde lo último conocido; solo mira tamaño y fecha"""
+        self._adoptar_propias()
+        return _firma_archivo(self.archivo) != self.firma
+
+    def revisar(self, decidir=None):
+        """Trae a memoria lo cambiado en el archivo desde fuera.
+
+        decidir(clave, local, archivo) recibe los dos registros (None si falta) de cada conflicto
+        y devuelve True para quedarse con el del archivo; sin decidir se conserva el local.
+        Devuelve {'aplicados', 'conflictos': [(clave, del archivo)], 'rechazados': [(clave, motivo)]}
+        o None si el archivo no cambió."""
+        self._adoptar_propias()
+        firma = _firma_archivo(self.archivo)
+        if firma == self.firma or firma is None:
+            return None
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+            self._adoptar_propias()
+            if self.firma == firma:
+                return None
+        
+        # Solo los registros con otra huella que la conocida
+        nuevas = {}
+        distintos = []
+        for registro in iterar_instantanea(self.archivo, estricto=True):
+            disp = dispositivo_desde_dict(registro)
+            clave = disp.nombre.lower()
+            if clave in nuevas:
+                continue   # duplicado dentro del archivo: vale el primero, igual que al cargar
+            nuevas[clave] = huella = huella_dispositivo(disp)
+            if self.base.get(clave) != huella:
+                distintos.append((clave, registro))
+        if _firma_archivo(self.archivo) != firma:
+            return None   # todavía se está escribiendo: en la próxima revisión
+        distintos.extend((clave, None) for clave in self.base if clave not in nuevas)
+        
+        # Huella actual de cada registro en memoria: distinta de la base es un cambio aún sin guardar
+        memoria = {disp.nombre.lower(): disp for disp in self.inventario}
+        locales = {clave: huella_dispositivo(disp) for clave, disp in memoria.items()}
+        pendientes = {clave for clave, huella in locales.items() if self.base.get(clave) != huella}
+        pendientes.update(clave for clave in self.base if clave not in memoria)
+        
+        cambios = []
+        tocadas = set()   # claves que el plegado del diario ya no puede reproducir por su cuenta
+        informe = {'aplicados': 0, 'conflictos': [], 'rechazados': []}
+        for clave, registro in distintos:
+            if locales.get(clave) == nuevas.get(clave):
+                continue   # la memoria ya lo tiene (por ejemplo, lo escribió esta sesión)
+            actual = dispositivo_a_dict(memoria[clave]) if clave in memoria else None
+            tocadas.add(clave)
+            if clave in pendientes:
+                # También cambió en la sesión sin guardarse todavía
+                del_archivo = bool(decidir and decidir(clave, actual, registro))
+                informe['conflictos'].append((clave, del_archivo))
+                if not del_archivo:
+                    continue
+            cambios.append((clave, actual, registro))
+        
+        # Una IP que el archivo le da a un registro y en memoria tiene otro que no cambia
+        claves = {clave for clave, _, _ in cambios}
+        for cambio in list(cambios):
+            clave, actual, registro = cambio
+            ip = registro and registro.get('IP')
+            propietario = self.inventario.buscar_por_ip(ip) if ip else None
+            if propietario is not None and propietario.nombre.lower() not in claves:
+                cambios.remove(cambio)
+                informe['rechazados'].append((clave, f"la IP {ip} la usa {propietario.nombre}"))
+                tocadas.add(propietario.nombre.lower())
+        
+        diario = self.inventario.diario
+        if cambios:
+            # Ya están en el archivo: no pasan por el diario, pero sí por los demás oyentes
+            oyentes = self.inventario.oyentes
+            self.inventario.oyentes = [oyente for oyente in oyentes if oyente is not diario]
+            try:
+                restaurar_registros(self.inventario, cambios)
+            finally:
+                self.inventario.oyentes = oyentes
+            informe['aplicados'] = len(cambios)
+        if diario is not None and tocadas:
+            # Las operaciones del diario se plegarán sobre el archivo nuevo, no sobre el que se
+            # editó (un cambio de nombre caería en el registro ajeno): cada registro tocado o con
+            # cambios locales se reemplaza entero por el de memoria, primero las bajas
+            tocadas |= pendientes
+            with diario.agrupado():
+                for clave in tocadas:
+                    diario.registrar({'op': 'eliminar', 'nombre': clave})
+                for clave in tocadas:
+                    disp = self.inventario.buscar_por_nombre(clave)
+                    if disp is not None:
+                        diario.registrar({'op': 'agregar', 'registro': dispositivo_a_dict(disp)})
+        self.firma, self.base = firma, nuevas
+        return informe
+
+def iniciar_vigilancia(inventario, archivo, firma, base=None):
+    vigilante = Vigilante(inventario, archivo, firma, base)
+    inventario.vigilante = vigilante
+    inventario.diario.al_escribir = vigilante.adoptar
+    return vigilante
+
+@medir()
+def guardar_dispositivos(dispositivos, archivo='dispositivos.json'):
+    try:
+        diario = getattr(dispositivos, 'diario', None)
+        if isinstance(dispositivos, InventarioRemoto):
+            # El servidor guarda su propio archivo
+            dispositivos.guardar()
+        elif isinstance(dispositivos, InventarioSQLite) and dispositivos.archivo == archivo:
+            # SQLite confirma cada cambio al hacerlo
+            pass
+        elif isinstance(dispositivos, InventarioZonas) and dispositivos.archivo == archivo:
+            # Solo las zonas modificadas
+            dispositivos.guardar()
+        elif es_sqlite(archivo):
+            base = InventarioSQLite(archivo)
+            with base.transaccion():
+                base._conexion.execute("DELETE FROM dispositivos")
+                for disp in dispositivos:
+                    base.agregar(disp)
+            base.cerrar()
+        elif diario is not None and diario.archivo == archivo:
+            # Los cambios ya están en el diario: basta con plegarlo
+            diario.compactar(esperar=True)
+        else:
+            escribir_instantanea(archivo, dispositivos)
+        if getattr(dispositivos, 'topologia', None) is not None:
+            dispositivos.topologia.guardar()
+        if getattr(dispositivos, 'historial', None) is not None:
+            dispositivos.historial.confirmar()
+        
+        return True
+    except Exception as e:
+        mostrar_mensaje(f"Error al guardar dispositivos: {str(e)}", "error")
+        return False
+
+class Autoguardado:
+    """Hilo que guarda poco después de cada ráfaga de cambios, sin detener la interfaz.
+
+    Los oyentes solo anotan el cambio y despiertan al hilo; este espera 'demora' segundos sin
+    cambios nuevos (o 'espera_maxima' desde el primero) y escribe todo de una vez. El guardado
+    pliega el diario desde los archivos, nunca recorre el inventario en memoria, y la
+    instantánea se escribe en un temporal que luego se renombra. Si vence la espera con un
+    grupo de cambios abierto, el plegado aguarda a que se cierre para no guardarlo a medias.
+    """
+
+    def __init__(self, diario, demora=2.0, espera_maxima=30.0):
+        self.diario = diario
+        self.demora = demora
+        self.espera_maxima = espera_maxima
+        self.guardados = 0
+        self.error = None
+        self._condicion = threading.Condition()
+        self._pendientes = 0
+        self._primero = self._ultimo = 0.0
+        self._reintento = 0.0   # tras un fallo no se insiste antes de este momento
+        self._detener = False
+        self._hilo = threading.Thread(target=self._trabajar, daemon=True)
+        self._hilo.start()
+
+    def __call__(self, operacion, disp, datos):
+        with self._condicion:
+            ahora = monotonic()
+            if not self._pendientes:
+                self._primero = ahora
+            self._pendientes += 1
+            self._ultimo = ahora
+            self._condicion.notify()
+
+    def _esperar_rafaga(self):
+        # Se llama con la condición tomada y cambios pendientes
+        while not self._detener:
+            limite = max(min(self._ultimo + self.demora, self._primero + self.espera_maxima), self._reintento)
+            restante = limite - monotonic()
+            if restante <= 0:
+                return
+            self._condicion.wait(restante)
+
+    def _trabajar(self):
+        while True:
+            with self._condicion:
+                while not self._pendientes and not self._detener:
+                    self._condicion.wait()
+                if not self._pendientes:
+                    return
+                self._esperar_rafaga()
+                cambios, self._pendientes = self._pendientes, 0
+                detener = self._detener
+            try:
+                self.diario.compactar(esperar=True)
+            except Exception as e:
+                with self._condicion:
+                    repetido = self.error is not None
+                    if not detener:
+                        # Reintentar más tarde sin perder la cuenta de lo pendiente
+                        self._pendientes += cambios
+                        self._primero = self._ultimo = monotonic()
+                        self._reintento = self._ultimo + self.espera_maxima
+                    self.error = e
+                if not repetido:
+                    avisar(f"No se pudo guardar automáticamente; se reintentará: {e}", "error")
+                if detener:
+                    return
+            else:
+                with self._condicion:
+                    recuperado = self.error is not None
+                    self.guardados += 1
+                    self.error = None
+                    self._reintento = 0.0
+                if recuperado:
+                    avisar("El guardado automático volvió a funcionar", "exito")
+
+    def vaciar(self):
+        """Escribe ya lo pendiente y termina el hilo; True si todo quedó guardado"""
+        with self._condicion:
+            self._detener = True
+            self._condicion.notify_all()
+        self._hilo.join()
+        return self.error is None
+
+def iniciar_autoguardado(inventario, demora=2.0):
+    """Guardado automático para los inventarios con diario; SQLite y el servidor ya guardan cada cambio"""
+    if getattr(inventario, 'diario', None) is None or not demora:
+        return None
+    autoguardado = Autoguardado(inventario.diario, demora)
+    inventario.oyentes.append(autoguardado)
+    return autoguardado
+
+@medir()
+def _llenar_inventario(inventario, archivo, con_diario, avisar):
+    firma = _firma_archivo(archivo)
+    problemas = []
+    if os.path.exists(archivo) and not isinstance(inventario, InventarioBinario):
+        # Cada registro entra en los índices según se lee
+        try:
+            agregar_registros(inventario, iterar_registros_json(archivo, al_truncar=problemas.append), avisar)
+        except ValueError as e:
+            if not con_diario:
+                raise
+            # Se sigue con el diario: los cambios quedan anotados y ningún plegado pisa el archivo
+            # dañado, porque lo lee en modo estricto y falla con este mismo error
+            problemas.append(str(e))
+    for problema in problemas:
+        # Lo leído hasta ahí queda cargado, pero el usuario tiene que saber que falta el resto
+        if avisar:
+            mostrar_mensaje(f"{problema}; solo se cargaron los {len(inventario)} dispositivos anteriores", "error")
+        else:
+            inventario.error_carga = f"{problema}; solo se cargaron los {len(inventario)} dispositivos anteriores"
+    
+    if con_diario:
+        # Huellas de lo leído, antes del diario, para notar después lo que cambie otro
+        base = None
+        if not isinstance(inventario, InventarioBinario):
+            base = {clave: huella_dispositivo(disp) for clave, disp in inventario.por_nombre.items()}
+        # Reaplicar los cambios registrados después de la última instantánea
+        diario = Diario(archivo)
+        diario.reproducir(inventario)
+        inventario.oyentes.append(diario)
+        inventario.diario = diario
+        cargar_subredes(inventario, archivo)
+        cargar_topologia(inventario, archivo)
+        cargar_historial(inventario, archivo)
+        iniciar_vigilancia(inventario, archivo, firma, base)
+
+@medir()
+def cargar_dispositivos(archivo='dispositivos.json', con_diario=True, en_segundo_plano=False):
+    if es_sqlite(archivo):
+        # Nada que leer por adelantado: las consultas van directo a la base
+        inventario = InventarioSQLite(archivo)
+        cargar_subredes(inventario, archivo)
+        cargar_topologia(inventario, archivo)
+        cargar_historial(inventario, archivo)
+        return inventario
+    
+    if es_zonificado(archivo):
+        # Solo el manifiesto: cada zona se lee cuando algo la necesita. Sin subredes ni
+        # historial, que recorren el inventario entero al engancharse
+        inventario = InventarioZonas(archivo)
+        cargar_topologia(inventario, archivo)
+        return inventario
+    
+    if es_binario(archivo):
+        # Abrir el mmap es inmediato: no hace falta cargar en segundo plano
+        try:
+            inventario = InventarioBinario(archivo)
+        except (ValueError, OSError) as e:
+            mostrar_mensaje(f"Error al cargar dispositivos: {str(e)}", "error")
+            return Inventario()
+        _llenar_inventario(inventario, archivo, con_diario, avisar=True)
+        return inventario
+    
+    inventario = Inventario()
+    if en_segundo_plano:
+        # Devolver enseguida; el menú llama a esperar_carga() antes de usar los datos
+        def cargar():
+            try:
+                _llenar_inventario(inventario, archivo, con_diario, avisar=False)
+            except Exception as e:
+                inventario.error_carga = str(e)
+            finally:
+                inventario._cargado.set()
+        
+        inventario._cargado.clear()
+        threading.Thread(target=cargar, daemon=True).start()
+        return inventario
+    
+    try:
+        _llenar_inventario(inventario, archivo, con_diario, avisar=True)
+    except Exception as e:
+        mostrar_mensaje(f"Error al cargar dispositivos: {str(e)}", "error")
+    return inventario
+
+def obtener_ips_dispositivos(dispositivos):
+    """Obtiene todas las IPs de los dispositivos existentes"""
+    return [disp.ip for disp in dispositivos if disp.ip]
+
+# Códigos de error de IP, en el mismo orden en que validar_ip aplica las reglas
+(IP_VALIDA, IP_EN_USO, IP_FORMATO, IP_OCTETO, IP_CERO, IP_LOOPBACK,
+ IP_MULTICAST, IP_FUTURO, IP_BROADCAST, IP_ULTIMO_255) = range(10)
+
+MENSAJES_ERROR_IP = {
+    IP_FORMATO: "Formato incorrecto. Debe ser X.X.X.X donde X es un número (0-255)",
+    IP_CERO: "El primer octeto no puede ser 0 (reservado)",
+    IP_LOOPBACK: "Las IPs 127.x.x.x están reservadas para loopback",
+    IP_MULTICAST: "Las IPs 224.x.x.x a 239.x.x.x están reservadas para multicast",
+    IP_FUTURO: "Las IPs 240.x.x.x y superiores están reservadas para uso futuro",
+    IP_BROADCAST: "Esta IP está reservada para broadcast limitado",
+    IP_ULTIMO_255: "El último octeto no puede ser 255 (reservado para broadcast)"
+}
+
+def codigo_error_ip(ip):
+    """Reglas de formato y rangos especiales; devuelve IP_VALIDA o el código del error"""
+    # Verificación básica de formato
+    if not re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', ip):
+        return IP_FORMATO
+    
+    octetos = ip.split('.')
+    if any(int(octeto) > 255 for octeto in octetos):
+        return IP_OCTETO
+    
+    # Verificación de rangos especiales
+    primer_octeto = int(octetos[0])
+    if primer_octeto == 0:
+        return IP_CERO
+    if primer_octeto == 127:
+        return IP_LOOPBACK
+    if primer_octeto >= 224:
+        return IP_MULTICAST if primer_octeto < 240 else IP_FUTURO
+    
+    # Verificación de direcciones especiales
+    if ip == "255.255.255.255":
+        return IP_BROADCAST
+    if octetos[3] == "255":
+        return IP_ULTIMO_255
+    return IP_VALIDA
+
+def mensaje_error_ip(codigo, ip, dispositivos=None):
+    if codigo == IP_EN_USO:
+        propietario = dispositivos.buscar_por_ip(ip) if dispositivos is not None else None
+        nombre = propietario.nombre if propietario is not None and propietario.nombre else "dispositivo desconocido"
+        return f"La IP {ip} ya está en uso por el dispositivo: {nombre}"
+    if codigo == IP_OCTETO:
+        octeto = next(octeto for octeto in ip.split('.') if int(octeto) > 255)
+        return f"'{octeto}' no es un número válido para un octeto de IP"
+    return MENSAJES_ERROR_IP[codigo]
+
+def verificar_ip_libre(ip, dispositivos, excluir=None):
+    propietario = dispositivos.buscar_por_ip(ip)
+    if propietario is not None and propietario is not excluir:
+        raise ValueError(mensaje_error_ip(IP_EN_USO, ip, dispositivos))
+
+@medir()
+def validar_ip(ip, dispositivos, excluir=None):
+    # Verificar si la IP ya está en uso
+    verificar_ip_libre(ip, dispositivos, excluir)
+    
+    codigo = codigo_error_ip(ip)
+    if codigo != IP_VALIDA:
+        raise ValueError(mensaje_error_ip(codigo, ip))
+    return True
+
+# 🧮 Validación de IPs por lotes
+def analizar_ips_numpy(ips):
+    """Convierte una columna de IPs en una matriz (N, 4) de octetos sin recorrerla en Python.
+
+    Devuelve (octetos, formato_ok, cadenas); las filas que no son ASCII imprimible
+    quedan marcadas con formato_ok=False y cadenas vacías para revisarlas aparte.
+    """
+    n = len(ips)
+    limpias = [ip if len(ip) <= 15 and ip.isascii() and ip.isprintable() else '' for ip in ips]
+    cadenas = np.array(limpias, dtype='S15')
+    caracteres = cadenas.view(np.uint8).reshape(n, 15)
+    
+    digito = (caracteres >= ord('0')) & (caracteres <= ord('9'))
+    punto = caracteres == ord('.')
+    relleno = caracteres == 0
+    formato_ok = (digito | punto | relleno).all(axis=1)
+    formato_ok &= (np.maximum.accumulate(relleno, axis=1) == relleno).all(axis=1)
+    formato_ok &= punto.sum(axis=1) == 3
+    
+    # Acumular cada cifra en el octeto que le corresponde según los puntos previos
+    segmento = np.minimum(np.cumsum(punto, axis=1), 3)
+    octetos = np.zeros((n, 4), dtype=np.int64)
+    cifras = np.zeros((n, 4), dtype=np.int64)
+    for columna in range(15):
+        filas = np.nonzero(digito[:, columna])[0]
+        seg = segmento[filas, columna]
+        octetos[filas, seg] = octetos[filas, seg] * 10 + (caracteres[filas, columna] - ord('0'))
+        cifras[filas, seg] += 1
+    formato_ok &= ((cifras >= 1) & (cifras <= 3)).all(axis=1)
+    return octetos, formato_ok, cadenas
+
+def empaquetar_ips(octetos):
+    return ((octetos[:, 0] << 24) | (octetos[:, 1] << 16) | (octetos[:, 2] << 8) | octetos[:, 3]).astype(np.uint32)
+
+@medir()
+def validar_ips_lote(ips, dispositivos=None):
+    """Valida una columna de IPs de una vez.
+
+    Devuelve (codigos, duplicadas): un código IP_* por fila y el conjunto de IPs
+    repetidas dentro de la columna. mensaje_error_ip() da el mismo texto que validar_ip.
+    """
+    ips = list(ips)
+    if np is None:
+        codigos = [codigo_error_ip(ip) for ip in ips]
+        conteo = {}
+        for ip, codigo in zip(ips, codigos):
+            if codigo == IP_VALIDA:
+                conteo[ip] = conteo.get(ip, 0) + 1
+        duplicadas = {ip for ip, veces in conteo.items() if veces > 1}
+    else:
+        octetos, formato_ok, cadenas = analizar_ips_numpy(ips)
+        codigos = np.where(formato_ok, IP_VALIDA, IP_FORMATO).astype(np.uint8)
+        pendiente = formato_ok.copy()
+        primero = octetos[:, 0]
+        reglas = (
+            ((octetos > 255).any(axis=1), IP_OCTETO),
+            (primero == 0, IP_CERO),
+            (primero == 127, IP_LOOPBACK),
+            ((primero >= 224) & (primero < 240), IP_MULTICAST),
+            (primero >= 240, IP_FUTURO),
+            ((octetos == 255).all(axis=1), IP_BROADCAST),
+            (octetos[:, 3] == 255, IP_ULTIMO_255)
+        )
+        for mascara, codigo in reglas:
+            aplica = pendiente & mascara
+            codigos[aplica] = codigo
+            pendiente &= ~aplica
+        
+        # Filas con caracteres no ASCII o de control: mismas reglas, de a una
+        raras = [i for i in np.nonzero(cadenas == b'')[0] if ips[i]]
+        for i in raras:
+            codigos[i] = codigo_error_ip(ips[i])
+        
+        validas = cadenas[(codigos == IP_VALIDA) & (cadenas != b'')]
+        valores, veces = np.unique(validas, return_counts=True)
+        duplicadas = {valor.decode() for valor in valores[veces > 1]}
+        conteo = {}
+        for i in raras:
+            if codigos[i] == IP_VALIDA:
+                conteo[ips[i]] = conteo.get(ips[i], 0) + 1
+        duplicadas.update(ip for ip, veces_ip in conteo.items() if veces_ip > 1)
+        codigos = codigos.tolist()
+    
+    if dispositivos is not None:
+        # La IP en uso tiene prioridad, igual que en validar_ip
+        codigos = [IP_EN_USO if dispositivos.buscar_por_ip(ip) is not None else codigo for ip, codigo in zip(ips, codigos)]
+    return codigos, duplicadas
+
+def validar_formato_nombre(nombre):
+    if not re.match(r'^[a-zA-Z0-9\-\.]+$', nombre):
+        raise ValueError("El nombre solo puede contener letras, números, guiones (-) y puntos (.)")
+    if len(nombre) > 30:
+        raise ValueError("El nombre no puede exceder los 30 caracteres")
+
+@medir()
+def validar_nombre(nombre, dispositivos):
+    validar_formato_nombre(nombre)
+    
+    # Verificar que el nombre no esté en uso
+    if dispositivos.buscar_por_nombre(nombre) is not None:
+        raise ValueError(f"El nombre '{nombre}' ya está en uso por otro dispositivo")
+    
+    return True
+
+@medir()
+def validar_servicios(servicios):
+    for servicio in servicios:
+        if servicio not in SERVICIOS_VALIDOS.values():
+            raise ValueError(f"Servicio inválido: {servicio}")
+    return True
+
+def campos_segun_tipo(tipo, capa=None, servicios=(), estricto=True):
+    """Comprueba que el tipo admite la capa y los servicios dados; devuelve (capa, servicios, avisos).
+
+    Con estricto lo que el tipo no admite es un ValueError; si no, se descarta y se explica en avisos
+    """
+    servicios = list(servicios)
+    avisos = []
+    if capa and tipo not in TIPOS_CON_CAPA:
+        if estricto:
+            raise ValueError(f"El tipo {tipo} no admite capa de red")
+        avisos.append(f"capa '{capa}' descartada: el tipo {tipo} no admite capa de red")
+        capa = None
+    if servicios and tipo not in TIPOS_CON_SERVICIOS:
+        if estricto:
+            raise ValueError(f"El tipo {tipo} no admite servicios")
+        avisos.append(f"servicios {', '.join(servicios)} descartados: el tipo {tipo} no admite servicios")
+        servicios = []
+    validar_servicios(servicios)
+    return capa, servicios, avisos
+
+# 🧩 Subredes y asignación de direcciones
+class Subred:
+    """Pool de direcciones de una red; un árbol de segmentos con los libres por tramo
+    responde 'siguiente libre' y 'N libres' en O(log n)"""
+    __slots__ = ('red', '_inicio', '_total', '_hojas', '_arbol', '_validas')
+
+    def __init__(self, cidr):
+        self.red = ipaddress.IPv4Network(cidr, strict=True)
+        if self.red.num_addresses > 2:
+            primera, ultima = int(self.red.network_address) + 1, int(self.red.broadcast_address) - 1
+        else:
+            primera, ultima = int(self.red.network_address), int(self.red.broadcast_address)
+        codigo = codigo_error_ip(str(ipaddress.IPv4Address(primera)))
+        if codigo not in (IP_VALIDA, IP_ULTIMO_255):
+            raise ValueError(f"La subred {cidr} no es utilizable: {mensaje_error_ip(codigo, str(ipaddress.IPv4Address(primera)))}")
+        if self.red.prefixlen < 12:
+            raise ValueError("La subred es demasiado grande (máximo /12)")
+        
+        self._inicio = primera
+        self._total = ultima - primera + 1
+        self._hojas = 1 << (self._total - 1).bit_length()
+        self._arbol = array('l', bytes(8 * 2 * self._hojas))
+        # Las direcciones terminadas en .255 no pasan validar_ip: nunca se ofrecen
+        validas = 0
+        for i in range(self._total):
+            if (primera + i) & 0xFF != 255:
+                self._arbol[self._hojas + i] = 1
+                validas += 1
+        self._validas = validas
+        for nodo in range(self._hojas - 1, 0, -1):
+            self._arbol[nodo] = self._arbol[2 * nodo] + self._arbol[2 * nodo + 1]
+
+    def __str__(self):
+        return str(self.red)
+
+    @property
+    def primera(self):
+        return self._inicio
+
+    @property
+    def ultima(self):
+        return self._inicio + self._total - 1
+
+    def _posicion(self, ip):
+        pos = int(ipaddress.IPv4Address(ip)) - self._inicio
+        return pos if 0 <= pos < self._total else None
+
+    def contiene(self, ip):
+        return self._posicion(ip) is not None
+
+    def _marcar(self, pos, libre):
+        nodo = self._hojas + pos
+        delta = (1 if libre else 0) - self._arbol[nodo]
+        if delta == 0:
+            return False
+        while nodo:
+            self._arbol[nodo] += delta
+            nodo //= 2
+        return True
+
+    def reservar(self, ip):
+        pos = self._posicion(ip)
+        return pos is not None and self._marcar(pos, False)
+
+    def liberar(self, ip):
+        pos = self._posicion(ip)
+        if pos is None or (self._inicio + pos) & 0xFF == 255:
+            return False
+        return self._marcar(pos, True)
+
+    def esta_libre(self, ip):
+        pos = self._posicion(ip)
+        return pos is not None and self._arbol[self._hojas + pos] == 1
+
+    def libres(self, cantidad=1):
+        """Primeras direcciones libres en orden ascendente"""
+        encontradas = []
+        pendientes = [1]
+        while pendientes and len(encontradas) < cantidad:
+            nodo = pendientes.pop()
+            if not self._arbol[nodo]:
+                continue
+            if nodo >= self._hojas:
+                encontradas.append(str(ipaddress.IPv4Address(self._inicio + nodo - self._hojas)))
+            else:
+                # Se apila primero la derecha para recorrer de menor a mayor
+                pendientes.append(2 * nodo + 1)
+                pendientes.append(2 * nodo)
+        return encontradas
+
+    def siguiente_libre(self):
+        if not self._arbol[1]:
+            return None
+        nodo = 1
+        while nodo < self._hojas:
+            nodo = 2 * nodo if self._arbol[2 * nodo] else 2 * nodo + 1
+        return str(ipaddress.IPv4Address(self._inicio + nodo - self._hojas))
+
+    def utilizacion(self):
+        """(usadas, asignables, porcentaje)"""
+        usadas = self._validas - self._arbol[1]
+        return usadas, self._validas, (100.0 * usadas / self._validas) if self._validas else 100.0
+
+class GestorSubredes:
+    """Subredes del inventario; escucha sus cambios para reservar y liberar direcciones"""
+
+    def __init__(self, inventario, archivo='dispositivos.json'):
+        self.inventario = inventario
+        self.ruta = archivo + '.subredes'
+        self._subredes = {}
+        self._rangos = []   # (primera, ultima, subred) ordenados para ubicar una IP con bisect
+
+    def __iter__(self):
+        return iter(self._subredes.values())
+
+    def __len__(self):
+        return len(self._subredes)
+
+    def obtener(self, cidr):
+        subred = self._subredes.get(str(ipaddress.IPv4Network(cidr, strict=False)))
+        if subred is None:
+            raise ValueError(f"No existe la subred {cidr}")
+        return subred
+
+    def subred_de(self, ip):
+        try:
+            valor = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return None
+        i = bisect.bisect_right(self._rangos, (valor, float('inf'))) - 1
+        if i >= 0 and self._rangos[i][0] <= valor <= self._rangos[i][1]:
+            return self._rangos[i][2]
+        return None
+
+    def agregar(self, cidr, guardar=True):
+        subred = Subred(cidr)
+        if any(subred.red.overlaps(otra.red) for otra in self._subredes.values()):
+            raise ValueError(f"La subred {cidr} se superpone con otra ya registrada")
+        self._subredes[str(subred.red)] = subred
+        bisect.insort(self._rangos, (subred.primera, subred.ultima, subred))
+        # Reservar las IPs que ya usan los dispositivos
+        for ip in self.inventario.ips():
+            if subred.contiene(ip):
+                subred.reservar(ip)
+        if guardar:
+            self.guardar()
+        return subred
+
+    def eliminar(self, cidr):
+        subred = self.obtener(cidr)
+        del self._subredes[str(subred.red)]
+        self._rangos = [rango for rango in self._rangos if rango[2] is not subred]
+        self.guardar()
+
+    def asignar(self, cidr):
+        """Siguiente IP libre de la subred (no la reserva hasta que un dispositivo la use)"""
+        ip = self.obtener(cidr).siguiente_libre()
+        if ip is None:
+            raise ValueError(f"La subred {cidr} no tiene direcciones libres")
+        return ip
+
+    def __call__(self, operacion, disp, datos):
+        if operacion == 'ip' and datos.get('anterior'):
+            subred = self.subred_de(datos['anterior'])
+            if subred is not None:
+                subred.liberar(datos['anterior'])
+        if not disp.ip:
+            return
+        subred = self.subred_de(disp.ip)
+        if subred is None:
+            return
+        if operacion == 'eliminar':
+            subred.liberar(disp.ip)
+        elif operacion in ('agregar', 'ip'):
+            subred.reservar(disp.ip)
+
+    def guardar(self):
+        escribir_json_atomico(self.ruta, [str(subred) for subred in self])
+
+def cargar_subredes(inventario, archivo='dispositivos.json'):
+    gestor = GestorSubredes(inventario, archivo)
+    ruta = gestor.ruta
+    # Antes las subredes iban en un subredes.json compartido por la carpeta: se toma como
+    # punto de partida y desde ahí cada inventario sigue con las suyas
+    compartido = os.path.join(os.path.dirname(archivo), 'subredes.json')
+    heredadas = not os.path.exists(ruta) and os.path.exists(compartido)
+    if heredadas:
+        ruta = compartido
+    if os.path.exists(ruta):
+        with open(ruta, 'r') as f:
+            for cidr in json.load(f):
+                try:
+                    gestor.agregar(cidr, guardar=False)
+                except ValueError as e:
+                    mostrar_mensaje(f"Subred omitida: {e}", "advertencia")
+    if heredadas:
+        gestor.guardar()
+    inventario.oyentes.append(gestor)
+    inventario.subredes = gestor
+    return gestor
+
+# 🕸️ Topología: enlaces entre dispositivos y consultas de dependencia
+TIPOS_ENLACE = ('uplink', 'troncal')
+# Cuanto menor el rango, más arriba en la jerarquía; los equipos sin capa cuelgan de la red
+RANGO_CAPA = {CAPAS_RED['NUCLEO']: 0, CAPAS_RED['DISTRIBUCION']: 1, CAPAS_RED['ACCESO']: 2}
+RANGO_EQUIPO_FINAL = 3
+
+def rango_capa(capa):
+    return RANGO_CAPA.get(capa, RANGO_EQUIPO_FINAL)
+
+class Topologia:
+    """Enlaces (uplinks y troncales) guardados como listas de adyacencia.
+
+    Sobre ellos se mantienen, desde un núcleo virtual del que cuelgan los equipos de núcleo, el
+    árbol de dominadores con conteos por capa de cada subárbol y un árbol BFS: radio de impacto,
+    abanico por capa y ruta al núcleo se responden sin recorrer el grafo. Cada árbol se construye
+    en la primera consulta que lo usa; después cada enlace que entra o sale solo toca los nodos
+    que cambian de dominador o de distancia.
+    """
+
+    def __init__(self, inventario, archivo='dispositivos.json'):
+        self.inventario = inventario
+        # Las zonas ya son una carpeta propia del inventario; los demás formatos, un archivo al lado
+        self.ruta = os.path.join(archivo, 'enlaces.json') if es_zonificado(archivo) else archivo + '.enlaces'
+        self._arriba = {}      # clave -> {clave del equipo del que cuelga: None}
+        self._abajo = {}       # clave -> {clave de un equipo que cuelga de él: None}
+        self._troncales = {}   # clave -> {clave del par: None}
+        self._capas = {}       # clave -> capa de los dispositivos enlazados
+        self._nombres = {}     # clave -> nombre visible
+        self._nucleos = {}     # claves enlazadas de capa núcleo: cuelgan del núcleo virtual (None)
+        # Árbol de dominadores; _idom es None mientras no se haya construido
+        self._idom = None      # clave con camino al núcleo -> su dominador inmediato
+        self._hijos = {}       # clave o None -> {clave que domina inmediatamente: None}
+        self._nivel = {}       # clave o None -> profundidad en el árbol de dominadores
+        self._debajo = {}      # clave -> {capa: dispositivos que dependen de ella}
+        # Árbol BFS de rutas más cortas hacia el núcleo; _padre es None mientras no se pida una ruta
+        self._padre = None     # clave -> paso anterior hacia el núcleo (None: el núcleo virtual)
+        self._saltos = {}      # clave o None -> saltos desde el núcleo virtual
+        self._ramas = {}       # clave o None -> {clave que sube por ella: None}
+
+    def __len__(self):
+        return sum(len(superiores) for superiores in self._arriba.values()) + sum(len(pares) for pares in self._troncales.values()) // 2
+
+    def enlaces(self, nombre=None):
+        """(origen, destino, tipo) de todos los enlaces o de los de un dispositivo"""
+        claves = [nombre.lower()] if nombre else list(self._nombres)
+        vistos = set()
+        for clave in claves:
+            for superior in self._arriba.get(clave, {}):
+                yield self._nombres[clave], self._nombres[superior], 'uplink'
+            if nombre:
+                for inferior in self._abajo.get(clave, {}):
+                    yield self._nombres[inferior], self._nombres[clave], 'uplink'
+            for par in self._troncales.get(clave, {}):
+                if nombre or (par, clave) not in vistos:
+                    vistos.add((clave, par))
+                    yield self._nombres[clave], self._nombres[par], 'troncal'
+
+    def _dispositivo(self, nombre):
+        disp = self.inventario.buscar_por_nombre(nombre)
+        if disp is None:
+            raise ValueError(f"No existe el dispositivo '{nombre}'")
+        return disp
+
+    @staticmethod
+    def problema_enlace(origen, destino, tipo):
+        """Motivo por el que el enlace rompe la jerarquía de capas, o None si es válido"""
+        if tipo == 'uplink':
+            if not destino.capa:
+                return f"'{destino.nombre}' no tiene capa de red: no se puede colgar de él"
+            if rango_capa(origen.capa) <= rango_capa(destino.capa):
+                return (f"Un uplink debe subir de capa: '{origen.nombre}' ({origen.capa or 'sin capa'}) "
+                        f"no puede colgar de '{destino.nombre}' ({destino.capa})")
+        elif tipo == 'troncal':
+            if not origen.capa or origen.capa != destino.capa:
+                return f"Una troncal une equipos de la misma capa: '{origen.nombre}' y '{destino.nombre}' no lo son"
+        else:
+            raise ValueError(f"Tipo de enlace inválido: {tipo} (opciones: {', '.join(TIPOS_ENLACE)})")
+        return None
+
+    def problemas_capas(self, nuevas):
+        """Enlaces que romperían la jerarquía si los dispositivos pasaran a las capas de 'nuevas' ({clave: capa})"""
+        def equipo(clave):
+            return Dispositivo(None, self._nombres[clave], capa=nuevas.get(clave, self._capas.get(clave)))
+        
+        problemas = []
+        revisados = set()
+        for clave in nuevas:
+            if clave not in self._nombres:
+                continue
+            for origen, destino, tipo in self.enlaces(clave):
+                origen, destino = origen.lower(), destino.lower()
+                if (frozenset((origen, destino)), tipo) in revisados:
+                    continue
+                revisados.add((frozenset((origen, destino)), tipo))
+                problema = self.problema_enlace(equipo(origen), equipo(destino), tipo)
+                if problema:
+                    problemas.append(problema)
+        return problemas
+
+    # Grafo dirigido desde el núcleo: uplinks de arriba abajo, troncales en los dos sentidos
+    def _vecinos(self, clave):
+        return list(self._arriba.get(clave, {})) + list(self._abajo.get(clave, {})) + list(self._troncales.get(clave, {}))
+
+    def _sucesores(self, clave):
+        if clave is None:
+            return list(self._nucleos)
+        return list(self._abajo.get(clave, ())) + list(self._troncales.get(clave, ()))
+
+    def _predecesores(self, clave):
+        previos = list(self._arriba.get(clave, ())) + list(self._troncales.get(clave, ()))
+        if clave in self._nucleos:
+            previos.append(None)
+        return previos
+
+    def _fijar_capa(self, clave, capa):
+        """Registra la capa de un equipo enlazado; entrar o salir del núcleo es ganar o perder la arista del núcleo virtual"""
+        nuevo = clave not in self._capas
+        anterior = self._capas.get(clave)
+        if not nuevo and capa == anterior:
+            return
+        if self._idom is not None and clave in self._idom:
+            cuentas = Counter({capa: 1})
+            cuentas[anterior] -= 1
+            self._propagar(self._idom[clave], cuentas)
+        self._capas[clave] = capa
+        era, es = not nuevo and clave in self._nucleos, rango_capa(capa) == 0
+        if es and not era:
+            self._nucleos[clave] = None
+            self._aristas_nuevas([(None, clave)])
+        elif era and not es:
+            del self._nucleos[clave]
+            self._aristas_quitadas([(None, clave)])
+
+    def _olvidar(self, clave):
+        """Un dispositivo se quedó sin enlaces: sale de la topología"""
+        if clave in self._nucleos:
+            del self._nucleos[clave]
+            self._aristas_quitadas([(None, clave)])
+        for indice in (self._arriba, self._abajo, self._troncales, self._capas, self._nombres):
+            indice.pop(clave, None)
+
+    # Modificaciones
+    def enlazar(self, origen, destino, tipo='uplink', guardar=True):
+        """uplink: 'origen' cuelga de 'destino' (capa superior); troncal: enlace entre pares de una capa"""
+        disp_origen, disp_destino = self._dispositivo(origen), self._dispositivo(destino)
+        a, b = disp_origen.nombre.lower(), disp_destino.nombre.lower()
+        if a == b:
+            raise ValueError("Un dispositivo no puede enlazarse consigo mismo")
+        if b in self._arriba.get(a, {}) or a in self._arriba.get(b, {}) or b in self._troncales.get(a, {}):
+            raise ValueError(f"'{disp_origen.nombre}' y '{disp_destino.nombre}' ya están enlazados")
+        problema = self.problema_enlace(disp_origen, disp_destino, tipo)
+        if problema:
+            raise ValueError(problema)
+        
+        for disp in (disp_origen, disp_destino):
+            self._nombres[disp.nombre.lower()] = disp.nombre
+            self._fijar_capa(disp.nombre.lower(), disp.capa)
+        if tipo == 'uplink':
+            self._arriba.setdefault(a, {})[b] = None
+            self._abajo.setdefault(b, {})[a] = None
+            self._aristas_nuevas([(b, a)])
+        else:
+            self._troncales.setdefault(a, {})[b] = None
+            self._troncales.setdefault(b, {})[a] = None
+            self._aristas_nuevas([(a, b), (b, a)])
+        if guardar:
+            self.guardar()
+
+    def desenlazar(self, origen, destino, guardar=True):
+        a, b = origen.lower(), destino.lower()
+        quitadas = []
+        for inferior, superior in ((a, b), (b, a)):
+            if superior in self._arriba.get(inferior, {}):
+                del self._arriba[inferior][superior]
+                del self._abajo[superior][inferior]
+                quitadas.append((superior, inferior))
+        if b in self._troncales.get(a, {}):
+            del self._troncales[a][b]
+            del self._troncales[b][a]
+            quitadas += [(a, b), (b, a)]
+        if not quitadas:
+            raise ValueError(f"No hay un enlace entre '{origen}' y '{destino}'")
+        self._aristas_quitadas(quitadas)
+        for clave in (a, b):
+            if not self._vecinos(clave):
+                self._olvidar(clave)
+        if guardar:
+            self.guardar()
+
+    def _cambiar_clave(self, anterior, disp):
+        """Un dispositivo enlazado cambió de nombre: se mueve en todas las estructuras"""
+        nueva = disp.nombre.lower()
+        self._nombres.pop(anterior)
+        self._nombres[nueva] = disp.nombre
+        if nueva == anterior:
+            return
+        for propio, ajeno in ((self._arriba, self._abajo), (self._abajo, self._arriba), (self._troncales, self._troncales)):
+            for vecino in propio.get(anterior, ()):
+                del ajeno[vecino][anterior]
+                ajeno[vecino][nueva] = None
+        for indice in (self._arriba, self._abajo, self._troncales, self._capas, self._nucleos):
+            if anterior in indice:
+                indice[nueva] = indice.pop(anterior)
+        arboles = [(self._hijos, self._idom, self._nivel), (self._ramas, self._padre, self._saltos)]
+        for hijos, superiores, profundidad in arboles:
+            if superiores is None:
+                continue
+            if anterior in profundidad:
+                profundidad[nueva] = profundidad.pop(anterior)
+            if anterior in superiores:
+                superior = superiores[nueva] = superiores.pop(anterior)
+                del hijos[superior][anterior]
+                hijos[superior][nueva] = None
+            for hijo in hijos.get(anterior, ()):
+                superiores[hijo] = nueva
+            if anterior in hijos:
+                hijos[nueva] = hijos.pop(anterior)
+        if self._idom is not None and anterior in self._debajo:
+            self._debajo[nueva] = self._debajo.pop(anterior)
+
+    def __call__(self, operacion, disp, datos):
+        clave = (datos['anterior'] if operacion == 'renombrar' else disp.nombre).lower()
+        if clave not in self._nombres:
+            return
+        if operacion == 'eliminar':
+            # Sin el dispositivo no quedan sus enlaces; se guardan junto con el inventario. Primero
+            # los de abajo, que pueden tener otra subida, y el uplink al final: así el equipo sale
+            # del árbol ya sin dependientes
+            for vecino in list(self._abajo.get(clave, {})) + list(self._troncales.get(clave, {})) + list(self._arriba.get(clave, {})):
+                self.desenlazar(clave, vecino, guardar=False)
+        elif operacion == 'renombrar':
+            # Se guarda ya: al reproducir el diario el dispositivo tendrá el nombre nuevo
+            self._cambiar_clave(clave, disp)
+            self.guardar()
+        elif operacion == 'capa':
+            self._fijar_capa(clave, disp.capa)
+
+    # Árbol de dominadores
+    def _preparar(self):
+        """Construye el árbol de dominadores en la primera consulta (o tras invalidarlo)"""
+        if self._idom is not None:
+            return
+        self._idom, self._hijos, self._nivel, self._debajo = {}, {None: {}}, {None: 0}, {}
+        self._recalcular(None, self._nombres)
+
+    def _preparar_rutas(self):
+        """Construye el árbol BFS en la primera ruta pedida"""
+        if self._padre is not None:
+            return
+        padre, saltos, ramas = self._padre, self._saltos, self._ramas = {}, {None: 0}, {None: {}}
+        cola = deque([None])
+        while cola:
+            clave = cola.popleft()
+            for otra in self._sucesores(clave):
+                if otra not in saltos:
+                    padre[otra] = clave
+                    saltos[otra] = saltos[clave] + 1
+                    ramas.setdefault(clave, {})[otra] = None
+                    cola.append(otra)
+
+    def _dominadores(self, raiz, region):
+        """[(clave, dominador inmediato)] de los nodos de 'region' alcanzables desde 'raiz' sin salir
+        de ella, en orden topológico del árbol. Cooper, Harvey y Kennedy sobre índices enteros"""
+        claves = [raiz]
+        claves.extend(region)
+        indice = {clave: i for i, clave in enumerate(claves)}
+        total = len(claves)
+        abajo, troncales, vacio = self._abajo, self._troncales, {}
+        sucesores = [[indice[otra] for otra in self._sucesores(raiz) if otra in indice]]
+        for clave in claves[1:]:
+            inferiores = [indice[otra] for otra in abajo.get(clave, vacio) if otra in indice]
+            pares = troncales.get(clave)
+            if pares:
+                inferiores.extend(indice[otra] for otra in pares if otra in indice)
+            sucesores.append(inferiores)
+        predecesores = [[] for _ in range(total)]
+        for i, hijos in enumerate(sucesores):
+            for hijo in hijos:
+                predecesores[hijo].append(i)
+        
+        # Postorden (DFS iterativo) desde la raíz
+        numero = [-1] * total
+        postorden = []
+        visitado = bytearray(total)
+        visitado[0] = 1
+        pila = [(0, iter(sucesores[0]))]
+        while pila:
+            i, hijos = pila[-1]
+            for hijo in hijos:
+                if not visitado[hijo]:
+                    visitado[hijo] = 1
+                    pila.append((hijo, iter(sucesores[hijo])))
+                    break
+            else:
+                pila.pop()
+                numero[i] = len(postorden)
+                postorden.append(i)
+        
+        # Dominadores inmediatos en orden postorden inverso
+        idom = [-1] * total
+        idom[0] = 0
+        orden = postorden[-2::-1]
+        cambio = True
+        while cambio:
+            cambio = False
+            for i in orden:
+                nuevo = -1
+                for previo in predecesores[i]:
+                    if idom[previo] < 0:
+                        continue
+                    if nuevo < 0:
+                        nuevo = previo
+                        continue
+                    a, b = previo, nuevo
+                    while a != b:
+                        while numero[a] < numero[b]:
+                            a = idom[a]
+                        while numero[b] < numero[a]:
+                            b = idom[b]
+                    nuevo = a
+                if idom[i] != nuevo:
+                    idom[i] = nuevo
+                    cambio = True
+        return [(claves[i], claves[idom[i]]) for i in orden]
+
+    def _subarbol(self, clave):
+        """Claves dominadas por 'clave' (sin incluirla)"""
+        resultado = []
+        pila = list(self._hijos.get(clave, ()))
+        while pila:
+            otra = pila.pop()
+            resultado.append(otra)
+            pila.extend(self._hijos.get(otra, ()))
+        return resultado
+
+    def _total(self, clave):
+        total = Counter(self._debajo.get(clave, ()))
+        total[self._capas.get(clave)] += 1
+        return total
+
+    def _propagar(self, clave, cuentas, signo=1, hasta=None):
+        # Suma 'cuentas' ({capa: n}) a 'clave' y a sus dominadores, hasta 'hasta' sin incluirlo
+        while clave != hasta:
+            debajo = self._debajo.setdefault(clave, {})
+            for capa, cantidad in cuentas.items():
+                debajo[capa] = debajo.get(capa, 0) + signo * cantidad
+            clave = self._idom[clave]
+
+    def _nca(self, a, b):
+        """Antecesor común más cercano en el árbol de dominadores"""
+        nivel, idom = self._nivel, self._idom
+        nivel_a, nivel_b = nivel[a], nivel[b]
+        while nivel_a > nivel_b:
+            a = idom[a]
+            nivel_a -= 1
+        while nivel_b > nivel_a:
+            b = idom[b]
+            nivel_b -= 1
+        while a != b:
+            a, b = idom[a], idom[b]
+        return a
+
+    def _domina(self, a, b):
+        """True si 'a' domina estrictamente a 'b' (O(profundidad))"""
+        subir = self._nivel[b] - self._nivel[a]
+        if subir <= 0:
+            return False
+        for _ in range(subir):
+            b = self._idom[b]
+        return b == a
+
+    def _recalcular(self, raiz, extra=()):
+        """Rehace el subárbol de 'raiz' junto con los nodos de 'extra', que aún no estaban en el árbol"""
+        idom, hijos, nivel, debajo = self._idom, self._hijos, self._nivel, self._debajo
+        region = self._subarbol(raiz)
+        for clave in region:
+            for indice in (idom, hijos, nivel, debajo):
+                indice.pop(clave, None)
+        region.extend(extra)
+        antes = debajo.pop(raiz, {}) if raiz is not None else {}
+        hijos[raiz] = {}
+        
+        dominados = self._dominadores(raiz, region)
+        for clave, superior in dominados:
+            idom[clave] = superior
+            if superior in hijos:
+                hijos[superior][clave] = None
+            else:
+                hijos[superior] = {clave: None}
+            nivel[clave] = nivel[superior] + 1
+        # Conteos por capa de abajo arriba
+        capas = self._capas
+        vacio = {}
+        for clave, superior in reversed(dominados):
+            if superior is not None:
+                cuentas = debajo.get(superior)
+                if cuentas is None:
+                    cuentas = debajo[superior] = {}
+                capa = capas.get(clave)
+                cuentas[capa] = cuentas.get(capa, 0) + 1
+                for capa, cantidad in debajo.get(clave, vacio).items():
+                    cuentas[capa] = cuentas.get(capa, 0) + cantidad
+        if raiz is not None:
+            despues = Counter(self._debajo.get(raiz, {}))
+            despues.subtract(antes)
+            self._propagar(self._idom[raiz], despues)
+
+    def _colgar(self, clave, nuevo):
+        """Cambia el dominador inmediato de 'clave' con todo su subárbol"""
+        anterior = self._idom[clave]
+        comun = self._nca(anterior, nuevo)
+        total = self._total(clave)
+        self._propagar(anterior, total, -1, comun)
+        self._propagar(nuevo, total, 1, comun)
+        del self._hijos[anterior][clave]
+        self._hijos.setdefault(nuevo, {})[clave] = None
+        self._idom[clave] = nuevo
+        diferencia = self._nivel[nuevo] + 1 - self._nivel[clave]
+        if diferencia:
+            for otra in [clave] + self._subarbol(clave):
+                self._nivel[otra] += diferencia
+
+    def _aristas_nuevas(self, aristas):
+        """Actualiza los árboles tras añadir las aristas dirigidas (superior, inferior) de un enlace"""
+        if self._padre is not None:
+            self._bfs_insertar(aristas)
+        if self._idom is None:
+            return
+        idom = self._idom
+        previas = [(x, y) for x, y in aristas if (x is None or x in idom) and y in idom]
+        for x, y in aristas:
+            if (x is None or x in idom) and y not in idom:
+                # 'y' y lo que cuelga de él ganan camino al núcleo, siempre a través de x -> y
+                region = [y]
+                vistos = {y}
+                for clave in region:
+                    for otra in self._sucesores(clave):
+                        if otra not in vistos and otra not in idom:
+                            vistos.add(otra)
+                            region.append(otra)
+                destinos = {otra for clave in region for otra in self._sucesores(clave) if otra in idom}
+                if destinos:
+                    # Sus enlaces hacia equipos que ya subían solo cambian lo que domina el ancestro común
+                    comun = x
+                    for otra in destinos:
+                        comun = self._nca(comun, otra)
+                    self._recalcular(comun, region)
+                else:
+                    idom[y] = x
+                    self._hijos.setdefault(x, {})[y] = None
+                    self._nivel[y] = self._nivel[x] + 1
+                    self._propagar(x, self._total(y))
+                    self._recalcular(y, region[1:])
+        self._dominadores_insertar(previas)
+
+    def _dominadores_insertar(self, aristas):
+        # Búsqueda por profundidad (Georgiadis et al.): con la arista x -> y, un nodo w pasa a colgar
+        # del ancestro común d de x e y si lo alcanza desde y un camino por nodos más profundos que
+        # su dominador actual, que a su vez está por debajo de d. Se exploran de más profundo a menos
+        semillas = []
+        comun = None
+        for x, y in aristas:
+            d = self._nca(x, y)
+            if d != y and self._idom[y] != d:
+                semillas.append(y)
+                comun = d
+        if not semillas:
+            return
+        nivel = self._nivel
+        limite = nivel[comun] + 1
+        afectados = list(semillas)
+        vistos = set(semillas)
+        cola = [(-nivel[y], y) for y in semillas]
+        heapq.heapify(cola)
+        while cola:
+            _, z = heapq.heappop(cola)
+            nivel_z = nivel[z]
+            pila = [z]
+            while pila:
+                for otra in self._sucesores(pila.pop()):
+                    if otra in vistos:
+                        continue
+                    nivel_otra = nivel[otra]
+                    if nivel_otra > nivel_z:
+                        vistos.add(otra)
+                        pila.append(otra)
+                    elif nivel_otra > limite:
+                        vistos.add(otra)
+                        afectados.append(otra)
+                        heapq.heappush(cola, (-nivel_otra, otra))
+        for clave in afectados:
+            self._colgar(clave, comun)
+
+    def _aristas_quitadas(self, aristas):
+        """Actualiza los árboles tras quitar las aristas dirigidas (superior, inferior) de un enlace"""
+        if self._padre is not None:
+            self._bfs_quitar(aristas)
+        if self._idom is not None:
+            self._dominadores_quitar(aristas)
+
+    def _dominadores_quitar(self, aristas):
+        # Sin x -> y solo pueden bajar de dominador hijos de d = nca(x, y), y solo si y colgaba de d:
+        # los alcanzables desde y sin salir del subárbol de d. Se recalculan partiendo de "sin
+        # definir" con el resto del árbol fijo, como nca de los dominadores de sus predecesores
+        idom = self._idom
+        semillas = []
+        comun = None
+        for x, y in aristas:
+            if (x is None or x in idom) and y in idom:
+                d = self._nca(x, y)
+                if d != y and idom[y] == d:
+                    semillas.append(y)
+                    comun = d
+        if not semillas:
+            return
+        candidatos = {}
+        vistos = set(semillas)
+        pila = list(semillas)
+        while pila:
+            clave = pila.pop()
+            if idom[clave] == comun:
+                candidatos[clave] = None
+            for otra in self._sucesores(clave):
+                if otra not in vistos and self._domina(comun, otra):
+                    vistos.add(otra)
+                    pila.append(otra)
+        
+        nuevos = {}
+        def cadena(clave):
+            # Dominadores de 'clave' con los candidatos ya resueltos; None si pasa por uno sin resolver
+            resultado = []
+            while clave is not None:
+                resultado.append(clave)
+                if clave in candidatos:
+                    if clave not in nuevos:
+                        return None
+                    clave = nuevos[clave]
+                else:
+                    clave = idom[clave]
+            resultado.append(None)
+            return resultado
+        
+        cambio = True
+        while cambio:
+            cambio = False
+            for clave in candidatos:
+                comunes = None
+                for previo in self._predecesores(clave):
+                    if previo is not None and previo not in idom:
+                        continue
+                    camino = cadena(previo)
+                    if camino is None:
+                        continue
+                    if comunes is None:
+                        comunes = camino
+                    else:
+                        en_camino = set(camino)
+                        comunes = next(comunes[i:] for i, otra in enumerate(comunes) if otra in en_camino)
+                if comunes is not None and (clave not in nuevos or nuevos[clave] != comunes[0]):
+                    nuevos[clave] = comunes[0]
+                    cambio = True
+        
+        # Los que no se resolvieron perdieron el camino al núcleo, con todo lo que dominaban
+        perdidos = [clave for clave in candidatos if clave not in nuevos]
+        if perdidos:
+            fuera = set()
+            for clave in perdidos:
+                fuera.add(clave)
+                fuera.update(self._subarbol(clave))
+            if any(otra not in fuera for clave in fuera for otra in self._sucesores(clave)):
+                # Sus aristas hacia equipos que siguen subiendo pueden cambiar dominadores en
+                # cualquier parte: se reconstruye el árbol en la próxima consulta
+                self._idom = None
+                return
+            for clave in perdidos:
+                self._propagar(comun, self._total(clave), -1)
+                del self._hijos[comun][clave]
+            for clave in fuera:
+                for indice in (idom, self._hijos, self._nivel, self._debajo):
+                    indice.pop(clave, None)
+        for clave, superior in nuevos.items():
+            if superior != comun:
+                self._colgar(clave, superior)
+
+    # Árbol BFS
+    def _enganchar(self, clave, padre):
+        if clave in self._padre:
+            del self._ramas[self._padre[clave]][clave]
+        self._padre[clave] = padre
+        self._saltos[clave] = self._saltos[padre] + 1
+        self._ramas.setdefault(padre, {})[clave] = None
+
+    def _bfs_insertar(self, aristas):
+        # Las distancias solo pueden bajar: se propagan desde los destinos que mejoran
+        saltos = self._saltos
+        cola = deque()
+        for x, y in aristas:
+            if x in saltos and saltos[x] + 1 < saltos.get(y, float('inf')):
+                self._enganchar(y, x)
+                cola.append(y)
+        while cola:
+            clave = cola.popleft()
+            for otra in self._sucesores(clave):
+                if saltos[clave] + 1 < saltos.get(otra, float('inf')):
+                    self._enganchar(otra, clave)
+                    cola.append(otra)
+
+    def _bfs_quitar(self, aristas):
+        # Solo cambia lo que subía por una arista quitada: se desengancha esa rama y se vuelve a
+        # colgar, de menor a mayor distancia, de los predecesores que no dependían de ella
+        region = []
+        for x, y in aristas:
+            if y in self._padre and self._padre[y] == x:
+                region.append(y)
+        for clave in region:
+            region.extend(self._ramas.get(clave, ()))
+        if not region:
+            return
+        fuera = set(region)
+        for clave in region:
+            padre = self._padre.pop(clave)
+            if padre not in fuera:
+                del self._ramas[padre][clave]
+            del self._saltos[clave]
+            self._ramas.pop(clave, None)
+        cola = []
+        orden = 0
+        for clave in region:
+            for previo in self._predecesores(clave):
+                if previo not in fuera and previo in self._saltos:
+                    orden += 1
+                    cola.append((self._saltos[previo] + 1, orden, clave, previo))
+        heapq.heapify(cola)
+        while cola:
+            _, _, clave, padre = heapq.heappop(cola)
+            if clave in self._saltos:
+                continue
+            self._enganchar(clave, padre)
+            for otra in self._sucesores(clave):
+                if otra in fuera and otra not in self._saltos:
+                    orden += 1
+                    heapq.heappush(cola, (self._saltos[clave] + 1, orden, otra, clave))
+
+    # Consultas
+    def radio_impacto(self, nombre):
+        """Dispositivos que se quedan sin camino al núcleo si 'nombre' cae"""
+        clave = self._dispositivo(nombre).nombre.lower()
+        self._preparar()
+        if clave not in self._idom:
+            return []
+        return [self._nombres[otra] for otra in self._subarbol(clave)]
+
+    def depende_de(self, nombre, de):
+        """True si 'nombre' pierde la subida cuando 'de' cae"""
+        clave, otra = nombre.lower(), de.lower()
+        if clave == otra:
+            return False
+        self._preparar()
+        if clave not in self._idom or otra not in self._idom:
+            return False
+        return self._domina(otra, clave)
+
+    def abanico(self, nombre):
+        """Por capa: equipos colgados directamente y equipos que dependen de él ({capa: (directos, dependientes)})"""
+        clave = self._dispositivo(nombre).nombre.lower()
+        resultado = {}
+        for inferior in self._abajo.get(clave, {}):
+            capa = self._capas.get(inferior)
+            directos, dependientes = resultado.get(capa, (0, 0))
+            resultado[capa] = (directos + 1, dependientes)
+        self._preparar()
+        for capa, dependientes in self._debajo.get(clave, {}).items():
+            if dependientes:
+                directos, _ = resultado.get(capa, (0, 0))
+                resultado[capa] = (directos, dependientes)
+        return resultado
+
+    def ruta_al_nucleo(self, nombre):
+        """Camino más corto (en saltos) hasta el núcleo, o None si no tiene subida"""
+        disp = self._dispositivo(nombre)
+        clave = disp.nombre.lower()
+        if clave not in self._nombres:
+            return [disp.nombre] if rango_capa(disp.capa) == 0 else None
+        self._preparar_rutas()
+        if clave not in self._padre:
+            return None
+        ruta = []
+        while clave is not None:
+            ruta.append(self._nombres[clave])
+            clave = self._padre[clave]
+        return ruta
+
+    def ruta(self, origen, destino):
+        """Camino entre dos dispositivos: por el árbol BFS si comparten antecesor y, si no, con una búsqueda"""
+        a, b = self._dispositivo(origen).nombre.lower(), self._dispositivo(destino).nombre.lower()
+        if a == b:
+            return [self._dispositivo(origen).nombre]
+        if a not in self._nombres or b not in self._nombres:
+            return None
+        self._preparar_rutas()
+        if a in self._padre and b in self._padre:
+            padre, saltos = self._padre, self._saltos
+            subida, bajada = [a], [b]
+            while saltos[subida[-1]] > saltos[bajada[-1]]:
+                subida.append(padre[subida[-1]])
+            while saltos[bajada[-1]] > saltos[subida[-1]]:
+                bajada.append(padre[bajada[-1]])
+            while subida[-1] != bajada[-1]:
+                subida.append(padre[subida[-1]])
+                bajada.append(padre[bajada[-1]])
+            if subida[-1] is not None:
+                return [self._nombres[paso] for paso in subida + bajada[-2::-1]]
+        # Núcleos distintos o tramo sin subida: búsqueda en anchura sobre los enlaces
+        previo = {a: None}
+        cola = deque([a])
+        while cola:
+            clave = cola.popleft()
+            if clave == b:
+                ruta = []
+                while clave is not None:
+                    ruta.append(self._nombres[clave])
+                    clave = previo[clave]
+                return ruta[::-1]
+            for vecino in self._vecinos(clave):
+                if vecino not in previo:
+                    previo[vecino] = clave
+                    cola.append(vecino)
+        return None
+
+    def validar(self):
+        """Problemas de la topología: enlaces que rompen la jerarquía y equipos enlazados sin subida"""
+        problemas = []
+        for origen, destino, tipo in self.enlaces():
+            disp_origen = self.inventario.buscar_por_nombre(origen)
+            disp_destino = self.inventario.buscar_por_nombre(destino)
+            problema = self.problema_enlace(disp_origen, disp_destino, tipo) if disp_origen and disp_destino else \
+                f"Enlace {origen} - {destino} con un dispositivo que ya no existe"
+            if problema:
+                problemas.append(problema)
+        self._preparar()
+        problemas.extend(f"'{nombre}' no tiene camino al núcleo" for clave, nombre in self._nombres.items() if clave not in self._idom)
+        return problemas
+
+    def guardar(self):
+        escribir_json_atomico(self.ruta, [{'origen': origen, 'destino': destino, 'tipo': tipo} for origen, destino, tipo in self.enlaces()])
+
+def cargar_topologia(inventario, archivo='dispositivos.json'):
+    topologia = Topologia(inventario, archivo)
+    ruta = topologia.ruta
+    # Como las subredes, los enlaces de antes estaban en un enlaces.json compartido por la carpeta
+    compartido = os.path.join(os.path.dirname(archivo), 'enlaces.json')
+    heredados = not es_zonificado(archivo) and not os.path.exists(ruta) and os.path.exists(compartido)
+    if heredados:
+        ruta = compartido
+    if os.path.exists(ruta):
+        with open(ruta, 'r') as f:
+            for enlace in json.load(f):
+                try:
+                    topologia.enlazar(enlace['origen'], enlace['destino'], enlace.get('tipo', 'uplink'), guardar=False)
+                except ValueError as e:
+                    mostrar_mensaje(f"Enlace omitido: {e}", "advertencia")
+    if heredados:
+        topologia.guardar()
+    inventario.oyentes.append(topologia)
+    inventario.topologia = topologia
+    return topologia
+
+# 🕰️ Historial de versiones con estructura compartida
+# Mapa persistente (HAMT): un trie de 32 ramas sobre el hash de la clave. Asignar o quitar copia
+# solo los nodos del camino (O(log32 n)); todo lo demás se comparte con la versión anterior.
+def _bits(numero):
+    return bin(numero).count('1')
+
+def _hash_clave(clave):
+    return hash(clave) & 0xFFFFFFFFFFFFFFFF
+
+class _Nodo:
+    __slots__ = ('mapa', 'hijos')
+
+    def __init__(self, mapa, hijos):
+        self.mapa = mapa     # bit i encendido si hay hijo para el fragmento i del hash
+        self.hijos = hijos   # tupla de _Nodo, _Colision u hojas (hash, clave, valor)
+
+class _Colision:
+    __slots__ = ('hash', 'pares')
+
+    def __init__(self, hash_claves, pares):
+        self.hash = hash_claves
+        self.pares = pares   # ((clave, valor), ...) de claves distintas con el mismo hash
+
+_VACIO = _Nodo(0, ())
+
+def _hash_de(hijo):
+    return hijo.hash if isinstance(hijo, _Colision) else hijo[0]
+
+def _dividir(a, b, nivel):
+    # Dos hojas con hash distinto que caen en la misma rama: bajar hasta que se separen
+    ia, ib = (_hash_de(a) >> nivel) & 31, (_hash_de(b) >> nivel) & 31
+    if ia == ib:
+        return _Nodo(1 << ia, (_dividir(a, b, nivel + 5),))
+    return _Nodo((1 << ia) | (1 << ib), (a, b) if ia < ib else (b, a))
+
+def _asignar(nodo, nivel, h, clave, valor):
+    """(nodo nuevo, True si la clave no existía); devuelve el mismo nodo si nada cambia"""
+    bit = 1 << ((h >> nivel) & 31)
+    pos = _bits(nodo.mapa & (bit - 1))
+    if not nodo.mapa & bit:
+        return _Nodo(nodo.mapa | bit, nodo.hijos[:pos] + ((h, clave, valor),) + nodo.hijos[pos:]), True
+    hijo = nodo.hijos[pos]
+    if isinstance(hijo, _Nodo):
+        nuevo, agregado = _asignar(hijo, nivel + 5, h, clave, valor)
+    elif isinstance(hijo, _Colision) and hijo.hash == h:
+        pares = tuple(par for par in hijo.pares if par[0] != clave)
+        nuevo, agregado = _Colision(h, pares + ((clave, valor),)), len(pares) == len(hijo.pares)
+    elif not isinstance(hijo, _Colision) and hijo[1] == clave:
+        if hijo[2] is valor:
+            return nodo, False
+        nuevo, agregado = (h, clave, valor), False
+    elif not isinstance(hijo, _Colision) and hijo[0] == h:
+        nuevo, agregado = _Colision(h, ((hijo[1], hijo[2]), (clave, valor))), True
+    else:
+        nuevo, agregado = _dividir(hijo, (h, clave, valor), nivel + 5), True
+    if nuevo is hijo:
+        return nodo, agregado
+    return _Nodo(nodo.mapa, nodo.hijos[:pos] + (nuevo,) + nodo.hijos[pos + 1:]), agregado
+
+def _quitar(nodo, nivel, h, clave):
+    """Nodo sin la clave (None si queda vacío); el mismo nodo si la clave no estaba"""
+    bit = 1 << ((h >> nivel) & 31)
+    if not nodo.mapa & bit:
+        return nodo
+    pos = _bits(nodo.mapa & (bit - 1))
+    hijo = nodo.hijos[pos]
+    if isinstance(hijo, _Nodo):
+        nuevo = _quitar(hijo, nivel + 5, h, clave)
+        if nuevo is hijo:
+            return nodo
+        if nuevo is not None and len(nuevo.hijos) == 1 and not isinstance(nuevo.hijos[0], _Nodo):
+            nuevo = nuevo.hijos[0]   # una sola hoja: sube al lugar del nodo
+    elif isinstance(hijo, _Colision):
+        pares = tuple(par for par in hijo.pares if par[0] != clave)
+        if hijo.hash != h or len(pares) == len(hijo.pares):
+            return nodo
+        nuevo = _Colision(h, pares) if len(pares) > 1 else (h,) + pares[0]
+    else:
+        if hijo[1] != clave:
+            return nodo
+        nuevo = None
+    if nuevo is None:
+        if nodo.mapa == bit:
+            return None
+        return _Nodo(nodo.mapa & ~bit, nodo.hijos[:pos] + nodo.hijos[pos + 1:])
+    return _Nodo(nodo.mapa, nodo.hijos[:pos] + (nuevo,) + nodo.hijos[pos + 1:])
+
+def _construir(entradas, nivel):
+    # Armado de una sola vez, sin copias de caminos: se agrupa por fragmento del hash
+    if len(entradas) == 1:
+        return entradas[0]
+    if nivel > 60:
+        return _Colision(entradas[0][0], tuple((clave, valor) for _, clave, valor in entradas))
+    grupos = {}
+    for entrada in entradas:
+        grupos.setdefault((entrada[0] >> nivel) & 31, []).append(entrada)
+    mapa = 0
+    for indice in grupos:
+        mapa |= 1 << indice
+    return _Nodo(mapa, tuple(_construir(grupos[indice], nivel + 5) for indice in sorted(grupos)))
+
+def _entradas(hijo):
+    if hijo is None:
+        return
+    if isinstance(hijo, _Nodo):
+        for nieto in hijo.hijos:
+            yield from _entradas(nieto)
+    elif isinstance(hijo, _Colision):
+        yield from hijo.pares
+    else:
+        yield hijo[1], hijo[2]
+
+def _diferencias(a, b):
+    if a is b:
+        return   # subárbol compartido: no cambió nada debajo
+    if isinstance(a, _Nodo) and isinstance(b, _Nodo):
+        pendientes = a.mapa | b.mapa
+        while pendientes:
+            bit = pendientes & -pendientes
+            pendientes ^= bit
+            hijo_a = a.hijos[_bits(a.mapa & (bit - 1))] if a.mapa & bit else None
+            hijo_b = b.hijos[_bits(b.mapa & (bit - 1))] if b.mapa & bit else None
+            yield from _diferencias(hijo_a, hijo_b)
+        return
+    antes, despues = dict(_entradas(a)), dict(_entradas(b))
+    for clave, valor in antes.items():
+        if clave not in despues:
+            yield clave, valor, None
+        elif despues[clave] is not valor and despues[clave] != valor:
+            yield clave, valor, despues[clave]
+    for clave, valor in despues.items():
+        if clave not in antes:
+            yield clave, None, valor
+
+class MapaPersistente:
+    """Diccionario inmutable: asignar() y quitar() devuelven un mapa nuevo que comparte con este
+    todos los nodos que no tocan"""
+    __slots__ = ('_raiz', '_total')
+
+    def __init__(self, raiz=_VACIO, total=0):
+        self._raiz = raiz
+        self._total = total
+
+    @classmethod
+    def desde(cls, pares):
+        entradas = [(_hash_clave(clave), clave, valor) for clave, valor in dict(pares).items()]
+        if not entradas:
+            return cls()
+        raiz = _construir(entradas, 0)
+        if not isinstance(raiz, _Nodo):
+            raiz = _Nodo(1 << (_hash_de(raiz) & 31), (raiz,))
+        return cls(raiz, len(entradas))
+
+    def __len__(self):
+        return self._total
+
+    def __iter__(self):
+        """Pares (clave, valor) en orden de hash"""
+        return _entradas(self._raiz)
+
+    def obtener(self, clave, defecto=None):
+        h = _hash_clave(clave)
+        nodo, nivel = self._raiz, 0
+        while True:
+            bit = 1 << ((h >> nivel) & 31)
+            if not nodo.mapa & bit:
+                return defecto
+            hijo = nodo.hijos[_bits(nodo.mapa & (bit - 1))]
+            if isinstance(hijo, _Nodo):
+                nodo, nivel = hijo, nivel + 5
+            elif isinstance(hijo, _Colision):
+                return next((valor for otra, valor in hijo.pares if otra == clave), defecto)
+            else:
+                return hijo[2] if hijo[1] == clave else defecto
+
+    def asignar(self, clave, valor):
+        raiz, agregado = _asignar(self._raiz, 0, _hash_clave(clave), clave, valor)
+        return self if raiz is self._raiz else MapaPersistente(raiz, self._total + agregado)
+
+    def quitar(self, clave):
+        raiz = _quitar(self._raiz, 0, _hash_clave(clave), clave)
+        return self if raiz is self._raiz else MapaPersistente(raiz or _VACIO, self._total - 1)
+
+    def aplicar(self, cambios):
+        """Mapa con los cambios {clave: valor o None para quitarla}"""
+        if not self._total:
+            return MapaPersistente.desde((clave, valor) for clave, valor in cambios.items() if valor is not None)
+        mapa = self
+        for clave, valor in cambios.items():
+            mapa = mapa.quitar(clave) if valor is None else mapa.asignar(clave, valor)
+        return mapa
+
+    def diferencias(self, otro):
+        """(clave, antes, después) de lo que cambia de este mapa a 'otro'; con None si falta.
+        Los subárboles compartidos se saltan: cuesta según los cambios, no según el tamaño"""
+        return _diferencias(self._raiz, otro._raiz)
+
+def registro_historial(disp):
+    registro = dispositivo_a_dict(disp)
+    registro.pop('SALUD', None)   # la salud es una observación, no una edición
+    return registro
+
+def normalizar_fecha(texto):
+    """'2024-05-01' (fin del día), '2024-05-01 10:30' o '2024-05-01 10:30:00' -> 'AAAA-MM-DD HH:MM:SS'"""
+    for formato, relleno in (("%Y-%m-%d %H:%M:%S", ''), ("%Y-%m-%d %H:%M", ':59'), ("%Y-%m-%d", ' 23:59:59')):
+        try:
+            datetime.strptime(texto.strip(), formato)
+        except ValueError:
+            continue
+        return texto.strip() + relleno
+    raise ValueError(f"Fecha inválida: {texto} (use AAAA-MM-DD [HH:MM[:SS]])")
+
+def campos_cambiados(antes, despues):
+    """(campo, antes, después) de los campos que difieren entre dos registros del historial"""
+    campos = [campo for campo in ('TIPO', 'NOMBRE', 'IP', 'CAPA', 'SERVICIOS') if (antes or {}).get(campo) != (despues or {}).get(campo)]
+    return [(campo, (antes or {}).get(campo), (despues or {}).get(campo)) for campo in campos]
+
+def _firma_registro(registro):
+    return tuple(sorted((campo, valor) for campo, valor in registro.items() if campo not in ('NOMBRE', 'ultima_modificacion')))
+
+def _igualar_dispositivo(inventario, disp, registro):
+    objetivo = dispositivo_desde_dict(registro)
+    if disp.tipo != objetivo.tipo:
+        # Ninguna edición cambia el tipo: se reemplaza el registro
+        inventario.eliminar(disp)
+        inventario.agregar(objetivo)
+        return
+    if disp.nombre != objetivo.nombre:
+        inventario.renombrar(disp, objetivo.nombre)
+    if disp.capa != objetivo.capa:
+        inventario.cambiar_capa(disp, objetivo.capa)
+    if disp.servicios != objetivo.servicios:
+        # Se rehace la lista entera para conservar también el orden
+        for servicio in list(disp.servicios):
+            inventario.quitar_servicio(disp, servicio)
+        for servicio in objetivo.servicios:
+            inventario.agregar_servicio(disp, servicio)
+    if disp.ip != objetivo.ip:
+        inventario.cambiar_ip(disp, objetivo.ip)
+    disp.ultima_modificacion = objetivo.ultima_modificacion
+
+def restaurar_registros(inventario, cambios):
+    """Lleva el inventario a otro estado a partir de las diferencias [(clave, antes, después)]
+    entre registros del historial, en una sola tanda de cambios"""
+    quitados = {clave: antes for clave, antes, despues in cambios if despues is None}
+    nuevos = {clave: despues for clave, antes, despues in cambios if antes is None}
+    # (clave con la que hoy está en el inventario, registro al que tiene que llegar)
+    modificados = [(clave, despues) for clave, antes, despues in cambios if antes is not None and despues is not None]
+    # Lo que desaparece con un nombre y aparece idéntico con otro es un cambio de nombre
+    por_firma = {}
+    for clave, registro in quitados.items():
+        por_firma.setdefault(_firma_registro(registro), []).append(clave)
+    for clave, registro in list(nuevos.items()):
+        candidatos = por_firma.get(_firma_registro(registro))
+        if candidatos:
+            anterior = candidatos.pop()
+            del quitados[anterior]
+            del nuevos[clave]
+            modificados.append((anterior, registro))
+
+    with agrupar_cambios(inventario):
+        for clave in quitados:
+            disp = inventario.buscar_por_nombre(clave)
+            if disp is not None:
+                inventario.eliminar(disp)
+        objetivos = [(inventario.buscar_por_nombre(clave), registro) for clave, registro in modificados]
+        for disp, registro in objetivos:
+            # Primero se sueltan las IPs que cambian para que no choquen entre sí
+            if disp is not None and disp.ip and disp.ip != registro.get('IP'):
+                inventario.cambiar_ip(disp, None)
+        for disp, registro in objetivos:
+            if disp is None:
+                inventario.agregar(dispositivo_desde_dict(registro))
+            else:
+                _igualar_dispositivo(inventario, disp, registro)
+        for registro in nuevos.values():
+            inventario.agregar(dispositivo_desde_dict(registro))
+
+def texto_diferencia(clave, antes, despues):
+    """'+ nombre', '- nombre' o '~ nombre  IP: a -> b; ...' para mostrar una diferencia"""
+    if antes is None:
+        return f"+ {despues['NOMBRE']}"
+    if despues is None:
+        return f"- {antes['NOMBRE']}"
+    detalle = '; '.join(f"{campo}: {anterior or '-'} -> {nuevo or '-'}" for campo, anterior, nuevo in campos_cambiados(antes, despues))
+    return f"~ {despues['NOMBRE']}\t{detalle or 'última modificación'}"
+
+class Historial:
+    """Versiones del inventario, una por guardado, en un archivo de solo anexar.
+
+    Cada versión es un MapaPersistente nombre -> registro que comparte con la anterior todo lo
+    que no cambió, así que guardar una versión cuesta memoria y disco según los cambios. Las
+    acciones del menú apilan el mapa previo para deshacer y rehacer sin copiar el inventario.
+    """
+
+    def __init__(self, inventario, archivo='dispositivos.json'):
+        self.inventario = inventario
+        self.ruta = archivo + '.historial'
+        self._versiones = None   # [(número, fecha, mapa, cantidad de cambios)], se lee al usarse
+        self._actual = None      # mapa del estado presente; se arma al pedirlo y sigue a los oyentes
+        self._deshacer = []
+        self._rehacer = []
+
+    def __call__(self, operacion, disp, datos):
+        if self._actual is None or operacion == 'salud':
+            return
+        if operacion == 'renombrar':
+            self._actual = self._actual.quitar(datos['anterior'].lower())
+        if operacion == 'eliminar':
+            self._actual = self._actual.quitar(disp.nombre.lower())
+        else:
+            self._actual = self._actual.asignar(disp.nombre.lower(), registro_historial(disp))
+
+    def versiones(self):
+        if self._versiones is None:
+            self._versiones = []
+            mapa = MapaPersistente()
+            for entrada in leer_diario(self.ruta):
+                mapa = mapa.aplicar(entrada['cambios'])
+                self._versiones.append((entrada['version'], entrada['fecha'], mapa, len(entrada['cambios'])))
+        return self._versiones
+
+    def version(self, numero=None, fecha=None):
+        """La versión con ese número, o la última guardada hasta esa fecha"""
+        versiones = self.versiones()
+        if numero is not None:
+            for version in versiones:
+                if version[0] == numero:
+                    return version
+            raise ValueError(f"No existe la versión {numero} (hay {len(versiones)})")
+        limite = normalizar_fecha(fecha)
+        anteriores = [version for version in versiones if version[1] <= limite]
+        if not anteriores:
+            raise ValueError(f"No hay versiones guardadas hasta {limite}")
+        return anteriores[-1]
+
+    def _ultima(self):
+        versiones = self.versiones()
+        return versiones[-1][2] if versiones else MapaPersistente()
+
+    def actual(self):
+        if self._actual is None:
+            # Partir de la última versión para compartir su estructura: solo se copia lo distinto
+            mapa = self._ultima()
+            cambios = {}
+            presentes = set()
+            for disp in self.inventario:
+                clave = disp.nombre.lower()
+                registro = registro_historial(disp)
+                presentes.add(clave)
+                if mapa.obtener(clave) != registro:
+                    cambios[clave] = registro
+            if len(mapa) > len(presentes) - sum(1 for clave in cambios if mapa.obtener(clave) is None):
+                # Sobran claves: dispositivos eliminados desde la última versión
+                cambios.update((clave, None) for clave, _ in mapa if clave not in presentes)
+            self._actual = mapa.aplicar(cambios)
+        return self._actual
+
+    def confirmar(self):
+        """Anexa el estado presente como versión nueva; no hace nada si no cambió"""
+        anterior = self._ultima()
+        actual = self.actual()
+        cambios = {clave: despues for clave, antes, despues in anterior.diferencias(actual)}
+        if not cambios:
+            return None
+        numero = len(self._versiones) + 1
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(self.ruta, 'a') as f:
+            f.write(json.dumps({'version': numero, 'fecha': fecha, 'cambios': cambios}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._versiones.append((numero, fecha, actual, len(cambios)))
+        return numero
+
+    @contextmanager
+    def accion(self):
+        """Punto para deshacer lo que se haga dentro del bloque, si cambia algo"""
+        antes = self.actual()
+        try:
+            yield self
+        finally:
+            if self.actual() is not antes:
+                self._deshacer.append(antes)
+                self._rehacer.clear()
+
+    def restaurar(self, destino):
+        """Lleva el inventario al estado del mapa; devuelve las diferencias aplicadas"""
+        cambios = list(self.actual().diferencias(destino))
+        try:
+            restaurar_registros(self.inventario, cambios)
+        except Exception:
+            self._actual = None   # se vuelve a leer del inventario
+            raise
+        self._actual = destino
+        return cambios
+
+    def _mover(self, origen, destino, vacio):
+        if not origen:
+            raise ValueError(vacio)
+        mapa = origen.pop()
+        presente = self.actual()
+        try:
+            cambios = self.restaurar(mapa)
+        except (ValueError, OSError):
+            origen.append(mapa)
+            raise
+        destino.append(presente)
+        return cambios
+
+    def pendientes(self):
+        """(acciones para deshacer, acciones para rehacer)"""
+        return len(self._deshacer), len(self._rehacer)
+
+    def deshacer(self):
+        return self._mover(self._deshacer, self._rehacer, "No hay acciones para deshacer")
+
+    def rehacer(self):
+        return self._mover(self._rehacer, self._deshacer, "No hay acciones para rehacer")
+
+    def diferencias(self, desde, hasta=None):
+        """Diferencias entre dos versiones (o entre una y el estado presente), por nombre"""
+        inicial = self.version(desde)[2]
+        final = self.actual() if hasta is None else self.version(hasta)[2]
+        return sorted(inicial.diferencias(final), key=lambda cambio: cambio[0])
+
+def cargar_historial(inventario, archivo='dispositivos.json'):
+    historial = Historial(inventario, archivo)
+    inventario.oyentes.append(historial)
+    inventario.historial = historial
+    return historial
 
-# 📂 Funciones para manejo de archivos JSON
-def guardar_dispositivos(dispositivos, archivo='dispositivos.json'):
+def punto_deshacer(dispositivos):
+    historial = getattr(dispositivos, 'historial', None)
+    return historial.accion() if historial is not None else nullcontext()
+
+# ✏️ Ediciones masivas sobre conjuntos filtrados
+ACCIONES_LOTE = ('add-service', 'remove-service', 'set-layer', 'renumber')
+
+def _campos_del_dispositivo(disp, capa=None, servicios=()):
+    # Las reglas de campos_segun_tipo, con el nombre del dispositivo en el error
     try:
-        # Convertir los dispositivos a un formato serializable
-        dispositivos_serializables = []
-        for disp in dispositivos:
-            disp_dict = {}
-            lineas = [linea.strip() for linea in disp.split('\n') if linea.strip()]
-            for linea in lineas:
-                if ':' in linea:
-                    clave, valor = linea.split(':', 1)
-                    clave = clave.strip().replace('🔧', '').replace('🏷️', '').replace('🌍', '').replace('📊', '').replace('🛠️', '').replace(Color.CYAN, '').replace(Color.BOLD, '').replace(Color.END, '').strip()
-                    valor = valor.strip()
-                    disp_dict[clave] = valor
-            
-            # Agregar fecha de modificación
-            disp_dict['ultima_modificacion'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            dispositivos_serializables.append(disp_dict)
-        
-        with open(archivo, 'w') as f:
-            json.dump(dispositivos_serializables, f, indent=4)
-        
-        return True
-    except Exception as e:
-        mostrar_mensaje(f"Error al guardar dispositivos: {str(e)}", "error")
-        return False
+        campos_segun_tipo(disp.tipo, capa, servicios)
+    except ValueError as e:
+        raise ValueError(f"'{disp.nombre}': {e}") from None
+
+def planificar_edicion(inventario, accion, valor, tipo=None, capa=None, servicio=None, salud=None):
+    """Cambios [(disp, antes, después)] que haría una edición masiva, sin aplicarlos.
+    Si algún dispositivo elegido no admite el cambio lanza ValueError: se aplican todos o ninguno"""
+    elegidos = inventario.filtrar(tipo, capa, servicio, salud)
+    cambios = []
+    if accion in ('add-service', 'remove-service'):
+        # Para los servicios, antes y después son la lista completa
+        valor = normalizar_catalogo(SERVICIOS_VALIDOS, valor)
+        validar_servicios([valor])
+        for disp in elegidos:
+            if accion == 'add-service' and valor not in disp.servicios:
+                _campos_del_dispositivo(disp, servicios=disp.servicios + [valor])
+                cambios.append((disp, list(disp.servicios), disp.servicios + [valor]))
+            elif accion == 'remove-service' and valor in disp.servicios:
+                cambios.append((disp, list(disp.servicios), [s for s in disp.servicios if s != valor]))
+    elif accion == 'set-layer':
+        valor = normalizar_catalogo(CAPAS_RED, valor)
+        if valor not in CAPAS_RED.values():
+            raise ValueError(f"Capa inválida: {valor} (opciones: {', '.join(CAPAS_RED)})")
+        for disp in elegidos:
+            if disp.capa != valor:
+                _campos_del_dispositivo(disp, capa=valor)
+                cambios.append((disp, disp.capa, valor))
+        if inventario.topologia is not None:
+            problemas = inventario.topologia.problemas_capas({disp.nombre.lower(): nueva for disp, _, nueva in cambios})
+            if problemas:
+                raise ValueError(f"El cambio de capa rompería {len(problemas)} enlaces: {problemas[0]}")
+    elif accion == 'renumber':
+        subred = _subredes(inventario).obtener(valor)
+        # Los que ya tienen una IP de la subred la conservan
+        mover = [disp for disp in elegidos if not (disp.ip and subred.contiene(disp.ip))]
+        libres = subred.libres(len(mover))
+        if len(libres) < len(mover):
+            raise ValueError(f"La subred {subred} tiene {len(libres)} direcciones libres y hacen falta {len(mover)}")
+        cambios = [(disp, disp.ip, ip) for disp, ip in zip(mover, libres)]
+    else:
+        raise ValueError(f"Acción inválida: {accion} (opciones: {', '.join(ACCIONES_LOTE)})")
+    return cambios
+
+def _fijar_valor(inventario, accion, disp, valor):
+    if accion == 'set-layer':
+        inventario.cambiar_capa(disp, valor)
+    elif accion == 'renumber':
+        inventario.cambiar_ip(disp, valor)
+    else:
+        for servicio in list(disp.servicios):
+            if servicio not in valor:
+                inventario.quitar_servicio(disp, servicio)
+        for servicio in valor:
+            if servicio not in disp.servicios:
+                inventario.agregar_servicio(disp, servicio)
+
+def aplicar_edicion(inventario, accion, cambios):
+    """Aplica los cambios de planificar_edicion en una sola escritura; si uno falla deshace los anteriores"""
+    hechos = []
+    with agrupar_cambios(inventario):
+        try:
+            for disp, antes, despues in cambios:
+                hechos.append((disp, antes))
+                _fijar_valor(inventario, accion, disp, despues)
+        except (ValueError, OSError, sqlite3.Error):
+            for disp, antes in reversed(hechos):
+                _fijar_valor(inventario, accion, disp, antes)
+            raise
+
+def texto_valor_lote(accion, valor):
+    """Valor de antes o después de una edición masiva tal como lo muestra el modo por lotes"""
+    if accion == 'set-layer':
+        return clave_catalogo(CAPAS_RED, valor) or '-'
+    if accion == 'renumber':
+        return valor or '-'
+    return ','.join(clave_catalogo(SERVICIOS_VALIDOS, servicio) for servicio in valor) or '-'
 
-def cargar_dispositivos(archivo='dispositivos.json'):
+# 🩺 Revisión de alcance y servicios
+# Puerto TCP conocido de cada servicio; None si no tiene sonda TCP (DHCP usa UDP)
+PUERTOS_SERVICIO = {'DNS': 53, 'DHCP': None, 'WEB': 80, 'BD': 3306, 'CORREO': 25, 'VPN': 443}
+# Puertos con los que se prueba el alcance de un equipo sin servicios sondeables
+PUERTOS_ALCANCE = (22, 80, 443)
+
+async def sondear_puerto(ip, puerto, tiempo_espera):
+    """Intenta una conexión TCP; devuelve (estado, latencia_ms, respondio)"""
+    inicio = perf_counter()
     try:
-        if not os.path.exists(archivo):
-            return []
-        
-        with open(archivo, 'r') as f:
-            datos = json.load(f)
-        
-        dispositivos = []
-        for disp_dict in datos:
-            # Reconstruir el dispositivo en el formato original
-            lineas = []
-            if 'TIPO' in disp_dict:
-                lineas.append(f"{Color.CYAN}🔧 {Color.BOLD}TIPO:{Color.END} {disp_dict['TIPO']}")
-            if 'NOMBRE' in disp_dict:
-                lineas.append(f"{Color.CYAN}🏷️ {Color.BOLD}NOMBRE:{Color.END} {disp_dict['NOMBRE']}")
-            if 'IP' in disp_dict:
-                lineas.append(f"{Color.CYAN}🌍 {Color.BOLD}IP:{Color.END} {disp_dict['IP']}")
-            if 'CAPA' in disp_dict:
-                lineas.append(f"{Color.CYAN}📊 {Color.BOLD}CAPA:{Color.END} {disp_dict['CAPA']}")
-            if 'SERVICIOS' in disp_dict:
-                lineas.append(f"{Color.CYAN}🛠️ {Color.BOLD}SERVICIOS:{Color.END} {disp_dict['SERVICIOS']}")
-            
-            separador = f"{Color.BLUE}{'═' * 60}{Color.END}"
-            dispositivo = f"\n{separador}\n" + "\n".join(lineas) + f"\n{separador}"
-            dispositivos.append(dispositivo)
-        
-        return dispositivos
-    except Exception as e:
-        mostrar_mensaje(f"Error al cargar dispositivos: {str(e)}", "error")
-        return []
+        _, escritor = await asyncio.wait_for(asyncio.open_connection(ip, puerto), tiempo_espera)
+    except ConnectionRefusedError:
+        # El equipo contestó con un rechazo: está encendido aunque el servicio no
+        return SALUD_CAIDO, round((perf_counter() - inicio) * 1000, 2), True
+    except (asyncio.TimeoutError, OSError):
+        return SALUD_CAIDO, None, False
+    latencia = round((perf_counter() - inicio) * 1000, 2)
+    escritor.close()
+    try:
+        await escritor.wait_closed()
+    except OSError:
+        pass
+    return SALUD_ACTIVO, latencia, True
 
-def obtener_ips_dispositivos(dispositivos):
-    """Obtiene todas las IPs de los dispositivos existentes"""
-    ips = []
+async def _revisar_equipo(ip, sondas, tiempo_espera, limite):
+    async def sonda(puerto):
+        async with limite:
+            return await sondear_puerto(ip, puerto, tiempo_espera)
+    
+    resultados = await asyncio.gather(*(sonda(puerto) for _, puerto in sondas))
+    servicios = {}
+    latencias = []
+    for (servicio, puerto), (estado, latencia, respondio) in zip(sondas, resultados):
+        if respondio:
+            latencias.append(latencia)
+        if servicio:
+            servicios[servicio] = {'estado': estado, 'latencia_ms': latencia, 'puerto': puerto}
+    return {
+        'estado': SALUD_ACTIVO if latencias else SALUD_CAIDO,
+        'latencia_ms': min(latencias) if latencias else None,
+        'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'servicios': servicios
+    }
+
+@medir()
+def revisar_salud(dispositivos, puertos=None, alcance=PUERTOS_ALCANCE, concurrencia=500, tiempo_espera=1.0, destino=None):
+    """Sondea en paralelo los dispositivos con IP; devuelve [(disp, salud)] sin tocar el inventario.
+
+    Cada servicio se prueba con una conexión TCP a su puerto (PUERTOS_SERVICIO, reemplazable con
+    'puertos'); el equipo está activo si alguna sonda recibió respuesta, aunque fuera un rechazo.
+    'concurrencia' limita las conexiones abiertas a la vez y 'tiempo_espera' es el límite por sonda.
+    Con 'destino' todas las sondas van a esa dirección (p. ej. servicios de prueba en 127.0.0.1).
+    """
+    tabla = {**PUERTOS_SERVICIO, **(puertos or {})}
+    objetivos = []
     for disp in dispositivos:
-        try:
-            lineas = [linea.strip() for linea in disp.split('\n') if linea.strip()]
-            ip_linea = next((linea for linea in lineas if "IP:" in linea), None)
-            if ip_linea:
-                ip = ip_linea.split("IP:")[1].strip()
-                if ip:
-                    ips.append(ip)
-        except:
+        if not disp.ip:
             continue
-    return ips
-
-def validar_ip(ip, dispositivos):
-    # Verificar si la IP ya está en uso
-    ips_existentes = obtener_ips_dispositivos(dispositivos)
-    if ip in ips_existentes:
-        # Obtener nombre del dispositivo que tiene esta IP
-        for disp in dispositivos:
-            try:
-                lineas = [linea.strip() for linea in disp.split('\n') if linea.strip()]
-                ip_linea = next((linea for linea in lineas if "IP:" in linea), None)
-                if ip_linea and ip_linea.split("IP:")[1].strip() == ip:
-                    nombre_linea = next((linea for linea in lineas if "NOMBRE:" in linea), None)
-                    nombre = nombre_linea.split("NOMBRE:")[1].strip() if nombre_linea else "dispositivo desconocido"
-                    raise ValueError(f"La IP {ip} ya está en uso por el dispositivo: {nombre}")
-            except:
-                continue
+        claves = [clave_catalogo(SERVICIOS_VALIDOS, servicio) for servicio in dict.fromkeys(disp.servicios)]
+        sondas = [(clave, tabla[clave]) for clave in claves if tabla.get(clave)]
+        objetivos.append((disp, sondas or [(None, puerto) for puerto in alcance], [clave for clave in claves if not tabla.get(clave)]))
     
-    # Verificación básica de formato
-    if not re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', ip):
-        raise ValueError("Formato incorrecto. Debe ser X.X.X.X donde X es un número (0-255)")
+    async def barrer():
+        limite = asyncio.Semaphore(concurrencia)
+        return await asyncio.gather(*(_revisar_equipo(destino or disp.ip, sondas, tiempo_espera, limite) for disp, sondas, _ in objetivos))
     
-    octetos = ip.split('.')
-    if len(octetos) != 4:
-        raise ValueError("La IP debe tener exactamente 4 partes separadas por puntos")
+    resultados = []
+    for (disp, _, sin_sonda), salud in zip(objetivos, asyncio.run(barrer()) if objetivos else []):
+        for clave in sin_sonda:
+            salud['servicios'][clave] = {'estado': SALUD_SIN_SONDA, 'latencia_ms': None, 'puerto': None}
+        resultados.append((disp, salud))
+    return resultados
+
+# 🖥️ Función para crear dispositivo
+@medir()
+def crear_dispositivo(tipo, nombre, ip=None, capa=None, servicios=None):
+    dispositivo = Dispositivo(tipo, nombre, ip, capa, servicios)
+    dispositivo.tocar()
+    return dispositivo
+
+# 📥 Importación de inventarios heredados en texto
+def normalizar_texto(texto):
+    """Quita emojis iniciales y tildes y pasa a minúsculas: '💎 Núcleo (Core)' -> 'nucleo (core)'"""
+    texto = re.sub(r'^[^\w(]+', '', str(texto).strip())
+    texto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower().strip()
+
+def _tabla_equivalencias(catalogo, extras):
+    tabla = {}
+    for clave, valor in catalogo.items():
+        tabla[normalizar_texto(clave)] = valor
+        tabla[normalizar_texto(valor)] = valor
+    for alias, clave in extras.items():
+        tabla[normalizar_texto(alias)] = catalogo[clave]
+    return tabla
+
+EQUIVALENCIAS_TIPO = _tabla_equivalencias(TIPOS_DISPOSITIVO, {'Server': 'SERVIDOR', 'Printer': 'IMPRESORA'})
+EQUIVALENCIAS_CAPA = _tabla_equivalencias(CAPAS_RED, {'Core': 'NUCLEO', 'Distribution': 'DISTRIBUCION', 'Access': 'ACCESO'})
+EQUIVALENCIAS_SERVICIO = _tabla_equivalencias(SERVICIOS_VALIDOS, {'Correo': 'CORREO', 'Mail': 'CORREO', 'Email': 'CORREO', 'Base de Datos': 'BD'})
+
+CAMPOS_TEXTO = {'tipo', 'nombre', 'ip', 'capa', 'jerarquia', 'servicios', 'vlans'}
+
+def _es_separador(linea):
+    return len(linea) >= 3 and (set(linea) == {'-'} or set(linea) == {'='})
+
+def _formato_bloque(lineas):
+    if any(re.match(r'^[^\w\s]', linea) for linea in lineas):
+        return 'emoji'
+    if any(normalizar_texto(linea.split(':', 1)[0]) == 'tipo' for linea in lineas if ':' in linea):
+        return 'igual'
+    return 'guiones'
+
+def _convertir_bloque(lineas, formato, origen):
+    """Convierte las líneas 'clave: valor' de un bloque en un registro normalizado"""
+    campos = {}
+    avisos = []
+    for i, linea in enumerate(lineas):
+        if ':' not in linea:
+            continue
+        clave, valor = (parte.strip() for parte in linea.split(':', 1))
+        clave_norm = normalizar_texto(clave)
+        if clave_norm in CAMPOS_TEXTO:
+            campos[clave_norm] = valor
+        elif i == 0 and formato == 'guiones':
+            # Formato 'Switch: sw1': el tipo va como clave y el nombre como valor
+            campos['tipo'], campos['nombre'] = clave, valor
     
-    for octeto in octetos:
-        try:
-            num = int(octeto)
-            if not (0 <= num <= 255):
-                raise ValueError(f"El octeto {num} no es válido (debe estar entre 0-255)")
-        except ValueError:
-            raise ValueError(f"'{octeto}' no es un número válido para un octeto de IP")
+    registro = {'NOMBRE': campos.get('nombre', ''), 'origen': origen, 'formato': formato}
+    tipo = EQUIVALENCIAS_TIPO.get(normalizar_texto(campos.get('tipo', '')))
+    if tipo is None:
+        registro['error'] = f"Tipo de dispositivo desconocido: '{campos.get('tipo', '')}'"
+    registro['TIPO'] = tipo
+    if campos.get('ip'):
+        registro['IP'] = campos['ip']
     
-    # Verificación de rangos especiales
-    primer_octeto = int(octetos[0])
-    if primer_octeto == 0:
-        raise ValueError("El primer octeto no puede ser 0 (reservado)")
-    if primer_octeto == 127:
-        raise ValueError("Las IPs 127.x.x.x están reservadas para loopback")
-    if primer_octeto >= 224:
-        if primer_octeto < 240:
-            raise ValueError("Las IPs 224.x.x.x a 239.x.x.x están reservadas para multicast")
+    capa_texto = campos.get('capa') or campos.get('jerarquia')
+    if capa_texto:
+        capa = EQUIVALENCIAS_CAPA.get(normalizar_texto(capa_texto))
+        if capa:
+            registro['CAPA'] = capa
         else:
-            raise ValueError("Las IPs 240.x.x.x y superiores están reservadas para uso futuro")
+            avisos.append(f"capa '{capa_texto}' no reconocida")
     
-    # Verificación de direcciones especiales
-    if ip == "255.255.255.255":
-        raise ValueError("Esta IP está reservada para broadcast limitado")
-    if octetos[3] == "255":
-        raise ValueError("El último octeto no puede ser 255 (reservado para broadcast)")
+    servicios = []
+    vistos = set()
+    texto = campos.get('servicios', '')
+    piezas = texto.split(',') if ',' in texto else separar_servicios(texto)
+    for pieza in piezas:
+        pieza_norm = normalizar_texto(pieza)
+        if not pieza_norm:
+            continue
+        servicio = EQUIVALENCIAS_SERVICIO.get(pieza_norm)
+        if pieza_norm in vistos or (servicio is not None and servicio in servicios):
+            # 'VLAN, VLAN' se avisa aunque el servicio no sea del catálogo
+            avisos.append(f"servicio '{pieza.strip()}' duplicado")
+        elif servicio is None:
+            avisos.append(f"servicio '{pieza.strip()}' ignorado")
+        else:
+            servicios.append(servicio)
+        vistos.add(pieza_norm)
+    registro['SERVICIOS'] = servicios
+    registro['avisos'] = avisos
+    return registro
+
+def analizar_texto_inventario(texto, archivo='', linea_inicial=1):
+    """Detecta los bloques de un volcado de texto y devuelve un registro por dispositivo"""
+    registros = []
+    bloque = []
+    inicio_bloque = linea_inicial
     
-    return True
+    def cerrar_bloque():
+        if any(':' in linea for linea in bloque):
+            formato = _formato_bloque(bloque)
+            registros.append(_convertir_bloque(bloque, formato, f"{archivo}:{inicio_bloque}"))
+        bloque.clear()
+    
+    for numero, linea in enumerate(texto.splitlines(), linea_inicial):
+        linea = linea.strip()
+        if _es_separador(linea):
+            cerrar_bloque()
+            continue
+        if not linea:
+            continue
+        # En el formato con emojis puede no haber separadores: cada TIPO abre un bloque
+        if ':' in linea and normalizar_texto(linea.split(':', 1)[0]) == 'tipo' and bloque:
+            cerrar_bloque()
+        if not bloque:
+            inicio_bloque = numero
+        bloque.append(linea)
+    cerrar_bloque()
+    return registros
 
-def validar_nombre(nombre, dispositivos):
-    if not re.match(r'^[a-zA-Z0-9\-\.]+$', nombre):
-        raise ValueError("El nombre solo puede contener letras, números, guiones (-) y puntos (.)")
-    if len(nombre) > 30:
-        raise ValueError("El nombre no puede exceder los 30 caracteres")
+def _analizar_fragmento(argumentos):
+    texto, archivo, linea_inicial = argumentos
+    return analizar_texto_inventario(texto, archivo, linea_inicial)
+
+PATRON_CORTE = re.compile(r'\n(?=(?:-{3,}|={3,})[ \t]*\n|[^\n:]*TIPO:)')
+
+def fragmentar_texto(texto, tam_fragmento):
+    """Corta el texto en fragmentos que empiezan en un separador o en una línea TIPO"""
+    inicio = 0
+    linea = 1
+    while inicio < len(texto):
+        fin = inicio + tam_fragmento
+        if fin < len(texto):
+            corte = PATRON_CORTE.search(texto, fin)
+            fin = corte.start() + 1 if corte else len(texto)
+        else:
+            fin = len(texto)
+        fragmento = texto[inicio:fin]
+        yield fragmento, linea
+        linea += fragmento.count('\n')
+        inicio = fin
+
+@medir()
+def importar_inventario_texto(archivos, inventario, procesos=None, tam_fragmento=1 << 20, simular=False):
+    """Importa volcados de texto heredados validando cada dispositivo con las reglas del menú"""
+    trabajos = []
+    for archivo in archivos:
+        with open(archivo, 'r', encoding='utf-8') as f:
+            texto = f.read()
+        trabajos.extend((fragmento, archivo, linea) for fragmento, linea in fragmentar_texto(texto, tam_fragmento))
     
-    # Verificar que el nombre no esté en uso
-    for disp in dispositivos:
+    # Con pocos fragmentos no compensa arrancar procesos
+    if len(trabajos) > 1 and procesos != 1:
+        with ProcessPoolExecutor(max_workers=procesos) as grupo:
+            resultados = list(grupo.map(_analizar_fragmento, trabajos))
+    else:
+        resultados = [_analizar_fragmento(trabajo) for trabajo in trabajos]
+    
+    registros = [registro for lote in resultados for registro in lote]
+    codigos_ip, _ = validar_ips_lote(registro.get('IP', '') for registro in registros)
+    
+    informe = {'importados': [], 'rechazados': [], 'avisos': [], 'formatos': {}}
+    nuevos = Inventario()
+    origenes = {}
+    for registro, codigo_ip in zip(registros, codigos_ip):
+        origen = registro['origen']
+        informe['formatos'][registro['formato']] = informe['formatos'].get(registro['formato'], 0) + 1
+        informe['avisos'].extend(f"{origen} {registro['NOMBRE']}: {aviso}" for aviso in registro['avisos'])
         try:
-            lineas = [linea.strip() for linea in disp.split('\n') if linea.strip()]
-            nombre_linea = next((linea for linea in lineas if "NOMBRE:" in linea), None)
-            if nombre_linea:
-                nombre_existente = nombre_linea.split("NOMBRE:")[1].strip()
-                if nombre_existente.lower() == nombre.lower():
-                    raise ValueError(f"El nombre '{nombre}' ya está en uso por otro dispositivo")
-        except:
+            if 'error' in registro:
+                raise ValueError(registro['error'])
+            # Mismas reglas que el menú, contra el inventario y contra el propio lote
+            validar_nombre(registro['NOMBRE'], inventario)
+            validar_nombre(registro['NOMBRE'], nuevos)
+            if registro.get('IP'):
+                verificar_ip_libre(registro['IP'], inventario)
+                verificar_ip_libre(registro['IP'], nuevos)
+                if codigo_ip != IP_VALIDA:
+                    raise ValueError(mensaje_error_ip(codigo_ip, registro['IP']))
+            capa, servicios, avisos = campos_segun_tipo(registro['TIPO'], registro.get('CAPA'), registro['SERVICIOS'], estricto=False)
+        except ValueError as e:
+            informe['rechazados'].append((origen, registro['NOMBRE'], str(e)))
             continue
+        informe['avisos'].extend(f"{origen} {registro['NOMBRE']}: {aviso}" for aviso in avisos)
+        disp = crear_dispositivo(registro['TIPO'], registro['NOMBRE'], registro.get('IP'), capa, servicios)
+        nuevos.agregar(disp)
+        origenes[disp] = origen
+        informe['importados'].append(disp)
     
-    return True
+    if not simular:
+        for disp in nuevos:
+            try:
+                inventario.agregar(disp)
+            except ValueError as e:
+                # En un inventario compartido otro operador pudo tomar el nombre o la IP
+                informe['importados'].remove(disp)
+                informe['rechazados'].append((origenes[disp], disp.nombre, str(e)))
+    return informe
 
-def validar_servicios(servicios):
-    for servicio in servicios:
-        if servicio not in SERVICIOS_VALIDOS.values():
-            raise ValueError(f"Servicio inválido: {servicio}")
-    return True
+# 🔀 Reconciliación de varias fuentes
+POLITICAS_RECONCILIACION = ('reciente', 'prioridad', 'manual')
 
-# 🖥️ Función para crear dispositivo
-def crear_dispositivo(tipo, nombre, ip=None, capa=None, servicios=None):
+def _fecha_archivo(ruta):
+    return datetime.fromtimestamp(os.path.getmtime(ruta)).strftime("%Y-%m-%d %H:%M:%S")
+
+def registros_de_fuente(ruta, prioridad, procesos=None, tam_fragmento=1 << 20):
+    """Registros de un volcado de texto o de un inventario (.json, .bin, .db), uno a uno"""
+    if os.path.splitext(ruta)[1].lower() in ('.json',) + EXTENSIONES_BINARIAS + EXTENSIONES_SQLITE:
+        inventario = cargar_dispositivos(ruta, con_diario=False)
+        try:
+            for disp in inventario:
+                registro = dispositivo_a_dict(disp)
+                yield {'NOMBRE': disp.nombre, 'TIPO': disp.tipo, 'IP': disp.ip, 'CAPA': disp.capa,
+                       'SERVICIOS': list(disp.servicios), 'fecha': registro.get('ultima_modificacion'),
+                       'origen': ruta, 'prioridad': prioridad, 'avisos': []}
+        finally:
+            inventario.cerrar()
+        return
+    with open(ruta, 'r', encoding='utf-8') as f:
+        texto = f.read()
+    fecha = _fecha_archivo(ruta)
+    trabajos = [(fragmento, ruta, linea) for fragmento, linea in fragmentar_texto(texto, tam_fragmento)]
+    del texto
+    if len(trabajos) > 1 and procesos != 1:
+        grupo = ProcessPoolExecutor(max_workers=procesos)
+        lotes = grupo.map(_analizar_fragmento, trabajos)
+    else:
+        grupo = None
+        lotes = map(_analizar_fragmento, trabajos)
     try:
-        dispositivo = [
-            f"{Color.CYAN}🔧 {Color.BOLD}TIPO:{Color.END} {tipo}",
-            f"{Color.CYAN}🏷️ {Color.BOLD}NOMBRE:{Color.END} {nombre}"
-        ]
+        for lote in lotes:
+            for registro in lote:
+                registro.pop('formato', None)
+                registro.update(fecha=fecha, prioridad=prioridad)
+                yield registro
+    finally:
+        if grupo is not None:
+            grupo.shutdown(cancel_futures=True)
+
+def _mismo_dispositivo(a, b):
+    # Se compara la IP leída: perderla en un conflicto no vuelve distinta una copia exacta
+    campos = lambda r: (r['TIPO'], r.get('ip_leida', r.get('IP')), r.get('CAPA'), set(r['SERVICIOS']))
+    return campos(a) == campos(b)
+
+def _candidato(registro):
+    return {campo: registro.get(campo) for campo in ('NOMBRE', 'TIPO', 'IP', 'CAPA', 'SERVICIOS', 'fecha', 'origen')}
+
+class Reconciliacion:
+    """Fusiona registros de varias fuentes en una sola pasada.
+
+    Los registros se emparejan por nombre (sin distinguir mayúsculas) y por IP con dos
+    diccionarios, así que cada registro cuesta O(1) y la memoria depende de los dispositivos
+    distintos, no de los leídos. Un nombre con datos distintos o una IP en dos dispositivos es
+    un conflicto que resuelve la política: 'reciente' (gana la fecha más nueva), 'prioridad'
+    (gana la fuente anterior en la lista) o 'manual' (queda en la cola de pendientes).
+    """
+
+    def __init__(self, politica='reciente'):
+        if politica not in POLITICAS_RECONCILIACION:
+            raise ValueError(f"Política desconocida: {politica} (opciones: {', '.join(POLITICAS_RECONCILIACION)})")
+        self.politica = politica
+        self.registros = {}    # nombre en minúsculas -> registro que queda
+        self._por_ip = {}      # ip -> nombre en minúsculas de quien la tiene
+        self.conflictos = []
+        self.pendientes = []   # (conflicto, registro que quedó, registro que espera) sin decidir
+        self.rechazados = []   # (origen, nombre, motivo)
+        self.leidos = 0
+        self.duplicados = 0
+
+    def _gana(self, nuevo, actual):
+        if self.politica == 'reciente':
+            if nuevo['fecha'] != actual['fecha']:
+                return (nuevo['fecha'] or '') > (actual['fecha'] or '')
+            if nuevo['prioridad'] == actual['prioridad']:
+                return True   # misma fuente y fecha: el bloque posterior es el más nuevo
+        # Con igual prioridad se queda el que llegó primero
+        return nuevo['prioridad'] < actual['prioridad']
+
+    def _conflicto(self, tipo, clave, actual, nuevo):
+        conflicto = {'tipo': tipo, 'clave': clave, 'candidatos': [_candidato(actual), _candidato(nuevo)], 'resolucion': self.politica}
+        self.conflictos.append(conflicto)
+        return conflicto
+
+    def _ocupar_ip(self, clave, registro):
+        ip = registro.get('IP')
+        dueno = self._por_ip.get(ip) if ip else None
+        if dueno is None or dueno == clave:
+            if ip:
+                self._por_ip[ip] = clave
+            return
+        otro = self.registros[dueno]
+        conflicto = self._conflicto('ip', ip, otro, registro)
+        if self.politica == 'manual':
+            # Mientras se decide, el recién llegado queda sin IP
+            registro.setdefault('ip_leida', ip)
+            registro['IP'] = None
+            self.pendientes.append((conflicto, otro, registro))
+            return
+        ganador, perdedor = (registro, otro) if self._gana(registro, otro) else (otro, registro)
+        perdedor.setdefault('ip_leida', ip)
+        perdedor['IP'] = None
+        self._por_ip[ip] = ganador['NOMBRE'].lower()
+        conflicto['ganador'] = ganador['origen']
+
+    def _reemplazar(self, clave, anterior, registro):
+        if anterior.get('IP') and self._por_ip.get(anterior['IP']) == clave:
+            del self._por_ip[anterior['IP']]
+        self.registros[clave] = registro
+        self._ocupar_ip(clave, registro)
+
+    def agregar(self, registro):
+        self.leidos += 1
+        try:
+            if registro.get('error'):
+                raise ValueError(registro['error'])
+            validar_formato_nombre(registro['NOMBRE'])
+            if registro.get('IP'):
+                codigo = codigo_error_ip(registro['IP'])
+                if codigo != IP_VALIDA:
+                    raise ValueError(mensaje_error_ip(codigo, registro['IP']))
+        except ValueError as e:
+            self.rechazados.append((registro['origen'], registro['NOMBRE'], str(e)))
+            return
         
-        if ip:
-            dispositivo.append(f"{Color.CYAN}🌍 {Color.BOLD}IP:{Color.END} {ip}")
-        if capa:
-            dispositivo.append(f"{Color.CYAN}📊 {Color.BOLD}CAPA:{Color.END} {capa}")
-        if servicios:
-            dispositivo.append(f"{Color.CYAN}🛠️ {Color.BOLD}SERVICIOS:{Color.END} {' '.join(servicios)}")
+        servicios = list(dict.fromkeys(registro['SERVICIOS']))
+        repetidos = len(servicios) < len(registro['SERVICIOS']) or (registro['avisos'] and any('duplicado' in aviso for aviso in registro['avisos']))
+        registro['SERVICIOS'] = servicios
+        if repetidos:
+            self.conflictos.append({'tipo': 'servicios', 'clave': registro['NOMBRE'], 'candidatos': [_candidato(registro)], 'resolucion': 'unificados'})
+        # Lo que el tipo no admite se descarta, con el registro original en el conflicto
+        try:
+            capa, servicios, sobrantes = campos_segun_tipo(registro['TIPO'], registro.get('CAPA'), servicios, estricto=False)
+        except ValueError as e:
+            self.rechazados.append((registro['origen'], registro['NOMBRE'], str(e)))
+            return
+        if sobrantes:
+            self.conflictos.append({'tipo': 'campos', 'clave': registro['NOMBRE'], 'candidatos': [_candidato(registro)], 'resolucion': 'descartados', 'avisos': sobrantes})
+            registro['CAPA'], registro['SERVICIOS'] = capa, servicios
         
-        separador = f"{Color.BLUE}{'═' * 60}{Color.END}"
-        return f"\n{separador}\n" + "\n".join(dispositivo) + f"\n{separador}"
+        clave = registro['NOMBRE'].lower()
+        actual = self.registros.get(clave)
+        if actual is None:
+            self.registros[clave] = registro
+            self._ocupar_ip(clave, registro)
+            return
+        if _mismo_dispositivo(actual, registro):
+            self.duplicados += 1
+            return
+        conflicto = self._conflicto('nombre', registro['NOMBRE'], actual, registro)
+        if self.politica == 'manual':
+            self.pendientes.append((conflicto, actual, registro))
+        elif self._gana(registro, actual):
+            conflicto['ganador'] = registro['origen']
+            self._reemplazar(clave, actual, registro)
+        else:
+            conflicto['ganador'] = actual['origen']
+
+    def agregar_fuentes(self, rutas, procesos=None):
+        """Recorre las fuentes en orden de prioridad (la primera es la más fuerte)"""
+        for prioridad, ruta in enumerate(rutas):
+            for registro in registros_de_fuente(ruta, prioridad, procesos):
+                self.agregar(registro)
+        return self
+
+    def resolver(self, pendiente, elegido):
+        """Decide un conflicto de la cola: elegido es 0 (el que quedó) o 1 (el que espera)"""
+        conflicto, actual, nuevo = pendiente
+        if conflicto['tipo'] == 'nombre':
+            clave = conflicto['clave'].lower()
+            if self.registros.get(clave) is not actual:
+                raise ValueError(f"El conflicto de '{conflicto['clave']}' ya no está vigente")
+            if elegido:
+                self._reemplazar(clave, actual, nuevo)
+        else:
+            ip = conflicto['clave']
+            if self._por_ip.get(ip) != actual['NOMBRE'].lower() or self.registros.get(nuevo['NOMBRE'].lower()) is not nuevo:
+                raise ValueError(f"El conflicto por la IP {ip} ya no está vigente")
+            if elegido:
+                if nuevo.get('IP') and self._por_ip.get(nuevo['IP']) == nuevo['NOMBRE'].lower():
+                    del self._por_ip[nuevo['IP']]
+                actual.setdefault('ip_leida', ip)
+                actual['IP'], nuevo['IP'] = None, ip
+                self._por_ip[ip] = nuevo['NOMBRE'].lower()
+        conflicto['ganador'] = (nuevo if elegido else actual)['origen']
+        self.pendientes.remove(pendiente)
+
+    def informe(self):
+        return {'politica': self.politica, 'leidos': self.leidos, 'dispositivos': len(self.registros),
+                'duplicados': self.duplicados, 'conflictos': self.conflictos,
+                'pendientes': len(self.pendientes),
+                'rechazados': [{'origen': origen, 'nombre': nombre, 'motivo': motivo} for origen, nombre, motivo in self.rechazados]}
+
+def texto_conflicto(conflicto):
+    candidatos = '; '.join(f"{c['origen']}: {c['NOMBRE']} {c['TIPO']} {c['IP'] or '-'}" for c in conflicto['candidatos'])
+    decision = conflicto.get('ganador') or {'servicios': 'unificados', 'campos': 'descartados'}.get(conflicto['tipo'], 'pendiente')
+    return f"{conflicto['tipo']}\t{conflicto['clave']}\t{decision}\t{candidatos}"
+
+@medir()
+def reconciliar_fuentes(rutas, inventario=None, politica='reciente', procesos=None, decidir=None, simular=False):
+    """Fusiona las fuentes (el inventario, si se da, cuenta como la primera) y aplica el resultado.
+
+    decidir(conflicto) devuelve 0, 1 o None para cada conflicto pendiente de la política manual;
+    los que quedan sin decidir no se aplican. Devuelve (reconciliación, dispositivos cambiados)
+    """
+    reconciliacion = Reconciliacion(politica)
+    ips_inventario = {}
+    if inventario is not None:
+        for disp in inventario:
+            ips_inventario[disp.nombre.lower()] = disp.ip
+            reconciliacion.agregar({'NOMBRE': disp.nombre, 'TIPO': disp.tipo, 'IP': disp.ip, 'CAPA': disp.capa,
+                                    'SERVICIOS': list(disp.servicios), 'fecha': disp.ultima_modificacion,
+                                    'origen': 'inventario', 'prioridad': -1, 'avisos': []})
+    reconciliacion.agregar_fuentes(rutas, procesos)
+    preguntados = set()
+    while decidir is not None:
+        # Elegir un candidato puede abrir otro conflicto (su IP ya tenía dueño)
+        pendiente = next((pendiente for pendiente in reconciliacion.pendientes if id(pendiente[0]) not in preguntados), None)
+        if pendiente is None:
+            break
+        preguntados.add(id(pendiente[0]))
+        elegido = decidir(pendiente[0])
+        if elegido is not None:
+            reconciliacion.resolver(pendiente, elegido)
+    if inventario is None or simular:
+        return reconciliacion, 0
     
-    except ValueError as e:
-        return f"{Color.RED}❌ Error al crear dispositivo: {e}{Color.END}"
+    # Un nombre que sigue en la cola no se toca: el inventario conserva lo que tenía
+    en_espera = {conflicto['clave'].lower() for conflicto, _, _ in reconciliacion.pendientes if conflicto['tipo'] == 'nombre'}
+    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cambios = []
+    for clave, registro in reconciliacion.registros.items():
+        if clave in en_espera:
+            continue
+        if registro['origen'] == 'inventario' and registro.get('IP') == ips_inventario[clave]:
+            continue   # quedó tal cual estaba
+        existente = inventario.buscar_por_nombre(clave)
+        antes = registro_historial(existente) if existente is not None else None
+        despues = {'TIPO': registro['TIPO'], 'NOMBRE': registro['NOMBRE']}
+        for campo in ('IP', 'CAPA'):
+            if registro.get(campo):
+                despues[campo] = registro[campo]
+        if registro['SERVICIOS']:
+            despues['SERVICIOS'] = ' '.join(registro['SERVICIOS'])
+        if antes is not None and not campos_cambiados(antes, despues):
+            continue
+        despues['ultima_modificacion'] = ahora
+        cambios.append((clave, antes, despues))
+    restaurar_registros(inventario, cambios)
+    return reconciliacion, len(cambios)
 
 # 🎮 Funciones del menú interactivo
-def mostrar_menu_principal():
+def mostrar_menu_principal(dispositivos=None):
     mostrar_titulo("SISTEMA DE GESTIÓN DE DISPOSITIVOS")
+    if dispositivos is not None and dispositivos.cargando():
+        print(f"{Color.YELLOW}⏳ Cargando inventario... {len(dispositivos)} dispositivos leídos{Color.END}\n")
     print(f"{Color.BOLD}{Color.YELLOW}1.{Color.END} 📱 Agregar nuevo dispositivo")
     print(f"{Color.BOLD}{Color.YELLOW}2.{Color.END} 📜 Mostrar todos los dispositivos")
     print(f"{Color.BOLD}{Color.YELLOW}3.{Color.END} 🔍 Buscar dispositivo por nombre")
@@ -253,7 +4905,16 @@ def mostrar_menu_principal():
     print(f"{Color.BOLD}{Color.YELLOW}5.{Color.END} 🌐 Agregar/modificar IP de dispositivo")
     print(f"{Color.BOLD}{Color.YELLOW}6.{Color.END} ❌ Eliminar dispositivo")
     print(f"{Color.BOLD}{Color.YELLOW}7.{Color.END} 💾 Guardar dispositivos")
-    print(f"{Color.BOLD}{Color.YELLOW}8.{Color.END} 🚪 Salir")
+    print(f"{Color.BOLD}{Color.YELLOW}8.{Color.END} 🧭 Filtrar por tipo/capa/servicio")
+    print(f"{Color.BOLD}{Color.YELLOW}9.{Color.END} 📥 Importar inventario desde texto")
+    print(f"{Color.BOLD}{Color.YELLOW}10.{Color.END} 🧩 Subredes y direcciones libres")
+    print(f"{Color.BOLD}{Color.YELLOW}11.{Color.END} 📈 Estadísticas de rendimiento")
+    print(f"{Color.BOLD}{Color.YELLOW}12.{Color.END} 🩺 Revisar alcance y servicios")
+    print(f"{Color.BOLD}{Color.YELLOW}13.{Color.END} 🕸️ Topología de red")
+    print(f"{Color.BOLD}{Color.YELLOW}14.{Color.END} ✏️ Renombrar dispositivo")
+    print(f"{Color.BOLD}{Color.YELLOW}15.{Color.END} 🧰 Edición masiva")
+    print(f"{Color.BOLD}{Color.YELLOW}16.{Color.END} 🕰️ Historial y deshacer")
+    print(f"{Color.BOLD}{Color.YELLOW}17.{Color.END} 🚪 Salir")
     print(f"\n{Color.BLUE}{'═' * 60}{Color.END}")
 
 def seleccionar_opcion(opciones, titulo):
@@ -271,14 +4932,26 @@ def seleccionar_opcion(opciones, titulo):
         except ValueError:
             mostrar_mensaje("Entrada inválida. Por favor ingrese un número.", "error")
 
-def ingresar_ip(dispositivos):
+def seleccionar_ip_libre(dispositivos):
+    """Propone la siguiente IP libre de una subred registrada"""
+    subredes = {str(subred): f"{subred} ({subred.utilizacion()[2]:.1f}% en uso)" for subred in dispositivos.subredes or []}
+    if not subredes:
+        raise ValueError("No hay subredes registradas para asignar una IP automáticamente")
+    elegida = seleccionar_opcion(subredes, "📌 Seleccione la subred:")
+    cidr = next(clave for clave, texto in subredes.items() if texto == elegida)
+    return dispositivos.subredes.asignar(cidr)
+
+def ingresar_ip(dispositivos, excluir=None):
     while True:
-        ip = input(f"{Color.GREEN}↳ Ingrese la dirección IP (deje vacío si no aplica): {Color.END}").strip()
+        ip = input(f"{Color.GREEN}↳ Ingrese la dirección IP (deje vacío si no aplica, 'auto' para tomarla de una subred): {Color.END}").strip()
         if not ip:
             return None
         
         try:
-            validar_ip(ip, dispositivos)
+            if ip.lower() == 'auto':
+                ip = seleccionar_ip_libre(dispositivos)
+                mostrar_mensaje(f"IP asignada: {ip}", "info")
+            validar_ip(ip, dispositivos, excluir)
             return ip
         except ValueError as e:
             mostrar_mensaje(f"❌ Error en la IP: {e}", "error")
@@ -289,6 +4962,7 @@ def ingresar_ip(dispositivos):
             print(f"- {Color.CYAN}172.16.0.1{Color.END} (privada clase B)")
             print(f"- {Color.CYAN}8.8.8.8{Color.END} (DNS público de Google)")
 
+@medir('menú: agregar dispositivo')
 def agregar_dispositivo_interactivo(dispositivos):
     mostrar_titulo("AGREGAR NUEVO DISPOSITIVO")
     
@@ -309,17 +4983,17 @@ def agregar_dispositivo_interactivo(dispositivos):
     try:
         ip = ingresar_ip(dispositivos)
     except ValueError as e:
-        mostrar_mensaje(f"No se puede crear el dispositivo: {str(e)}", "error")
+        avisar(f"No se puede crear el dispositivo: {str(e)}", "error")
         return None
     
     # Seleccionar capa (solo para algunos dispositivos)
     capa = None
-    if tipo in [TIPOS_DISPOSITIVO['ROUTER'], TIPOS_DISPOSITIVO['SWITCH']]:
+    if tipo in TIPOS_CON_CAPA:
         capa = seleccionar_opcion(CAPAS_RED, "📌 Seleccione la capa de red:")
     
     # Seleccionar servicios
     servicios = []
-    if tipo in [TIPOS_DISPOSITIVO['SERVIDOR'], TIPOS_DISPOSITIVO['ROUTER'], TIPOS_DISPOSITIVO['FIREWALL']]:
+    if tipo in TIPOS_CON_SERVICIOS:
         print(f"\n{Color.BOLD}🛠️ Agregar servicios (ingrese 0 cuando termine):{Color.END}")
         while True:
             servicio = seleccionar_opcion(SERVICIOS_VALIDOS, "Seleccione un servicio:")
@@ -338,249 +5012,656 @@ def agregar_dispositivo_interactivo(dispositivos):
     # Crear y retornar dispositivo
     return crear_dispositivo(tipo, nombre, ip, capa, servicios)
 
+@medir('menú: agregar/modificar IP')
 def agregar_ip_dispositivo(dispositivos):
     mostrar_titulo("AGREGAR/MODIFICAR IP DE DISPOSITIVO")
     if not dispositivos:
-        mostrar_mensaje("No hay dispositivos registrados", "advertencia")
-        sleep(2)
+        avisar("No hay dispositivos registrados", "advertencia")
         return
     
-    # Mostrar lista de dispositivos
-    dispositivos_validos = []
+    # Mostrar lista de dispositivos (la misma que se numera, aunque otro operador cambie el inventario)
+    disponibles = list(dispositivos)
     print(f"{Color.BOLD}📋 Dispositivos disponibles:{Color.END}")
+    for i, disp in enumerate(disponibles, 1):
+        print(f"{Color.YELLOW}{i}.{Color.END} {disp.nombre} - IP actual: {disp.ip or 'Sin IP'}")
+    
+    try:
+        num = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (1-{len(disponibles)}): {Color.END}")
+        num = int(num) - 1
+        if 0 <= num < len(disponibles):
+            disp = disponibles[num]
+            
+            # Pedir nueva IP con validación
+            try:
+                nueva_ip = ingresar_ip(dispositivos, excluir=disp)
+            except ValueError as e:
+                avisar(f"No se puede modificar la IP: {str(e)}", "error")
+                return
+            
+            # Actualizar el dispositivo
+            try:
+                if nueva_ip:
+                    mensaje = f"IP actualizada a {nueva_ip}" if disp.ip else f"IP {nueva_ip} agregada al dispositivo"
+                    dispositivos.cambiar_ip(disp, nueva_ip)
+                    avisar(mensaje, "exito")
+                elif disp.ip:
+                    # Eliminar la IP si se dejó vacío
+                    dispositivos.cambiar_ip(disp, None)
+                    avisar("IP eliminada del dispositivo", "exito")
+            except ValueError as e:
+                avisar(f"No se puede modificar la IP: {str(e)}", "error")
+        else:
+            avisar("Número de dispositivo inválido", "error")
+    except ValueError:
+        avisar("Entrada inválida. Debe ingresar un número.", "error")
+
+# ✏️ Función para renombrar dispositivos
+@medir('menú: renombrar dispositivo')
+def renombrar_dispositivo(dispositivos):
+    mostrar_titulo("RENOMBRAR DISPOSITIVO")
+    if not dispositivos:
+        avisar("No hay dispositivos registrados", "advertencia")
+        return
+    
+    texto = input(f"{Color.GREEN}↳ Nombre del dispositivo a renombrar: {Color.END}").strip()
+    candidatos = dispositivos.buscar_nombres(texto, LIMITE_BUSQUEDA)
+    if not candidatos:
+        avisar("No se encontraron dispositivos con ese nombre", "advertencia")
+        return
+    
+    disp = candidatos[0]
+    if disp.nombre.lower() != texto.lower():
+        # Sin coincidencia exacta: elegir entre los nombres más parecidos
+        print(f"\n{Color.BOLD}📋 Dispositivos parecidos:{Color.END}")
+        for i, candidato in enumerate(candidatos, 1):
+            print(f"{Color.YELLOW}{i}.{Color.END} {candidato.nombre}")
+        try:
+            num = int(input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (1-{len(candidatos)}): {Color.END}")) - 1
+        except ValueError:
+            avisar("Entrada inválida. Debe ingresar un número.", "error")
+            return
+        if not 0 <= num < len(candidatos):
+            avisar("Número de dispositivo inválido", "error")
+            return
+        disp = candidatos[num]
+    
+    nuevo = input(f"{Color.GREEN}↳ Nuevo nombre para '{disp.nombre}': {Color.END}").strip()
+    try:
+        if nuevo.lower() != disp.nombre.lower():
+            validar_nombre(nuevo, dispositivos)
+        anterior = disp.nombre
+        dispositivos.renombrar(disp, nuevo)
+        avisar(f"'{anterior}' ahora se llama '{nuevo}'", "exito")
+    except ValueError as e:
+        avisar(f"No se puede renombrar: {str(e)}", "error")
+
+# 📋 Función para mostrar dispositivos
+class VistaPaginada:
+    """Genera solo la página visible y la guarda hasta que cambia el inventario"""
+
+    def __init__(self, dispositivos, inventario=None, por_pagina=10, modo='detalle'):
+        self.dispositivos = dispositivos
+        self.inventario = inventario if inventario is not None else (dispositivos if isinstance(dispositivos, Inventario) else None)
+        self.por_pagina = por_pagina
+        self.modo = modo
+        self._cache = {}
+        self._version = None
+
+    @property
+    def total_paginas(self):
+        return max(1, -(-len(self.dispositivos) // self.por_pagina))
+
+    def _vigente(self):
+        version = self.inventario.version if self.inventario is not None else None
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+
+    def pagina(self, numero):
+        self._vigente()
+        clave = (self.modo, numero)
+        if clave not in self._cache:
+            inicio = (numero - 1) * self.por_pagina
+            fin = min(inicio + self.por_pagina, len(self.dispositivos))
+            filas = self.dispositivos[inicio:fin]
+            if self.modo == 'tabla':
+                self._cache[clave] = self._tabla(filas, inicio)
+            else:
+                self._cache[clave] = self._detalle(filas, inicio)
+        return self._cache[clave]
+
+    @staticmethod
+    def _detalle(filas, inicio):
+        bloques = []
+        for i, disp in enumerate(filas, inicio + 1):
+            bloques.append(f"{Color.YELLOW}{i}.{Color.END}\nNombre: {disp.nombre}\n{formatear_dispositivo(disp)}\n")
+        return '\n'.join(bloques)
+
+    @staticmethod
+    def _tabla(filas, inicio):
+        lineas = [f"{Color.BOLD}{'#':>6}  {'NOMBRE':<30} {'TIPO':<10} {'IP':<15} {'CAPA':<12} SERVICIOS{Color.END}"]
+        for i, disp in enumerate(filas, inicio + 1):
+            servicios = ','.join(clave_catalogo(SERVICIOS_VALIDOS, s) for s in disp.servicios) or '-'
+            lineas.append(f"{Color.YELLOW}{i:>6}{Color.END}  {disp.nombre:<30} {clave_catalogo(TIPOS_DISPOSITIVO, disp.tipo):<10} "
+                          f"{disp.ip or '-':<15} {clave_catalogo(CAPAS_RED, disp.capa) or '-':<12} {servicios}")
+        return '\n'.join(lineas)
+
+@medir('menú: mostrar dispositivos')
+def mostrar_dispositivos(dispositivos, titulo="LISTADO DE DISPOSITIVOS", inventario=None):
+    if not dispositivos:
+        mostrar_titulo(titulo)
+        mostrar_mensaje("No hay dispositivos registrados", "advertencia")
+        input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+        return
+    
+    vista = VistaPaginada(dispositivos, inventario)
+    actual = 1
+    while True:
+        mostrar_titulo(titulo)
+        actual = min(actual, vista.total_paginas)
+        print(vista.pagina(actual))
+        print(f"\n{Color.BLUE}{'═' * 60}{Color.END}")
+        print(f"Página {actual}/{vista.total_paginas} - {len(dispositivos)} dispositivos (vista {vista.modo})")
+        comando = input(f"{Color.GREEN}↳ [Enter] siguiente, [a] anterior, [número] ir a página, [t] tabla/detalle, [q] salir: {Color.END}").strip().lower()
+        
+        if comando == 'q':
+            return
+        elif comando == 'a':
+            actual = max(1, actual - 1)
+        elif comando == 't':
+            vista.modo = 'detalle' if vista.modo == 'tabla' else 'tabla'
+            vista.por_pagina = 10 if vista.modo == 'detalle' else 40
+            actual = 1
+        elif comando.isdigit():
+            actual = min(max(1, int(comando)), vista.total_paginas)
+        elif not comando:
+            if actual == vista.total_paginas:
+                return
+            actual += 1
+
+# 🔍 Función para buscar dispositivos
+LIMITE_BUSQUEDA = 20
+
+@medir('menú: buscar dispositivo')
+def buscar_dispositivo(dispositivos):
+    mostrar_titulo("BUSCAR DISPOSITIVO")
+    if not dispositivos:
+        avisar("No hay dispositivos registrados", "advertencia")
+        return
+    
+    nombre = input(f"{Color.GREEN}↳ Ingrese el nombre del dispositivo a buscar: {Color.END}")
+    # Primero la coincidencia exacta y los prefijos; si no alcanzan, nombres parecidos
+    encontrados = dispositivos.buscar_nombres(nombre, LIMITE_BUSQUEDA)
+    
+    if encontrados:
+        mostrar_dispositivos(encontrados, "RESULTADOS DE LA BÚSQUEDA", dispositivos)
+    else:
+        avisar("No se encontraron dispositivos con ese nombre", "advertencia")
+
+# 🧭 Función para filtrar por tipo, capa y servicio
+@medir('menú: filtrar dispositivos')
+def filtrar_dispositivos(dispositivos):
+    mostrar_titulo("FILTRAR DISPOSITIVOS")
+    if not dispositivos:
+        avisar("No hay dispositivos registrados", "advertencia")
+        return
+    
+    cualquiera = {'TODOS': '✳️ Cualquiera'}
+    tipo = seleccionar_opcion({**cualquiera, **TIPOS_DISPOSITIVO}, "📌 Tipo de dispositivo:")
+    capa = seleccionar_opcion({**cualquiera, **CAPAS_RED}, "📌 Capa de red:")
+    servicio = seleccionar_opcion({**cualquiera, **SERVICIOS_VALIDOS}, "📌 Servicio:")
+    salud = seleccionar_opcion({**cualquiera, **{estado: estado for estado in ESTADOS_SALUD}}, "📌 Salud (última revisión):")
+    
+    encontrados = dispositivos.filtrar(
+        tipo=None if tipo == cualquiera['TODOS'] else tipo,
+        capa=None if capa == cualquiera['TODOS'] else capa,
+        servicio=None if servicio == cualquiera['TODOS'] else servicio,
+        salud=None if salud == cualquiera['TODOS'] else salud
+    )
+    
+    if encontrados:
+        mostrar_dispositivos(encontrados, "RESULTADOS DEL FILTRO", dispositivos)
+    else:
+        avisar("Ningún dispositivo cumple los criterios", "advertencia")
+
+# 🧩 Función para administrar subredes
+@medir('menú: subredes')
+def administrar_subredes(dispositivos):
+    subredes = dispositivos.subredes
+    if subredes is None:
+        avisar("Este inventario no tiene subredes disponibles", "advertencia")
+        return
+    while True:
+        mostrar_titulo("SUBREDES Y DIRECCIONES LIBRES")
+        if not len(subredes):
+            mostrar_mensaje("No hay subredes registradas", "advertencia")
+        else:
+            for subred in subredes:
+                usadas, total, porcentaje = subred.utilizacion()
+                siguiente = subred.siguiente_libre() or "llena"
+                print(f"{Color.YELLOW}•{Color.END} {Color.BOLD}{subred}{Color.END}: {usadas}/{total} en uso ({porcentaje:.1f}%) - siguiente libre: {siguiente}")
+        
+        print(f"\n{Color.YELLOW}1.{Color.END} Agregar subred")
+        print(f"{Color.YELLOW}2.{Color.END} Ver direcciones libres")
+        print(f"{Color.YELLOW}3.{Color.END} Eliminar subred")
+        print(f"{Color.YELLOW}4.{Color.END} Volver")
+        opcion = input(f"\n{Color.GREEN}↳ Seleccione una opción (1-4): {Color.END}").strip()
+        
+        try:
+            if opcion == "1":
+                cidr = input(f"{Color.GREEN}↳ Subred en formato CIDR (ej. 192.172.10.0/24): {Color.END}").strip()
+                subredes.agregar(cidr)
+                avisar(f"Subred {cidr} agregada", "exito")
+            elif opcion == "2":
+                cidr = input(f"{Color.GREEN}↳ Subred: {Color.END}").strip()
+                cantidad = int(input(f"{Color.GREEN}↳ ¿Cuántas direcciones? {Color.END}").strip() or 10)
+                print(', '.join(subredes.obtener(cidr).libres(cantidad)) or "Sin direcciones libres")
+                input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+                continue
+            elif opcion == "3":
+                cidr = input(f"{Color.GREEN}↳ Subred a eliminar: {Color.END}").strip()
+                subredes.eliminar(cidr)
+                avisar(f"Subred {cidr} eliminada", "exito")
+            elif opcion == "4":
+                return
+            else:
+                avisar("Opción inválida. Por favor seleccione 1-4", "error")
+        except ValueError as e:
+            avisar(str(e), "error")
+
+# 🕸️ Función para administrar la topología
+@medir('menú: topología')
+def administrar_topologia(dispositivos):
+    topologia = dispositivos.topologia
+    if topologia is None:
+        avisar("Este inventario no tiene topología disponible", "advertencia")
+        return
+    while True:
+        mostrar_titulo("TOPOLOGÍA DE RED")
+        if not len(topologia):
+            mostrar_mensaje("No hay enlaces registrados", "advertencia")
+        else:
+            print(f"{Color.BOLD}{len(topologia)}{Color.END} enlaces registrados")
+        
+        print(f"\n{Color.YELLOW}1.{Color.END} Enlazar dispositivos")
+        print(f"{Color.YELLOW}2.{Color.END} Quitar enlace")
+        print(f"{Color.YELLOW}3.{Color.END} Ver enlaces de un dispositivo")
+        print(f"{Color.YELLOW}4.{Color.END} Radio de impacto si un dispositivo cae")
+        print(f"{Color.YELLOW}5.{Color.END} Ruta entre dispositivos")
+        print(f"{Color.YELLOW}6.{Color.END} Validar topología")
+        print(f"{Color.YELLOW}7.{Color.END} Volver")
+        opcion = input(f"\n{Color.GREEN}↳ Seleccione una opción (1-7): {Color.END}").strip()
+        
+        try:
+            if opcion == "1":
+                origen = input(f"{Color.GREEN}↳ Dispositivo de capa inferior (o extremo de la troncal): {Color.END}").strip()
+                destino = input(f"{Color.GREEN}↳ Dispositivo del que cuelga (o el otro extremo): {Color.END}").strip()
+                tipo = 'troncal' if input(f"{Color.GREEN}¿Es una troncal entre pares? (s/n): {Color.END}").lower() == 's' else 'uplink'
+                topologia.enlazar(origen, destino, tipo)
+                avisar(f"Enlace {origen} - {destino} agregado", "exito")
+            elif opcion == "2":
+                origen = input(f"{Color.GREEN}↳ Un extremo: {Color.END}").strip()
+                destino = input(f"{Color.GREEN}↳ El otro extremo: {Color.END}").strip()
+                topologia.desenlazar(origen, destino)
+                avisar(f"Enlace {origen} - {destino} eliminado", "exito")
+            elif opcion == "3":
+                nombre = input(f"{Color.GREEN}↳ Dispositivo: {Color.END}").strip()
+                for origen, destino, tipo in topologia.enlaces(nombre):
+                    print(f"{Color.YELLOW}•{Color.END} {origen} {'⇅' if tipo == 'troncal' else '→'} {destino} ({tipo})")
+                input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+                continue
+            elif opcion == "4":
+                nombre = input(f"{Color.GREEN}↳ Dispositivo: {Color.END}").strip()
+                afectados = topologia.radio_impacto(nombre)
+                for capa, (directos, dependientes) in topologia.abanico(nombre).items():
+                    print(f"{Color.YELLOW}•{Color.END} {capa or '💻 Equipos finales'}: {directos} colgados directamente, {dependientes} sin otra subida")
+                print(f"\n{Color.BOLD}{len(afectados)}{Color.END} dispositivos se quedarían sin camino al núcleo: {', '.join(afectados[:20]) or 'ninguno'}"
+                      f"{'...' if len(afectados) > 20 else ''}")
+                input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+                continue
+            elif opcion == "5":
+                origen = input(f"{Color.GREEN}↳ Desde: {Color.END}").strip()
+                destino = input(f"{Color.GREEN}↳ Hasta (vacío para el núcleo): {Color.END}").strip()
+                ruta = topologia.ruta(origen, destino) if destino else topologia.ruta_al_nucleo(origen)
+                print(' → '.join(ruta) if ruta else "No hay camino")
+                input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+                continue
+            elif opcion == "6":
+                problemas = topologia.validar()
+                for problema in problemas:
+                    print(f"{Color.RED}•{Color.END} {problema}")
+                mostrar_mensaje(f"{len(problemas)} problemas encontrados", "advertencia" if problemas else "exito")
+                input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+                continue
+            elif opcion == "7":
+                return
+            else:
+                avisar("Opción inválida. Por favor seleccione 1-7", "error")
+        except ValueError as e:
+            avisar(str(e), "error")
+
+# 🕰️ Función para el historial de versiones
+def administrar_historial(dispositivos):
+    historial = dispositivos.historial
+    if historial is None:
+        avisar("Este inventario no tiene historial de versiones", "advertencia")
+        return
+    while True:
+        mostrar_titulo("HISTORIAL Y DESHACER")
+        versiones = historial.versiones()
+        deshacer, rehacer = historial.pendientes()
+        print(f"{Color.BOLD}{len(versiones)}{Color.END} versiones guardadas; {deshacer} acciones para deshacer y {rehacer} para rehacer")
+        
+        print(f"\n{Color.YELLOW}1.{Color.END} Deshacer la última acción")
+        print(f"{Color.YELLOW}2.{Color.END} Rehacer")
+        print(f"{Color.YELLOW}3.{Color.END} Ver versiones guardadas")
+        print(f"{Color.YELLOW}4.{Color.END} Ver el inventario en una versión o fecha")
+        print(f"{Color.YELLOW}5.{Color.END} Diferencias entre versiones")
+        print(f"{Color.YELLOW}6.{Color.END} Volver")
+        opcion = input(f"\n{Color.GREEN}↳ Seleccione una opción (1-6): {Color.END}").strip()
+        
+        try:
+            if opcion in ("1", "2"):
+                cambios = historial.deshacer() if opcion == "1" else historial.rehacer()
+                avisar(f"{'Deshecha' if opcion == '1' else 'Rehecha'} la acción: {len(cambios)} dispositivos cambiados", "exito")
+            elif opcion == "3":
+                for numero, fecha, mapa, cambios in versiones[-20:]:
+                    print(f"{Color.YELLOW}{numero:>4}.{Color.END} {fecha}  {len(mapa)} dispositivos, {cambios} cambios")
+                if not versiones:
+                    mostrar_mensaje("Todavía no hay versiones: se crean al guardar", "advertencia")
+                input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+            elif opcion == "4":
+                texto = input(f"{Color.GREEN}↳ Número de versión o fecha (AAAA-MM-DD [HH:MM]): {Color.END}").strip()
+                numero, fecha, mapa, _ = historial.version(int(texto)) if texto.isdigit() else historial.version(fecha=texto)
+                mostrar_dispositivos([dispositivo_desde_dict(registro) for _, registro in sorted(mapa)],
+                                     f"INVENTARIO EN LA VERSIÓN {numero} ({fecha})")
+            elif opcion == "5":
+                desde = input(f"{Color.GREEN}↳ Desde la versión: {Color.END}").strip()
+                hasta = input(f"{Color.GREEN}↳ Hasta la versión (vacío para el estado actual): {Color.END}").strip()
+                if not desde.isdigit() or (hasta and not hasta.isdigit()):
+                    raise ValueError("Las versiones se indican por su número")
+                cambios = historial.diferencias(int(desde), int(hasta) if hasta else None)
+                for cambio in cambios[:50]:
+                    print(texto_diferencia(*cambio))
+                if len(cambios) > 50:
+                    print(f"... y {len(cambios) - 50} más")
+                mostrar_mensaje(f"{len(cambios)} dispositivos distintos", "info")
+                input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+            elif opcion == "6":
+                return
+            else:
+                avisar("Opción inválida. Por favor seleccione 1-6", "error")
+        except ValueError as e:
+            avisar(str(e), "error")
+
+# 🩺 Función para revisar alcance y servicios
+@medir('menú: revisar salud')
+def revisar_salud_interactivo(dispositivos):
+    mostrar_titulo("REVISAR ALCANCE Y SERVICIOS")
+    con_ip = [disp for disp in dispositivos if disp.ip]
+    if not con_ip:
+        avisar("No hay dispositivos con IP para revisar", "advertencia")
+        return
+    
+    print(f"Se probarán {len(con_ip)} dispositivos con conexiones TCP a los puertos de sus servicios...")
+    inicio = perf_counter()
+    resultados = revisar_salud(con_ip)
+    with agrupar_cambios(dispositivos):
+        for disp, salud in resultados:
+            dispositivos.registrar_salud(disp, salud)
+    
+    caidos = [(disp, salud) for disp, salud in resultados if salud['estado'] != SALUD_ACTIVO]
+    for disp, salud in caidos:
+        print(f"{Color.RED}🔴 {disp.nombre} ({disp.ip}){Color.END}")
+    for disp, salud in resultados:
+        servicios_caidos = [servicio for servicio, datos in salud['servicios'].items() if datos['estado'] == SALUD_CAIDO]
+        if salud['estado'] == SALUD_ACTIVO and servicios_caidos:
+            print(f"{Color.YELLOW}🟡 {disp.nombre} ({disp.ip}): sin respuesta de {', '.join(servicios_caidos)}{Color.END}")
+    print()
+    mostrar_mensaje(f"{len(resultados)} dispositivos revisados en {perf_counter() - inicio:.1f} s: "
+                    f"{len(resultados) - len(caidos)} activos, {len(caidos)} caídos", "exito")
+    input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+
+# 📈 Función para ver las estadísticas de rendimiento
+def mostrar_estadisticas():
+    mostrar_titulo("ESTADÍSTICAS DE RENDIMIENTO")
+    if not INSTRUMENTACION['activa']:
+        mostrar_mensaje("La instrumentación está desactivada (P1_PERFIL=1 o --perfil)", "advertencia")
+        if input(f"{Color.GREEN}¿Activarla ahora? (s/n): {Color.END}").lower() == 's':
+            INSTRUMENTACION['activa'] = True
+            avisar("Instrumentación activada", "exito")
+        return
+    
+    resumen = resumen_estadisticas()
+    if not resumen:
+        mostrar_mensaje("Todavía no hay mediciones", "info")
+    else:
+        print(f"{Color.BOLD}{'OPERACIÓN':<34} {'LLAMADAS':>8} {'TOTAL ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}{Color.END}")
+        for etiqueta, datos in resumen.items():
+            print(f"{etiqueta[:34]:<34} {datos['llamadas']:>8} {datos['total_ms']:>10.1f} "
+                  f"{datos['p50_ms']:>8.2f} {datos['p95_ms']:>8.2f} {datos['p99_ms']:>8.2f}")
+    if INSTRUMENTACION['cprofile']:
+        print(f"\n{Color.CYAN}cProfile activo para: {INSTRUMENTACION['cprofile']}{Color.END}")
+    input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+
+# 📥 Función para importar volcados de texto
+@medir('menú: importar inventario')
+def importar_inventario_interactivo(dispositivos):
+    mostrar_titulo("IMPORTAR INVENTARIO DESDE TEXTO")
+    entrada = input(f"{Color.GREEN}↳ Archivos a importar separados por coma (vacío = todos los .txt): {Color.END}").strip()
+    if entrada:
+        archivos = [archivo.strip() for archivo in entrada.split(',') if archivo.strip()]
+    else:
+        archivos = sorted(archivo for archivo in os.listdir('.') if archivo.endswith('.txt'))
     
-    for i, disp in enumerate(dispositivos, 1):
-        try:
-            lineas = [linea.strip() for linea in disp.split('\n') if linea.strip()]
-            nombre_linea = next((linea for linea in lineas if "NOMBRE:" in linea), None)
-            ip_linea = next((linea for linea in lineas if "IP:" in linea), None)
-            
-            if nombre_linea:
-                nombre = nombre_linea.split("NOMBRE:")[1].strip()
-                ip_actual = ip_linea.split("IP:")[1].strip() if ip_linea else "Sin IP"
-                print(f"{Color.YELLOW}{i}.{Color.END} {nombre} - IP actual: {ip_actual}")
-                dispositivos_validos.append(disp)
-        except:
-            continue
+    faltantes = [archivo for archivo in archivos if not os.path.exists(archivo)]
+    if not archivos or faltantes:
+        avisar(f"No se encontraron los archivos: {', '.join(faltantes) or 'ninguno'}", "error")
+        return
     
-    if not dispositivos_validos:
-        mostrar_mensaje("No hay dispositivos válidos para modificar", "error")
-        sleep(2)
+    if input(f"{Color.GREEN}¿Reconciliar las fuentes con el inventario (duplicados y choques de nombre o IP)? (s/n): {Color.END}").lower() == 's':
+        reconciliar_interactivo(dispositivos, archivos)
         return
     
     try:
-        num = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (1-{len(dispositivos_validos)}): {Color.END}")
-        num = int(num) - 1
-        if 0 <= num < len(dispositivos_validos):
-            # Obtener el índice real en la lista original
-            disp_real = dispositivos_validos[num]
-            idx_real = dispositivos.index(disp_real)
-            
-            # Pedir nueva IP con validación
-            try:
-                nueva_ip = ingresar_ip([d for i, d in enumerate(dispositivos) if i != idx_real])
-            except ValueError as e:
-                mostrar_mensaje(f"No se puede modificar la IP: {str(e)}", "error")
-                sleep(2)
-                return
-            
-            # Actualizar el dispositivo
-            disp_lines = [linea.strip() for linea in dispositivos[idx_real].split('\n') if linea.strip()]
-            ip_line = next((i for i, line in enumerate(disp_lines) if "IP:" in line), None)
-            
-            if ip_line is not None:
-                # Modificar IP existente
-                if nueva_ip:
-                    disp_lines[ip_line] = f"{Color.CYAN}🌍 {Color.BOLD}IP:{Color.END} {nueva_ip}"
-                    mostrar_mensaje(f"IP actualizada a {nueva_ip}", "exito")
-                else:
-                    # Eliminar la IP si se dejó vacío
-                    disp_lines.pop(ip_line)
-                    mostrar_mensaje("IP eliminada del dispositivo", "exito")
-            elif nueva_ip:
-                # Insertar nueva IP antes del separador final
-                disp_lines.insert(-1, f"{Color.CYAN}🌍 {Color.BOLD}IP:{Color.END} {nueva_ip}")
-                mostrar_mensaje(f"IP {nueva_ip} agregada al dispositivo", "exito")
-            
-            dispositivos[idx_real] = "\n".join(disp_lines)
-            sleep(2)
-        else:
-            mostrar_mensaje("Número de dispositivo inválido", "error")
-            sleep(2)
-    except ValueError:
-        mostrar_mensaje("Entrada inválida. Debe ingresar un número.", "error")
-        sleep(2)
-
-# 📋 Función para mostrar dispositivos
-def mostrar_dispositivos(dispositivos, titulo="LISTADO DE DISPOSITIVOS"):
-    mostrar_titulo(titulo)
-    if not dispositivos:
-        mostrar_mensaje("No hay dispositivos registrados", "advertencia")
-        input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+        informe = importar_inventario_texto(archivos, dispositivos)
+    except (OSError, ValueError) as e:
+        avisar(f"Error al importar: {str(e)}", "error")
         return
     
-    for i, disp in enumerate(dispositivos, 1):
-        print(f"{Color.YELLOW}{i}.{Color.END}")
-        # Extraer nombre de manera segura para el encabezado
-        lineas = [linea.strip() for linea in disp.split('\n') if linea.strip()]
-        nombre_linea = next((linea for linea in lineas if "NOMBRE:" in linea), None)
-        if nombre_linea:
-            partes_nombre = [parte.strip() for parte in nombre_linea.split(':') if parte.strip()]
-            if len(partes_nombre) >= 2:
-                print(f"Nombre: {partes_nombre[1]}")
-        
-        print(disp)
-        print()
-    
+    formatos = ', '.join(f"{formato}: {cantidad}" for formato, cantidad in informe['formatos'].items())
+    print(f"{Color.BOLD}📄 Bloques por formato:{Color.END} {formatos or 'ninguno'}")
+    for aviso in informe['avisos']:
+        print(f"{Color.YELLOW}⚠️ {aviso}{Color.END}")
+    for origen, nombre, motivo in informe['rechazados']:
+        print(f"{Color.RED}❌ {origen} {nombre}: {motivo}{Color.END}")
+    print()
+    mostrar_mensaje(f"{len(informe['importados'])} dispositivos importados, {len(informe['rechazados'])} rechazados", "exito")
     input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
 
-# 🔍 Función para buscar dispositivos
-def buscar_dispositivo(dispositivos):
-    mostrar_titulo("BUSCAR DISPOSITIVO")
-    if not dispositivos:
-        mostrar_mensaje("No hay dispositivos registrados", "advertencia")
-        sleep(2)
+def decidir_conflicto(conflicto):
+    """Pregunta qué candidato de un conflicto pendiente se queda; None para dejarlo en espera"""
+    sujeto = f"el nombre '{conflicto['clave']}'" if conflicto['tipo'] == 'nombre' else f"la IP {conflicto['clave']}"
+    print(f"\n{Color.BOLD}⚖️ Conflicto por {sujeto}:{Color.END}")
+    for i, candidato in enumerate(conflicto['candidatos'], 1):
+        servicios = ', '.join(candidato['SERVICIOS']) or '-'
+        print(f"{Color.YELLOW}{i}.{Color.END} {candidato['NOMBRE']} | {candidato['TIPO']} | {candidato['IP'] or '-'} | "
+              f"{candidato['CAPA'] or '-'} | {servicios} ({candidato['origen']}, {candidato['fecha'] or 'sin fecha'})")
+    opcion = input(f"{Color.GREEN}↳ ¿Cuál se queda? (1-2, vacío para dejarlo pendiente): {Color.END}").strip()
+    return int(opcion) - 1 if opcion in ('1', '2') else None
+
+def decidir_cambio_externo(clave, local, archivo):
+    """Pregunta qué versión de un registro cambiado en la sesión y en el archivo se queda"""
+    print(f"\n{Color.BOLD}⚖️ '{clave}' cambió en esta sesión y también en el archivo:{Color.END}")
+    for i, (origen, registro) in enumerate((("esta sesión", local), ("el archivo", archivo)), 1):
+        if registro is None:
+            print(f"{Color.YELLOW}{i}.{Color.END} eliminado ({origen})")
+        else:
+            print(f"{Color.YELLOW}{i}.{Color.END} {registro['NOMBRE']} | {registro['TIPO']} | {registro.get('IP') or '-'} | "
+                  f"{registro.get('CAPA') or '-'} | {registro.get('SERVICIOS') or '-'} ({origen}, {registro.get('ultima_modificacion') or 'sin fecha'})")
+    opcion = input(f"{Color.GREEN}↳ ¿Cuál se queda? (1-2, vacío conserva el de esta sesión): {Color.END}").strip()
+    return opcion == '2'
+
+def revisar_cambios_externos(dispositivos):
+    vigilante = getattr(dispositivos, 'vigilante', None)
+    if vigilante is None or not vigilante.cambiado():
+        return
+    try:
+        informe = vigilante.revisar(decidir_cambio_externo)
+    except (OSError, ValueError) as e:
+        # Por ejemplo, un editor a medio guardar: se vuelve a intentar en la próxima acción
+        avisar(f"El archivo cambió pero no se pudo leer: {str(e)}", "advertencia")
+        return
+    if informe is None:
+        return
+    for clave, motivo in informe['rechazados']:
+        avisar(f"No se aplicó el cambio externo de '{clave}': {motivo}", "advertencia")
+    if informe['aplicados'] or informe['conflictos']:
+        avisar(f"El archivo cambió fuera de esta sesión: {informe['aplicados']} dispositivos actualizados, "
+               f"{len(informe['conflictos'])} conflictos resueltos", "info")
+
+def reconciliar_interactivo(dispositivos, archivos):
+    politicas = {'reciente': "🕒 Gana el dato más reciente", 'prioridad': "🥇 Gana la fuente listada primero",
+                 'manual': "✋ Decidir cada conflicto a mano"}
+    elegida = seleccionar_opcion(politicas, "⚖️ Política para los conflictos:")
+    politica = next(clave for clave, texto in politicas.items() if texto == elegida)
+    try:
+        reconciliacion, _ = reconciliar_fuentes(archivos, dispositivos, politica, simular=True)
+    except (OSError, ValueError) as e:
+        avisar(f"Error al reconciliar: {str(e)}", "error")
         return
     
-    nombre = input(f"{Color.GREEN}↳ Ingrese el nombre del dispositivo a buscar: {Color.END}")
-    encontrados = []
-    
-    for d in dispositivos:
-        try:
-            lineas = [linea.strip() for linea in d.split('\n') if linea.strip()]
-            nombre_linea = next((linea for linea in lineas if "NOMBRE:" in linea), None)
-            if nombre_linea:
-                partes_nombre = [parte.strip() for parte in nombre_linea.split(':') if parte.strip()]
-                if len(partes_nombre) >= 2 and nombre.lower() in partes_nombre[1].lower():
-                    encontrados.append(d)
-        except:
-            continue
+    informe = reconciliacion.informe()
+    for conflicto in informe['conflictos'][:50]:
+        print(f"{Color.YELLOW}⚠️ {texto_conflicto(conflicto)}{Color.END}")
+    if len(informe['conflictos']) > 50:
+        print(f"... y {len(informe['conflictos']) - 50} conflictos más")
+    for rechazado in informe['rechazados']:
+        print(f"{Color.RED}❌ {rechazado['origen']} {rechazado['nombre']}: {rechazado['motivo']}{Color.END}")
+    print(f"\n{Color.BOLD}{informe['leidos']}{Color.END} registros, {informe['duplicados']} duplicados, "
+          f"{len(informe['conflictos'])} conflictos, {len(informe['rechazados'])} rechazados")
+    if input(f"{Color.GREEN}¿Aplicar la reconciliación al inventario? (s/n): {Color.END}").lower() != 's':
+        avisar("Reconciliación cancelada", "advertencia")
+        return
     
-    if encontrados:
-        mostrar_dispositivos(encontrados, "RESULTADOS DE LA BÚSQUEDA")
-    else:
-        mostrar_mensaje("No se encontraron dispositivos con ese nombre", "advertencia")
-        sleep(2)
+    try:
+        reconciliacion, cambiados = reconciliar_fuentes(archivos, dispositivos, politica, decidir=decidir_conflicto)
+    except (OSError, ValueError) as e:
+        avisar(f"Error al reconciliar: {str(e)}", "error")
+        return
+    pendientes = len(reconciliacion.pendientes)
+    avisar(f"{cambiados} dispositivos agregados o actualizados" + (f", {pendientes} conflictos quedaron pendientes" if pendientes else ""), "exito")
 
 # ➕ Función para agregar servicio
+@medir('menú: agregar servicio')
 def agregar_servicio_dispositivo(dispositivos):
     mostrar_titulo("AGREGAR SERVICIO A DISPOSITIVO")
     if not dispositivos:
-        mostrar_mensaje("No hay dispositivos registrados", "advertencia")
-        sleep(2)
+        avisar("No hay dispositivos registrados", "advertencia")
         return
     
+    disponibles = list(dispositivos)
     print(f"{Color.BOLD}📋 Dispositivos disponibles:{Color.END}")
-    dispositivos_validos = []
-    
-    for i, disp in enumerate(dispositivos, 1):
-        try:
-            lineas = [linea.strip() for linea in disp.split('\n') if linea.strip()]
-            nombre_linea = next((linea for linea in lineas if "NOMBRE:" in linea), None)
-            if nombre_linea:
-                partes_nombre = [parte.strip() for parte in nombre_linea.split(':') if parte.strip()]
-                if len(partes_nombre) >= 2:
-                    nombre = partes_nombre[1]
-                    print(f"{Color.YELLOW}{i}.{Color.END} {nombre}")
-                    dispositivos_validos.append(disp)
-        except:
-            continue
-    
-    if not dispositivos_validos:
-        mostrar_mensaje("No hay dispositivos válidos para modificar", "error")
-        sleep(2)
-        return
+    for i, disp in enumerate(disponibles, 1):
+        print(f"{Color.YELLOW}{i}.{Color.END} {disp.nombre}")
     
     try:
-        num = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (1-{len(dispositivos_validos)}): {Color.END}")
+        num = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (1-{len(disponibles)}): {Color.END}")
         num = int(num) - 1
-        if 0 <= num < len(dispositivos_validos):
+        if 0 <= num < len(disponibles):
             servicio = seleccionar_opcion(SERVICIOS_VALIDOS, "Seleccione el servicio a agregar:")
             
-            # Encontrar el índice real en la lista original
-            disp_real = dispositivos_validos[num]
-            idx_real = dispositivos.index(disp_real)
-            
-            # Actualizar el dispositivo
-            disp_lines = [linea.strip() for linea in dispositivos[idx_real].split('\n') if linea.strip()]
-            servicio_line = next((i for i, line in enumerate(disp_lines) if "SERVICIOS:" in line), None)
-            
-            if servicio_line is not None:
-                servicios = disp_lines[servicio_line].split("SERVICIOS: ")[1] + " " + servicio
-                disp_lines[servicio_line] = f"{Color.CYAN}🛠️ {Color.BOLD}SERVICIOS:{Color.END} {servicios}"
-            else:
-                disp_lines.insert(-1, f"{Color.CYAN}🛠️ {Color.BOLD}SERVICIOS:{Color.END} {servicio}")
-            
-            dispositivos[idx_real] = "\n".join(disp_lines)
-            mostrar_mensaje("Servicio agregado exitosamente!", "exito")
-            sleep(2)
+            # Actualizar el dispositivo, con las mismas reglas por tipo que la línea de comandos
+            try:
+                campos_segun_tipo(disponibles[num].tipo, servicios=[servicio])
+                dispositivos.agregar_servicio(disponibles[num], servicio)
+                avisar("Servicio agregado exitosamente!", "exito")
+            except ValueError as e:
+                avisar(f"No se pudo agregar el servicio: {str(e)}", "error")
         else:
-            mostrar_mensaje("Número de dispositivo inválido", "error")
-            sleep(2)
+            avisar("Número de dispositivo inválido", "error")
     except ValueError:
-        mostrar_mensaje("Entrada inválida. Debe ingresar un número.", "error")
-        sleep(2)
+        avisar("Entrada inválida. Debe ingresar un número.", "error")
+
+# 🧰 Función para ediciones masivas
+@medir('menú: edición masiva')
+def editar_en_lote_interactivo(dispositivos):
+    mostrar_titulo("EDICIÓN MASIVA")
+    if not dispositivos:
+        avisar("No hay dispositivos registrados", "advertencia")
+        return
+    
+    acciones = {'add-service': "➕ Agregar un servicio", 'remove-service': "➖ Quitar un servicio",
+                'set-layer': "🧭 Mover a una capa", 'renumber': "🌐 Renumerar dentro de una subred"}
+    elegida = seleccionar_opcion(acciones, "🧰 Cambio a aplicar:")
+    accion = next(clave for clave, texto in acciones.items() if texto == elegida)
+    if accion in ('add-service', 'remove-service'):
+        valor = seleccionar_opcion(SERVICIOS_VALIDOS, "📌 Servicio:")
+    elif accion == 'set-layer':
+        valor = seleccionar_opcion(CAPAS_RED, "📌 Capa de destino:")
+    else:
+        valor = input(f"{Color.GREEN}↳ Subred en formato CIDR (ej. 192.172.10.0/24): {Color.END}").strip()
+    
+    cualquiera = {'TODOS': '✳️ Cualquiera'}
+    tipo = seleccionar_opcion({**cualquiera, **TIPOS_DISPOSITIVO}, "📌 Aplicar a los de tipo:")
+    capa = seleccionar_opcion({**cualquiera, **CAPAS_RED}, "📌 De la capa:")
+    servicio = seleccionar_opcion({**cualquiera, **SERVICIOS_VALIDOS}, "📌 Con el servicio:")
+    criterios = {'tipo': tipo, 'capa': capa, 'servicio': servicio}
+    criterios = {campo: None if criterio == cualquiera['TODOS'] else criterio for campo, criterio in criterios.items()}
+    
+    # Vista previa: nada cambia hasta confirmar
+    try:
+        cambios = dispositivos.editar_lote(accion, valor, simular=True, **criterios)
+    except ValueError as e:
+        avisar(f"No se puede aplicar el cambio: {str(e)}", "error")
+        return
+    if not cambios:
+        avisar("Ningún dispositivo necesita el cambio", "advertencia")
+        return
+    
+    print(f"\n{Color.BOLD}📋 {len(cambios)} dispositivos cambiarían:{Color.END}")
+    for disp, antes, despues in cambios[:LIMITE_BUSQUEDA]:
+        print(f"{Color.YELLOW}•{Color.END} {disp.nombre}: {texto_valor_lote(accion, antes)} → {texto_valor_lote(accion, despues)}")
+    if len(cambios) > LIMITE_BUSQUEDA:
+        print(f"  ... y {len(cambios) - LIMITE_BUSQUEDA} más")
+    if input(f"\n{Color.YELLOW}¿Aplicar los cambios? (s/n): {Color.END}").lower() != 's':
+        avisar("Edición cancelada", "info")
+        return
+    try:
+        cambios = dispositivos.editar_lote(accion, valor, **criterios)
+        avisar(f"{len(cambios)} dispositivos modificados", "exito")
+    except ValueError as e:
+        avisar(f"No se aplicó ningún cambio: {str(e)}", "error")
 
 # ❌ Función mejorada para eliminar dispositivo
+@medir('menú: eliminar dispositivo')
 def eliminar_dispositivo(dispositivos):
     mostrar_titulo("ELIMINAR DISPOSITIVO")
     if not dispositivos:
-        mostrar_mensaje("No hay dispositivos registrados", "advertencia")
-        sleep(2)
+        avisar("No hay dispositivos registrados", "advertencia")
         return
     
     while True:
         mostrar_titulo("SELECCIONE DISPOSITIVO A ELIMINAR")
         print(f"{Color.BOLD}📋 Dispositivos disponibles:{Color.END}\n")
         
-        dispositivos_validos = []
         # Mostrar lista numerada de dispositivos
-        for i, disp in enumerate(dispositivos, 1):
-            try:
-                # Extraer nombre del dispositivo de manera más segura
-                lineas = [linea.strip() for linea in disp.split('\n') if linea.strip()]
-                nombre_linea = next((linea for linea in lineas if "NOMBRE:" in linea), None)
-                
-                if nombre_linea:
-                    partes_nombre = [parte.strip() for parte in nombre_linea.split(':') if parte.strip()]
-                    if len(partes_nombre) >= 2:
-                        nombre = partes_nombre[1]
-                        print(f"{Color.YELLOW}{i}.{Color.END} {nombre}")
-                        dispositivos_validos.append(disp)
-                    else:
-                        print(f"{Color.YELLOW}{i}.{Color.END} Dispositivo con formato inválido (nombre no encontrado)")
-                else:
-                    print(f"{Color.YELLOW}{i}.{Color.END} Dispositivo sin nombre")
-            except Exception as e:
-                print(f"{Color.YELLOW}{i}.{Color.END} Dispositivo con formato inválido (error: {str(e)})")
-        
-        if not dispositivos_validos:
-            mostrar_mensaje("No hay dispositivos válidos para eliminar", "error")
-            sleep(2)
-            return
+        disponibles = list(dispositivos)
+        for i, disp in enumerate(disponibles, 1):
+            print(f"{Color.YELLOW}{i}.{Color.END} {disp.nombre or 'Dispositivo sin nombre'}")
         
         print(f"\n{Color.BLUE}{'═' * 60}{Color.END}")
         
         try:
-            opcion = input(f"\n{Color.GREEN}↳ Seleccione el dispositivo a eliminar (1-{len(dispositivos)}) o 0 para cancelar: {Color.END}").strip()
+            opcion = input(f"\n{Color.GREEN}↳ Seleccione el dispositivo a eliminar (1-{len(disponibles)}) o 0 para cancelar: {Color.END}").strip()
             
             if opcion == "0":
-                mostrar_mensaje("Operación cancelada", "info")
-                sleep(2)
+                avisar("Operación cancelada", "info")
                 return
             
             num = int(opcion) - 1
-            if 0 <= num < len(dispositivos):
-                # Obtener nombre del dispositivo seleccionado de manera segura
-                disp_seleccionado = dispositivos[num]
-                lineas = [linea.strip() for linea in disp_seleccionado.split('\n') if linea.strip()]
-                nombre_linea = next((linea for linea in lineas if "NOMBRE:" in linea), None)
-                
-                if nombre_linea:
-                    partes_nombre = [parte.strip() for parte in nombre_linea.split(':') if parte.strip()]
-                    nombre = partes_nombre[1] if len(partes_nombre) >= 2 else "dispositivo desconocido"
-                else:
-                    nombre = "dispositivo sin nombre"
+            if 0 <= num < len(disponibles):
+                nombre = disponibles[num].nombre or "dispositivo sin nombre"
                 
                 # Confirmación con estilo
                 print(f"\n{Color.RED}{'⚠' * 60}{Color.END}")
@@ -588,43 +5669,972 @@ def eliminar_dispositivo(dispositivos):
                 print(f"{Color.RED}{'⚠' * 60}{Color.END}")
                 
                 if confirmar == 'Y':
-                    eliminado = dispositivos.pop(num)
-                    mostrar_mensaje(f"Dispositivo '{nombre}' eliminado exitosamente", "exito")
-                    sleep(2)
+                    try:
+                        dispositivos.eliminar(disponibles[num])
+                        avisar(f"Dispositivo '{nombre}' eliminado exitosamente", "exito")
+                    except ValueError as e:
+                        avisar(f"No se pudo eliminar '{nombre}': {str(e)}", "error")
                     return
                 elif confirmar == 'N':
-                    mostrar_mensaje("Eliminación cancelada", "info")
-                    sleep(2)
+                    avisar("Eliminación cancelada", "info")
                     return
                 else:
-                    mostrar_mensaje("Opción inválida. Por favor ingrese Y o N", "error")
-                    sleep(2)
+                    avisar("Opción inválida. Por favor ingrese Y o N", "error")
             else:
-                mostrar_mensaje(f"Por favor ingrese un número entre 1 y {len(dispositivos)}", "error")
-                sleep(2)
+                avisar(f"Por favor ingrese un número entre 1 y {len(disponibles)}", "error")
         except ValueError:
-            mostrar_mensaje("Entrada inválida. Por favor ingrese un número.", "error")
-            sleep(2)
+            avisar("Entrada inválida. Por favor ingrese un número.", "error")
+
+# 🤖 Modo por lotes sin interfaz
+def _valor_catalogo(catalogo, equivalencias, valor, descripcion):
+    encontrado = normalizar_catalogo(catalogo, valor)
+    if encontrado not in catalogo.values():
+        encontrado = equivalencias.get(normalizar_texto(valor))
+    if encontrado is None:
+        raise ValueError(f"{descripcion} inválido: {valor} (opciones: {', '.join(catalogo)})")
+    return encontrado
+
+def _dispositivo_por_nombre(inventario, nombre):
+    disp = inventario.buscar_por_nombre(nombre)
+    if disp is None:
+        raise ValueError(f"No existe el dispositivo '{nombre}'")
+    return disp
+
+def _subredes(inventario):
+    if inventario.subredes is None:
+        raise ValueError("El inventario no tiene subredes cargadas")
+    return inventario.subredes
+
+def _topologia(inventario):
+    if inventario.topologia is None:
+        raise ValueError("El inventario no tiene topología cargada")
+    return inventario.topologia
+
+def _zonas(inventario):
+    if not isinstance(inventario, InventarioZonas):
+        raise ValueError("El inventario no está dividido en zonas (use un directorio .zonas)")
+    return inventario
+
+def _historial(inventario):
+    if inventario.historial is None:
+        raise ValueError("El inventario no tiene historial de versiones")
+    return inventario.historial
+
+def _puerto_servicio(texto):
+    """'WEB=8080' -> ('WEB', 8080)"""
+    servicio, _, puerto = texto.partition('=')
+    servicio = clave_catalogo(SERVICIOS_VALIDOS, _valor_catalogo(SERVICIOS_VALIDOS, EQUIVALENCIAS_SERVICIO, servicio, "Servicio"))
+    if not puerto.isdigit() or not 0 < int(puerto) < 65536:
+        raise ValueError(f"Puerto inválido en '{texto}' (use SERVICIO=PUERTO)")
+    return servicio, int(puerto)
+
+def _lista_puertos(texto):
+    try:
+        puertos = [int(puerto) for puerto in texto.split(',') if puerto.strip()]
+    except ValueError:
+        raise ValueError(f"Lista de puertos inválida: {texto}")
+    if not puertos or not all(0 < puerto < 65536 for puerto in puertos):
+        raise ValueError(f"Lista de puertos inválida: {texto}")
+    return puertos
+
+def _linea_dispositivo(disp):
+    return '\t'.join([disp.nombre, clave_catalogo(TIPOS_DISPOSITIVO, disp.tipo), disp.ip or '-',
+                      clave_catalogo(CAPAS_RED, disp.capa) or '-', ','.join(clave_catalogo(SERVICIOS_VALIDOS, s) for s in disp.servicios) or '-'])
+
+def crear_parser_lotes():
+    parser = argparse.ArgumentParser(prog='P-1.py', description="Gestión de dispositivos sin interfaz interactiva",
+                                     epilog="--perfil activa la instrumentación (perfil.json al salir); "
+                                            "--cprofile ETIQUETA además perfila esa operación (perfil.prof)")
+    parser.add_argument('--archivo', default='dispositivos.json', help="inventario .json, .bin, .db/.sqlite o directorio .zonas (por defecto dispositivos.json)")
+    parser.add_argument('--servidor', metavar='DIRECCION', help="usar el inventario compartido de un servidor (host:puerto o unix:/ruta)")
+    parser.add_argument('--autoguardado', type=float, default=2.0, metavar='SEGUNDOS',
+                        help="menú: guardar en segundo plano tras SEGUNDOS sin cambios (0 lo desactiva y se pregunta al salir)")
+    sub = parser.add_subparsers(dest='comando', help="sin comando se abre el menú interactivo")
+    
+    p = sub.add_parser('add', help="agregar un dispositivo")
+    p.add_argument('--tipo', required=True, help=', '.join(TIPOS_DISPOSITIVO))
+    p.add_argument('--nombre', required=True)
+    p.add_argument('--ip')
+    p.add_argument('--subred', help="tomar la siguiente IP libre de esta subred")
+    p.add_argument('--capa', help=', '.join(CAPAS_RED))
+    p.add_argument('--servicio', action='append', default=[], help=', '.join(SERVICIOS_VALIDOS))
+    p.add_argument('--zona', help="inventario .zonas: zona del dispositivo (por defecto la de la subred de su IP)")
+    
+    for nombre, ayuda in (('list', "listar dispositivos"), ('export', "exportar el inventario")):
+        p = sub.add_parser(nombre, help=ayuda)
+        p.add_argument('--tipo')
+        p.add_argument('--capa')
+        p.add_argument('--servicio')
+        p.add_argument('--salud', choices=ESTADOS_SALUD, help="resultado de la última revisión de alcance")
+        if nombre == 'list':
+            p.add_argument('--json', action='store_true', help="un objeto JSON por línea")
+        else:
+            p.add_argument('--nombre', help="solo los dispositivos cuyo nombre contiene este texto")
+            p.add_argument('--formato', choices=FORMATOS_EXPORTACION,
+                           help="por defecto según la extensión de --salida (.csv, .yaml/.yml, .ini) o json")
+            p.add_argument('--gzip', action='store_true', help="comprimir la salida (implícito si --salida termina en .gz)")
+            p.add_argument('--salida', help="archivo de destino (por defecto la salida estándar)")
+    
+    p = sub.add_parser('search', help="buscar por nombre")
+    p.add_argument('texto')
+    p.add_argument('--json', action='store_true')
+    p.add_argument('--similar', action='store_true', help="ordenar por parecido y tolerar errores de tipeo")
+    p.add_argument('-n', type=int, default=10, help="con --similar, cantidad máxima de resultados")
+    
+    p = sub.add_parser('set-ip', help="asignar o quitar la IP de un dispositivo")
+    p.add_argument('nombre')
+    p.add_argument('ip', nargs='?', help="vacío para quitar la IP")
+    p.add_argument('--subred', help="tomar la siguiente IP libre de esta subred")
+    
+    p = sub.add_parser('add-service', help="agregar un servicio a un dispositivo")
+    p.add_argument('nombre')
+    p.add_argument('servicio')
+    
+    p = sub.add_parser('remove-service', help="quitar un servicio de un dispositivo")
+    p.add_argument('nombre')
+    p.add_argument('servicio')
+    
+    p = sub.add_parser('set-layer', help="cambiar la capa de red de un dispositivo")
+    p.add_argument('nombre')
+    p.add_argument('capa', nargs='?', help="vacío para quitar la capa")
+    
+    p = sub.add_parser('bulk', help="aplicar un cambio a todos los dispositivos filtrados (todo o nada)")
+    p.add_argument('accion', choices=ACCIONES_LOTE)
+    p.add_argument('valor', help="servicio, capa o subred (CIDR) según la acción")
+    p.add_argument('--tipo')
+    p.add_argument('--capa')
+    p.add_argument('--servicio')
+    p.add_argument('--salud', choices=ESTADOS_SALUD)
+    p.add_argument('--simular', action='store_true', help="mostrar los cambios sin aplicarlos")
+    
+    p = sub.add_parser('rename', help="cambiar el nombre de un dispositivo")
+    p.add_argument('nombre')
+    p.add_argument('nuevo')
+    
+    p = sub.add_parser('delete', help="eliminar un dispositivo")
+    p.add_argument('nombre')
+    
+    p = sub.add_parser('import', help="importar volcados de texto heredados")
+    p.add_argument('archivos', nargs='+')
+    p.add_argument('--procesos', type=int)
+    
+    p = sub.add_parser('reconcile', help="fusionar varias fuentes resolviendo duplicados y choques de nombre o IP")
+    p.add_argument('fuentes', nargs='+', help="volcados de texto o inventarios .json/.bin/.db, de mayor a menor prioridad")
+    p.add_argument('--politica', choices=POLITICAS_RECONCILIACION, default='reciente',
+                   help="reciente: gana el dato más nuevo; prioridad: gana la fuente anterior; manual: los conflictos quedan pendientes")
+    p.add_argument('--informe', help="guardar el informe de conflictos en este archivo JSON")
+    p.add_argument('--simular', action='store_true', help="solo informar, sin cambiar el inventario")
+    p.add_argument('--procesos', type=int)
+    
+    p = sub.add_parser('subnet', help="administrar subredes")
+    p.add_argument('accion', choices=['add', 'del', 'list', 'free'])
+    p.add_argument('cidr', nargs='?')
+    p.add_argument('-n', type=int, default=10, help="cantidad de direcciones libres a mostrar")
+    
+    p = sub.add_parser('zone', help="zonas de un inventario .zonas")
+    p.add_argument('accion', choices=['list', 'add'])
+    p.add_argument('nombre', nargs='?')
+    p.add_argument('--subred', action='append', default=[], metavar='CIDR', help="add: subred de la zona (se puede repetir)")
+    
+    p = sub.add_parser('topo', help="enlaces entre dispositivos y consultas de dependencia")
+    p.add_argument('accion', choices=['link', 'unlink', 'list', 'check', 'impact', 'path', 'fanout'])
+    p.add_argument('nombres', nargs='*', help="link/unlink: ORIGEN DESTINO; path: ORIGEN [DESTINO]; impact/fanout: NOMBRE")
+    p.add_argument('--tipo', choices=TIPOS_ENLACE, default='uplink', help="uplink: ORIGEN cuelga de DESTINO; troncal: enlace entre pares")
+    
+    p = sub.add_parser('history', help="versiones guardadas del inventario, diferencias y restauración")
+    p.add_argument('accion', choices=['list', 'show', 'diff', 'restore'])
+    p.add_argument('versiones', nargs='*', type=int, help="show/restore: VERSION; diff: DESDE [HASTA] (por defecto el estado actual)")
+    p.add_argument('--fecha', help="show/restore: la última versión guardada hasta esa fecha (AAAA-MM-DD [HH:MM[:SS]])")
+    
+    p = sub.add_parser('migrate', help="copiar el inventario entre JSON, binario (.bin), SQLite (.db/.sqlite) y zonas (.zonas)")
+    p.add_argument('origen')
+    p.add_argument('destino')
+    
+    sub.add_parser('audit', help="validar de una vez todas las IPs del inventario")
+    
+    p = sub.add_parser('sweep', help="revisar alcance y servicios de los dispositivos con IP (TCP)")
+    p.add_argument('--tipo')
+    p.add_argument('--capa')
+    p.add_argument('--servicio', help="solo los dispositivos con este servicio")
+    p.add_argument('--concurrencia', type=int, default=500, help="conexiones abiertas a la vez (por defecto 500)")
+    p.add_argument('--espera', type=float, default=1.0, help="segundos por sonda antes de darla por caída (por defecto 1)")
+    p.add_argument('--puerto', action='append', default=[], metavar='SERVICIO=PUERTO',
+                   help="reemplazar el puerto de un servicio, p. ej. WEB=8080 (se puede repetir)")
+    p.add_argument('--alcance', default=','.join(map(str, PUERTOS_ALCANCE)),
+                   help="puertos para equipos sin servicios sondeables (por defecto %(default)s)")
+    p.add_argument('--destino', metavar='IP', help="sondear esta dirección en lugar de la de cada dispositivo (pruebas locales)")
+    
+    p = sub.add_parser('serve', help="compartir el inventario con varios operadores")
+    p.add_argument('direccion', nargs='?', default=DIRECCION_SERVIDOR, help=f"host:puerto o unix:/ruta (por defecto {DIRECCION_SERVIDOR})")
+    
+    p = sub.add_parser('batch', help="ejecutar comandos desde un archivo o la entrada estándar")
+    p.add_argument('origen', nargs='?', default='-', help="archivo de comandos, '-' para stdin")
+    p.add_argument('--detener', action='store_true', help="parar en el primer error")
+    return parser
+
+def ejecutar_comando(args, inventario, salida=sys.stdout):
+    """Aplica un comando ya analizado; devuelve True si modificó el inventario"""
+    if args.comando == 'add':
+        tipo = _valor_catalogo(TIPOS_DISPOSITIVO, EQUIVALENCIAS_TIPO, args.tipo, "Tipo")
+        validar_nombre(args.nombre, inventario)
+        if args.subred:
+            args.ip = _subredes(inventario).asignar(args.subred)
+        if args.ip:
+            validar_ip(args.ip, inventario)
+        capa = _valor_catalogo(CAPAS_RED, EQUIVALENCIAS_CAPA, args.capa, "Capa") if args.capa else None
+        servicios = []
+        for servicio in args.servicio:
+            servicio = _valor_catalogo(SERVICIOS_VALIDOS, EQUIVALENCIAS_SERVICIO, servicio, "Servicio")
+            if servicio not in servicios:
+                servicios.append(servicio)
+        capa, servicios, _ = campos_segun_tipo(tipo, capa, servicios)
+        disp = crear_dispositivo(tipo, args.nombre, args.ip, capa, servicios)
+        if args.zona:
+            _zonas(inventario).agregar(disp, args.zona)
+        else:
+            inventario.agregar(disp)
+        return True
+    
+    if args.comando in ('list', 'search'):
+        if args.comando == 'search':
+            encontrados = inventario.buscar_nombres(args.texto, args.n) if args.similar else inventario.buscar_texto(args.texto)
+        else:
+            encontrados = inventario.filtrar(args.tipo, args.capa, args.servicio, args.salud)
+        for disp in encontrados:
+            print(json.dumps(dispositivo_a_dict(disp), ensure_ascii=False) if args.json else _linea_dispositivo(disp), file=salida)
+        return False
+    
+    if args.comando == 'set-ip':
+        disp = _dispositivo_por_nombre(inventario, args.nombre)
+        if args.subred:
+            args.ip = _subredes(inventario).asignar(args.subred)
+        if args.ip:
+            validar_ip(args.ip, inventario, excluir=disp)
+        inventario.cambiar_ip(disp, args.ip)
+        return True
+    
+    if args.comando == 'add-service':
+        disp = _dispositivo_por_nombre(inventario, args.nombre)
+        servicio = _valor_catalogo(SERVICIOS_VALIDOS, EQUIVALENCIAS_SERVICIO, args.servicio, "Servicio")
+        campos_segun_tipo(disp.tipo, servicios=[servicio])
+        inventario.agregar_servicio(disp, servicio)
+        return True
+    
+    if args.comando == 'remove-service':
+        disp = _dispositivo_por_nombre(inventario, args.nombre)
+        servicio = _valor_catalogo(SERVICIOS_VALIDOS, EQUIVALENCIAS_SERVICIO, args.servicio, "Servicio")
+        inventario.quitar_servicio(disp, servicio)
+        return True
+    
+    if args.comando == 'set-layer':
+        disp = _dispositivo_por_nombre(inventario, args.nombre)
+        capa = _valor_catalogo(CAPAS_RED, EQUIVALENCIAS_CAPA, args.capa, "Capa") if args.capa else None
+        campos_segun_tipo(disp.tipo, capa)
+        problemas = inventario.topologia.problemas_capas({disp.nombre.lower(): capa}) if inventario.topologia is not None else []
+        if problemas:
+            raise ValueError(problemas[0])
+        inventario.cambiar_capa(disp, capa)
+        return True
+    
+    if args.comando == 'bulk':
+        valor = args.valor
+        if args.accion in ('add-service', 'remove-service'):
+            valor = _valor_catalogo(SERVICIOS_VALIDOS, EQUIVALENCIAS_SERVICIO, valor, "Servicio")
+        elif args.accion == 'set-layer':
+            valor = _valor_catalogo(CAPAS_RED, EQUIVALENCIAS_CAPA, valor, "Capa")
+        cambios = inventario.editar_lote(args.accion, valor, args.simular, tipo=args.tipo, capa=args.capa,
+                                         servicio=args.servicio, salud=args.salud)
+        for disp, antes, despues in cambios:
+            print(f"{disp.nombre}\t{texto_valor_lote(args.accion, antes)}\t{texto_valor_lote(args.accion, despues)}", file=salida)
+        print(f"{len(cambios)} dispositivos {'se modificarían' if args.simular else 'modificados'}", file=salida)
+        return bool(cambios) and not args.simular
+    
+    if args.comando == 'rename':
+        disp = _dispositivo_por_nombre(inventario, args.nombre)
+        if args.nuevo.lower() != disp.nombre.lower():
+            validar_nombre(args.nuevo, inventario)
+        inventario.renombrar(disp, args.nuevo)
+        return True
+    
+    if args.comando == 'delete':
+        inventario.eliminar(_dispositivo_por_nombre(inventario, args.nombre))
+        return True
+    
+    if args.comando == 'import':
+        informe = importar_inventario_texto(args.archivos, inventario, procesos=args.procesos)
+        for origen, nombre, motivo in informe['rechazados']:
+            print(f"rechazado {origen} {nombre}: {motivo}", file=sys.stderr)
+        print(f"{len(informe['importados'])} importados, {len(informe['rechazados'])} rechazados", file=salida)
+        return bool(informe['importados'])
+    
+    if args.comando == 'reconcile':
+        reconciliacion, cambiados = reconciliar_fuentes(args.fuentes, inventario, args.politica, args.procesos, simular=args.simular)
+        informe = reconciliacion.informe()
+        for conflicto in informe['conflictos']:
+            print(texto_conflicto(conflicto), file=salida)
+        for rechazado in informe['rechazados']:
+            print(f"rechazado {rechazado['origen']} {rechazado['nombre']}: {rechazado['motivo']}", file=sys.stderr)
+        if args.informe:
+            escribir_json_atomico(args.informe, informe)
+        print(f"{informe['leidos']} registros, {informe['dispositivos']} dispositivos, {informe['duplicados']} duplicados, "
+              f"{len(informe['conflictos'])} conflictos ({informe['pendientes']} pendientes), "
+              f"{len(informe['rechazados'])} rechazados, {cambiados} cambiados", file=salida)
+        return bool(cambiados)
+    
+    if args.comando == 'subnet':
+        subredes = _subredes(inventario)
+        if args.accion != 'list' and not args.cidr:
+            raise ValueError(f"'subnet {args.accion}' necesita una subred en formato CIDR")
+        if args.accion == 'add':
+            subredes.agregar(args.cidr)
+        elif args.accion == 'del':
+            subredes.eliminar(args.cidr)
+        elif args.accion == 'free':
+            for ip in subredes.obtener(args.cidr).libres(args.n):
+                print(ip, file=salida)
+        else:
+            for subred in subredes:
+                usadas, total, porcentaje = subred.utilizacion()
+                print(f"{subred}\t{usadas}/{total}\t{porcentaje:.1f}%\t{subred.siguiente_libre() or '-'}", file=salida)
+        return False
+    
+    if args.comando == 'zone':
+        zonas = _zonas(inventario)
+        if args.accion == 'add':
+            if not args.nombre:
+                raise ValueError("'zone add' necesita el nombre de la zona")
+            zonas.crear_zona(args.nombre, args.subred)
+            return True
+        for zona, cantidad, subredes, _ in zonas.zonas():
+            print(f"{zona}\t{cantidad}\t{','.join(subredes) or '-'}", file=salida)
+        return False
+    
+    if args.comando == 'topo':
+        topologia = _topologia(inventario)
+        necesarios = {'link': (2, 2), 'unlink': (2, 2), 'path': (1, 2), 'impact': (1, 1), 'fanout': (1, 1)}
+        minimo, maximo = necesarios.get(args.accion, (0, 1))
+        if not minimo <= len(args.nombres) <= maximo:
+            raise ValueError(f"'topo {args.accion}' recibe entre {minimo} y {maximo} dispositivos")
+        if args.accion == 'link':
+            topologia.enlazar(*args.nombres, tipo=args.tipo)
+        elif args.accion == 'unlink':
+            topologia.desenlazar(*args.nombres)
+        elif args.accion == 'list':
+            for origen, destino, tipo in topologia.enlaces(*args.nombres):
+                print(f"{origen}\t{destino}\t{tipo}", file=salida)
+        elif args.accion == 'check':
+            problemas = topologia.validar()
+            for problema in problemas:
+                print(problema, file=salida)
+            print(f"{len(topologia)} enlaces revisados, {len(problemas)} problemas", file=salida)
+        elif args.accion == 'impact':
+            for nombre in topologia.radio_impacto(args.nombres[0]):
+                print(nombre, file=salida)
+        elif args.accion == 'path':
+            ruta = topologia.ruta(*args.nombres) if len(args.nombres) == 2 else topologia.ruta_al_nucleo(args.nombres[0])
+            if ruta is None:
+                raise ValueError("No hay camino entre esos dispositivos" if len(args.nombres) == 2 else f"'{args.nombres[0]}' no tiene camino al núcleo")
+            print(' -> '.join(ruta), file=salida)
+        else:
+            for capa, (directos, dependientes) in topologia.abanico(args.nombres[0]).items():
+                print(f"{clave_catalogo(CAPAS_RED, capa) or '-'}\t{directos}\t{dependientes}", file=salida)
+        return False
+    
+    if args.comando == 'history':
+        historial = _historial(inventario)
+        if args.accion == 'list':
+            for numero, fecha, mapa, cambios in historial.versiones():
+                print(f"{numero}\t{fecha}\t{len(mapa)} dispositivos\t{cambios} cambios", file=salida)
+            return False
+        if args.accion == 'diff':
+            if not 1 <= len(args.versiones) <= 2:
+                raise ValueError("'history diff' recibe una o dos versiones")
+            for cambio in historial.diferencias(*args.versiones):
+                print(texto_diferencia(*cambio), file=salida)
+            return False
+        if len(args.versiones) > 1 or bool(args.versiones) == bool(args.fecha):
+            raise ValueError(f"'history {args.accion}' recibe una versión o --fecha")
+        numero, fecha, mapa, _ = historial.version(args.versiones[0] if args.versiones else None, args.fecha)
+        if args.accion == 'show':
+            for _, registro in sorted(mapa):
+                print(_linea_dispositivo(dispositivo_desde_dict(registro)), file=salida)
+            return False
+        cambios = historial.restaurar(mapa)
+        print(f"Inventario llevado a la versión {numero} ({fecha}): {len(cambios)} dispositivos cambiados", file=salida)
+        return bool(cambios)
+    
+    if args.comando == 'audit':
+        dispositivos = [disp for disp in inventario if disp.ip]
+        codigos, duplicadas = validar_ips_lote(disp.ip for disp in dispositivos)
+        errores = 0
+        for disp, codigo in zip(dispositivos, codigos):
+            if codigo != IP_VALIDA:
+                errores += 1
+                print(f"{disp.nombre}\t{disp.ip}\t{mensaje_error_ip(codigo, disp.ip, inventario)}", file=salida)
+        for ip in sorted(duplicadas):
+            print(f"IP duplicada: {ip}", file=salida)
+        print(f"{len(dispositivos)} IPs revisadas, {errores} con errores", file=salida)
+        return False
+    
+    if args.comando == 'sweep':
+        puertos = dict(_puerto_servicio(texto) for texto in args.puerto)
+        if args.concurrencia < 1 or args.espera <= 0:
+            raise ValueError("La concurrencia y la espera deben ser positivas")
+        inicio = perf_counter()
+        resultados = revisar_salud(inventario.filtrar(args.tipo, args.capa, args.servicio), puertos,
+                                   _lista_puertos(args.alcance), args.concurrencia, args.espera, args.destino)
+        with agrupar_cambios(inventario):
+            for disp, salud in resultados:
+                inventario.registrar_salud(disp, salud)
+                servicios = ','.join(f"{servicio}:{datos['estado']}" for servicio, datos in salud['servicios'].items()) or '-'
+                latencia = '-' if salud['latencia_ms'] is None else f"{salud['latencia_ms']}ms"
+                print(f"{disp.nombre}\t{disp.ip}\t{salud['estado']}\t{latencia}\t{servicios}", file=salida)
+        activos = sum(1 for _, salud in resultados if salud['estado'] == SALUD_ACTIVO)
+        print(f"{len(resultados)} dispositivos revisados en {perf_counter() - inicio:.1f} s: "
+              f"{activos} activos, {len(resultados) - activos} caídos", file=salida)
+        return bool(resultados)
+    
+    if args.comando == 'export':
+        formato = args.formato or (formato_por_extension(args.salida) if args.salida else 'json')
+        comprimir = args.gzip or bool(args.salida and args.salida.endswith('.gz'))
+        exportar(inventario, formato, args.salida, comprimir, salida, tipo=args.tipo, capa=args.capa,
+                 servicio=args.servicio, salud=args.salud, nombre=args.nombre)
+        if not args.salida and not comprimir and formato == 'json':
+            print(file=salida)
+        return False
+    
+    raise ValueError(f"Comando desconocido: {args.comando}")
+
+def ejecutar_lote(lineas, inventario, parser, detener=False, salida=sys.stdout):
+    """Ejecuta una línea de comando por renglón; devuelve (modificado, errores)"""
+    modificado = False
+    errores = 0
+    for numero, linea in enumerate(lineas, 1):
+        linea = linea.strip()
+        if not linea or linea.startswith('#'):
+            continue
+        try:
+            args = parser.parse_args(shlex.split(linea))
+            if args.comando == 'batch':
+                raise ValueError("No se puede anidar 'batch' dentro de un lote")
+            modificado = ejecutar_comando(args, inventario, salida) or modificado
+        except SystemExit:
+            # argparse ya mostró el error de sintaxis
+            errores += 1
+            print(f"línea {numero}: comando inválido: {linea}", file=sys.stderr)
+        except (ValueError, OSError) as e:
+            errores += 1
+            print(f"línea {numero}: {e}", file=sys.stderr)
+        else:
+            continue
+        if detener:
+            break
+    return modificado, errores
+
+def _ejecutar_lote_o_comando(args, inventario):
+    if args.comando == 'batch':
+        if args.origen == '-':
+            return ejecutar_lote(sys.stdin, inventario, crear_parser_lotes(), args.detener)
+        with open(args.origen, 'r', encoding='utf-8') as f:
+            return ejecutar_lote(f, inventario, crear_parser_lotes(), args.detener)
+    return ejecutar_comando(args, inventario), 0
+
+def main_lotes(args):
+    if args.comando == 'migrate':
+        try:
+            cantidad = migrar_almacen(args.origen, args.destino)
+        except (ValueError, OSError, sqlite3.Error) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print(f"{cantidad} dispositivos copiados de {args.origen} a {args.destino}")
+        return 0
+    if args.comando == 'serve':
+        return main_servidor(args)
+    
+    try:
+        inventario = InventarioRemoto(args.servidor) if args.servidor else cargar_dispositivos(args.archivo)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    errores = 0
+    try:
+        if isinstance(inventario, InventarioSQLite):
+            # Todo el lote en una sola transacción
+            with inventario.transaccion():
+                modificado, errores = _ejecutar_lote_o_comando(args, inventario)
+        elif inventario.diario is not None:
+            # Sin diario durante el lote: un único guardado al final
+            diario = inventario.diario
+            inventario.oyentes.remove(diario)
+            modificado, errores = _ejecutar_lote_o_comando(args, inventario)
+            if modificado:
+                # Traer antes lo que otro haya escrito mientras tanto, para no pisarlo
+                inventario.vigilante.revisar()
+                diario.guardar_instantanea(inventario)
+        elif isinstance(inventario, InventarioZonas):
+            modificado, errores = _ejecutar_lote_o_comando(args, inventario)
+            if modificado:
+                inventario.guardar()
+        else:
+            # Contra un servidor cada cambio queda confirmado al hacerlo
+            modificado, errores = _ejecutar_lote_o_comando(args, inventario)
+        if modificado and inventario.topologia is not None:
+            # Enlaces de dispositivos eliminados durante el lote
+            inventario.topologia.guardar()
+        if modificado and inventario.historial is not None:
+            inventario.historial.confirmar()
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        inventario.cerrar()
+    
+    volcar_estadisticas()
+    return 1 if errores else 0
+
+# 🛰️ Inventario compartido: servidor asyncio y cliente delgado
+DIRECCION_SERVIDOR = '127.0.0.1:7017'
+LIMITE_LINEA = 1 << 20
+
+def analizar_direccion(direccion):
+    """'unix:/ruta.sock' -> ('unix', ruta); 'host:puerto' -> ('tcp', (host, puerto))"""
+    if direccion.startswith('unix:'):
+        return 'unix', direccion[len('unix:'):]
+    host, _, puerto = direccion.rpartition(':')
+    if not puerto.isdigit():
+        raise ValueError(f"Dirección inválida: {direccion} (use host:puerto o unix:/ruta)")
+    return 'tcp', (host or '127.0.0.1', int(puerto))
+
+# Campos que acepta cada modificación (los mismos que el comando del modo por lotes)
+CAMPOS_OPERACION = {
+    'add': {'tipo': None, 'nombre': None, 'ip': None, 'subred': None, 'capa': None, 'servicio': (), 'zona': None},
+    'set-ip': {'nombre': None, 'ip': None, 'subred': None},
+    'add-service': {'nombre': None, 'servicio': None},
+    'remove-service': {'nombre': None, 'servicio': None},
+    'set-layer': {'nombre': None, 'capa': None},
+    'rename': {'nombre': None, 'nuevo': None},
+    'delete': {'nombre': None}
+}
+OBLIGATORIOS_OPERACION = {'add': ('tipo', 'nombre'), 'set-ip': ('nombre',), 'add-service': ('nombre', 'servicio'),
+                          'remove-service': ('nombre', 'servicio'), 'set-layer': ('nombre',),
+                          'rename': ('nombre', 'nuevo'), 'delete': ('nombre',)}
+
+class ServidorInventario:
+    """Mantiene un único inventario en memoria y lo comparte por líneas JSON.
+
+    Cada solicitud es un objeto {"op": ..., ...} y cada respuesta otro {"ok": ..., ...}.
+    Las solicitudes se resuelven de a una en el bucle de asyncio, así que cada operación es
+    atómica; de 'save' salen a un hilo el plegado del diario y la versión del historial, que
+    trabajan sobre archivos y mapas persistentes, no sobre el inventario en memoria. Los
+    cambios pueden llevar la versión del registro que leyó el cliente: si otro operador lo
+    modificó después, se rechazan con "conflicto" en lugar de pisarlo.
+    """
+
+    def __init__(self, inventario, archivo):
+        self.inventario = inventario
+        self.archivo = archivo
+        self.versiones = {}   # nombre en minúsculas -> versión del inventario en su último cambio
+        self.clientes = 0
+        self._guardando = asyncio.Lock()
+        inventario.oyentes.append(self._registrar_version)
+
+    def _registrar_version(self, operacion, disp, datos):
+        if operacion == 'salud':
+            return   # una revisión de alcance no invalida lo que otros operadores leyeron
+        if operacion == 'renombrar':
+            self.versiones.pop(datos['anterior'].lower(), None)
+        if operacion == 'eliminar':
+            self.versiones.pop(disp.nombre.lower(), None)
+        else:
+            self.versiones[disp.nombre.lower()] = self.inventario.version
+
+    def _registro(self, disp):
+        if disp is None:
+            return None
+        datos = dispositivo_a_dict(disp)
+        datos['version'] = self.versiones.get(disp.nombre.lower(), 0)
+        return datos
+
+    def _lista(self, dispositivos):
+        return {'dispositivos': [self._registro(disp) for disp in dispositivos]}
+
+    def procesar(self, solicitud):
+        """Resuelve una solicitud ya decodificada y devuelve el cuerpo de la respuesta"""
+        op = solicitud.get('op')
+        inventario = self.inventario
+        if op == 'ping':
+            return {}
+        if op == 'count':
+            return {'total': len(inventario)}
+        if op == 'list':
+            tramo = slice(solicitud.get('inicio'), solicitud.get('fin'))
+            criterios = [solicitud.get(campo) for campo in ('tipo', 'capa', 'servicio', 'salud')]
+            if any(criterios):
+                return self._lista(inventario.filtrar(*criterios)[tramo])
+            return self._lista(inventario[tramo])
+        if op == 'search':
+            return self._lista(inventario.buscar_texto(solicitud.get('texto', '')))
+        if op == 'similar':
+            return self._lista(inventario.buscar_nombres(solicitud.get('texto', ''), int(solicitud.get('limite') or 10)))
+        if op == 'get':
+            if solicitud.get('ip'):
+                return {'dispositivo': self._registro(inventario.buscar_por_ip(solicitud['ip']))}
+            return {'dispositivo': self._registro(inventario.buscar_por_nombre(solicitud.get('nombre', '')))}
+        if op == 'ips':
+            return {'ips': inventario.ips()}
+        if op == 'health':
+            # Resultado de una revisión hecha por el cliente: es una observación, no lleva versión
+            disp = _dispositivo_por_nombre(inventario, solicitud.get('nombre', ''))
+            validar_salud(solicitud.get('salud'))
+            inventario.registrar_salud(disp, solicitud.get('salud'))
+            return {}
+        if op == 'bulk':
+            # Toda la edición en una solicitud: ningún operador ve un estado intermedio
+            cambios = inventario.editar_lote(solicitud.get('accion'), solicitud.get('valor'), bool(solicitud.get('simular')),
+                                             **{campo: solicitud.get(campo) for campo in ('tipo', 'capa', 'servicio', 'salud')})
+            return {'cambios': [{'dispositivo': self._registro(disp), 'antes': antes, 'despues': despues}
+                                for disp, antes, despues in cambios]}
+        if op == 'save':
+            if not guardar_dispositivos(inventario, self.archivo):
+                raise OSError(f"No se pudo guardar '{self.archivo}'")
+            return {}
+        
+        if op not in CAMPOS_OPERACION:
+            raise ValueError(f"Operación desconocida: {op}")
+        for campo in OBLIGATORIOS_OPERACION[op]:
+            if not solicitud.get(campo):
+                raise ValueError(f"Falta el campo '{campo}'")
+        args = argparse.Namespace(comando=op, **{campo: solicitud.get(campo, defecto) for campo, defecto in CAMPOS_OPERACION[op].items()})
+        if op == 'add' and isinstance(args.servicio, str):
+            args.servicio = [args.servicio]
+        
+        if op != 'add':
+            disp = _dispositivo_por_nombre(inventario, args.nombre)
+            esperada = solicitud.get('version')
+            actual = self.versiones.get(disp.nombre.lower(), 0)
+            if esperada is not None and esperada != actual:
+                return {'ok': False, 'conflicto': True, 'dispositivo': self._registro(disp),
+                        'error': f"Otro operador modificó '{disp.nombre}' (versión {actual}, usted tenía la {esperada}); revise los datos actuales y reintente"}
+        
+        # Mismas validaciones que el modo por lotes
+        ejecutar_comando(args, inventario)
+        if op == 'delete':
+            return {}
+        return {'dispositivo': self._registro(inventario.buscar_por_nombre(args.nuevo if op == 'rename' else args.nombre))}
+
+    async def guardar(self):
+        """'save' sin frenar a los demás clientes mientras se escribe"""
+        inventario = self.inventario
+        diario = getattr(inventario, 'diario', None)
+        if diario is None or diario.archivo != self.archivo:
+            # Sin diario se guarda desde la memoria, así que no puede salir del bucle
+            return self.procesar({'op': 'save'})
+        async with self._guardando:
+            try:
+                # Los cambios que lleguen mientras tanto se anexan al diario nuevo
+                await asyncio.to_thread(diario.compactar, True)
+                if getattr(inventario, 'topologia', None) is not None:
+                    inventario.topologia.guardar()
+                if getattr(inventario, 'historial', None) is not None:
+                    # El estado presente ya está armado (ver escuchar): solo se comparan mapas
+                    await asyncio.to_thread(inventario.historial.confirmar)
+            except Exception as e:
+                mostrar_mensaje(f"Error al guardar dispositivos: {str(e)}", "error")
+                raise OSError(f"No se pudo guardar '{self.archivo}'")
+        return {}
+
+    async def responder(self, linea):
+        """Una línea de solicitud -> una línea de respuesta; los errores nunca cortan el servidor"""
+        inicio = perf_counter()
+        op = None
+        try:
+            solicitud = json.loads(linea)
+            if not isinstance(solicitud, dict):
+                raise ValueError("La solicitud debe ser un objeto JSON")
+            op = solicitud.get('op')
+            respuesta = await self.guardar() if op == 'save' else self.procesar(solicitud)
+            respuesta.setdefault('ok', True)
+        except json.JSONDecodeError:
+            respuesta = {'ok': False, 'error': "Solicitud inválida: no es JSON"}
+        except (ValueError, TypeError, OSError, sqlite3.Error) as e:
+            respuesta = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            # Un fallo inesperado se informa al cliente y en la consola; la conexión sigue
+            mostrar_mensaje(f"Error inesperado en '{op}': {type(e).__name__}: {e}", "error")
+            respuesta = {'ok': False, 'error': f"Error interno del servidor: {type(e).__name__}: {e}"}
+        respuesta['version_inventario'] = self.inventario.version
+        if INSTRUMENTACION['activa']:
+            registrar_tiempo(f"servidor: {op}", perf_counter() - inicio)
+        return json.dumps(respuesta, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    async def atender(self, lector, escritor):
+        self.clientes += 1
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                if linea.strip():
+                    escritor.write(await self.responder(linea))
+                    await escritor.drain()
+        except (ConnectionError, ValueError):
+            # Cliente caído o línea más larga que LIMITE_LINEA: se corta solo esa conexión
+            pass
+        finally:
+            self.clientes -= 1
+            escritor.close()
+
+    async def escuchar(self, direccion, listo=None):
+        tipo, destino = analizar_direccion(direccion)
+        if getattr(self.inventario, 'historial', None) is not None:
+            # El historial se arma al usarse: mejor ahora que en el primer 'save', con clientes
+            # esperando, y así guardar() puede confirmar versiones fuera del bucle
+            self.inventario.historial.actual()
+        if tipo == 'unix':
+            if os.path.exists(destino):
+                # Un socket que nadie atiende es el resto de una ejecución anterior
+                try:
+                    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as prueba:
+                        prueba.connect(destino)
+                    raise OSError(f"Ya hay un servidor escuchando en {destino}")
+                except ConnectionRefusedError:
+                    os.unlink(destino)
+            servidor = await asyncio.start_unix_server(self.atender, destino, limit=LIMITE_LINEA)
+        else:
+            servidor = await asyncio.start_server(self.atender, *destino, limit=LIMITE_LINEA)
+        
+        detener = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, detener.set)
+        except (NotImplementedError, RuntimeError):
+            pass   # Windows o hilo secundario: solo Ctrl+C
+        if listo is not None:
+            listo()
+        try:
+            async with servidor:
+                await detener.wait()
+        finally:
+            if tipo == 'unix' and os.path.exists(destino):
+                os.unlink(destino)
+
+    def servir(self, direccion, listo=None):
+        """Atiende clientes hasta Ctrl+C o SIGTERM"""
+        try:
+            asyncio.run(self.escuchar(direccion, listo))
+        except KeyboardInterrupt:
+            pass
+
+class InventarioRemoto(Inventario):
+    """Cliente delgado con la interfaz de Inventario; los datos viven en el servidor.
+
+    Cada nombre se representa con un único objeto local (así siguen valiendo las comparaciones
+    por identidad del menú) y cada cambio viaja con la versión del registro leído: si otro
+    operador lo modificó antes, el servidor lo rechaza y llega como ValueError.
+    """
+
+    def __init__(self, direccion, tiempo_espera=30):
+        super().__init__()
+        self.direccion = direccion
+        self._lock = threading.Lock()
+        self._locales = weakref.WeakValueDictionary()   # nombre en minúsculas -> Dispositivo
+        self._versiones = {}
+        tipo, destino = analizar_direccion(direccion)
+        if tipo == 'unix':
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(tiempo_espera)
+            self._socket.connect(destino)
+        else:
+            self._socket = socket.create_connection(destino, timeout=tiempo_espera)
+        self._canal = self._socket.makefile('rwb')
+        self._pedir('ping')
+
+    def _pedir(self, op, **datos):
+        with self._lock:
+            self._canal.write(json.dumps({'op': op, **datos}, ensure_ascii=False).encode('utf-8') + b'\n')
+            self._canal.flush()
+            linea = self._canal.readline()
+        if not linea:
+            raise OSError(f"El servidor {self.direccion} cerró la conexión")
+        respuesta = json.loads(linea)
+        self.version = respuesta.get('version_inventario', self.version)
+        if respuesta.get('conflicto'):
+            # Quedarse con lo que hay ahora en el servidor
+            self._local(respuesta.get('dispositivo'))
+        if not respuesta.get('ok'):
+            raise ValueError(respuesta.get('error') or "Error del servidor")
+        return respuesta
+
+    def _local(self, datos):
+        """Vuelca un registro recibido sobre el objeto local de ese nombre"""
+        if datos is None:
+            return None
+        clave = datos['NOMBRE'].lower()
+        recibido = dispositivo_desde_dict(datos)
+        disp = self._locales.get(clave)
+        if disp is None:
+            disp = self._locales[clave] = recibido
+        else:
+            for campo in ('tipo', 'nombre', 'ip', 'capa', 'servicios', 'ultima_modificacion'):
+                setattr(disp, campo, getattr(recibido, campo))
+        self._versiones[clave] = datos.get('version', 0)
+        return disp
+
+    def _locales_de(self, respuesta):
+        return [self._local(datos) for datos in respuesta['dispositivos']]
+
+    def cerrar(self):
+        with self._lock:
+            self._canal.close()
+            self._socket.close()
+
+    def guardar(self):
+        self._pedir('save')
+
+    # Acceso tipo lista para el menú
+    def __len__(self):
+        return self._pedir('count')['total']
+
+    def __iter__(self, tanda=1000):
+        inicio = 0
+        while True:
+            tramo = self._locales_de(self._pedir('list', inicio=inicio, fin=inicio + tanda))
+            yield from tramo
+            if len(tramo) < tanda:
+                return
+            inicio += tanda
+
+    def __contains__(self, disp):
+        return self.buscar_por_nombre(disp.nombre) is disp
+
+    def __getitem__(self, posicion):
+        if isinstance(posicion, slice):
+            inicio, fin, paso = posicion.indices(len(self))
+            return self._locales_de(self._pedir('list', inicio=inicio, fin=max(inicio, fin)))[::paso]
+        if posicion < 0:
+            posicion += len(self)
+        tramo = self._pedir('list', inicio=posicion, fin=posicion + 1)['dispositivos'] if posicion >= 0 else []
+        if not tramo:
+            raise IndexError(posicion)
+        return self._local(tramo[0])
+
+    # Consultas
+    def ips(self):
+        return self._pedir('ips')['ips']
+
+    def buscar_por_ip(self, ip):
+        return self._local(self._pedir('get', ip=ip)['dispositivo'])
+
+    def buscar_por_nombre(self, nombre):
+        return self._local(self._pedir('get', nombre=nombre)['dispositivo'])
+
+    def buscar_texto(self, texto):
+        return self._locales_de(self._pedir('search', texto=texto))
+
+    def buscar_nombres(self, texto, limite=10):
+        return self._locales_de(self._pedir('similar', texto=texto, limite=limite))
+
+    def filtrar(self, tipo=None, capa=None, servicio=None, salud=None):
+        return self._locales_de(self._pedir('list', tipo=tipo, capa=capa, servicio=servicio, salud=salud))
+
+    # Modificaciones: siempre con la versión que se leyó
+    def _modificar(self, op, disp, **datos):
+        clave = disp.nombre.lower()
+        respuesta = self._pedir(op, nombre=disp.nombre, version=self._versiones.get(clave, 0), **datos)
+        if op == 'delete':
+            self._locales.pop(clave, None)
+            self._versiones.pop(clave, None)
+        else:
+            self._local(respuesta['dispositivo'])
+
+    def agregar(self, disp):
+        respuesta = self._pedir('add', tipo=disp.tipo, nombre=disp.nombre, ip=disp.ip, capa=disp.capa, servicio=disp.servicios)
+        self._locales[disp.nombre.lower()] = disp
+        return self._local(respuesta['dispositivo'])
+
+    def cambiar_ip(self, disp, nueva_ip):
+        self._modificar('set-ip', disp, ip=nueva_ip or None)
+
+    def agregar_servicio(self, disp, servicio):
+        self._modificar('add-service', disp, servicio=servicio)
+
+    def quitar_servicio(self, disp, servicio):
+        self._modificar('remove-service', disp, servicio=servicio)
+
+    def cambiar_capa(self, disp, capa):
+        self._modificar('set-layer', disp, capa=capa or None)
+
+    def editar_lote(self, accion, valor, simular=False, **criterios):
+        respuesta = self._pedir('bulk', accion=accion, valor=valor, simular=simular, **criterios)
+        return [(self._local(cambio['dispositivo']), cambio['antes'], cambio['despues']) for cambio in respuesta['cambios']]
+
+    def renombrar(self, disp, nuevo_nombre):
+        anterior = disp.nombre.lower()
+        respuesta = self._pedir('rename', nombre=disp.nombre, nuevo=nuevo_nombre, version=self._versiones.get(anterior, 0))
+        # El objeto local pasa a la clave nueva para conservar la identidad
+        self._locales.pop(anterior, None)
+        self._versiones.pop(anterior, None)
+        self._locales[nuevo_nombre.lower()] = disp
+        self._local(respuesta['dispositivo'])
+
+    def eliminar(self, disp):
+        self._modificar('delete', disp)
+        return disp
+
+    def registrar_salud(self, disp, salud):
+        self._pedir('health', nombre=disp.nombre, salud=salud)
+        disp.salud = salud or None
+
+def main_servidor(args):
+    inventario = cargar_dispositivos(args.archivo)
+    servidor = ServidorInventario(inventario, args.archivo)
+    try:
+        analizar_direccion(args.direccion)
+        servidor.servir(args.direccion, listo=lambda: print(
+            f"Sirviendo {len(inventario)} dispositivos de '{args.archivo}' en {args.direccion} (Ctrl+C para terminar)", flush=True))
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        # Plegar el diario para dejar el archivo al día
+        guardar_dispositivos(inventario, args.archivo)
+        inventario.cerrar()
+        volcar_estadisticas()
+    return 0
 
 # 🎛️ Función principal
-def main():
-    # Cargar dispositivos existentes al iniciar
-    dispositivos = cargar_dispositivos()
+def main(archivo='dispositivos.json', servidor=None, autoguardar=2.0):
+    # Cargar dispositivos existentes al iniciar, o conectarse al inventario compartido
+    if servidor:
+        try:
+            dispositivos = InventarioRemoto(servidor)
+        except (ValueError, OSError) as e:
+            mostrar_mensaje(f"No se pudo conectar con el servidor {servidor}: {e}", "error")
+            return
+        destino = f"el servidor {servidor}"
+    else:
+        dispositivos = cargar_dispositivos(archivo, en_segundo_plano=True)
+        destino = f"'{archivo}'"
     
+    autoguardado = None
     while True:
-        mostrar_menu_principal()
-        opcion = input(f"{Color.GREEN}↳ Seleccione una opción (1-8): {Color.END}")
+        mostrar_menu_principal(dispositivos)
+        opcion = input(f"{Color.GREEN}↳ Seleccione una opción (1-17): {Color.END}")
+        dispositivos.esperar_carga()
+        if autoguardar:
+            # Recién con el inventario cargado: la carga no cuenta como cambios
+            autoguardado = iniciar_autoguardado(dispositivos, autoguardar)
+            autoguardar = 0
+        revisar_cambios_externos(dispositivos)
         
         if opcion == "1":
             dispositivo = agregar_dispositivo_interactivo(dispositivos)
             if dispositivo:
-                if "❌ Error" in dispositivo:
-                    print(dispositivo)
-                    input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
-                else:
-                    dispositivos.append(dispositivo)
-                    mostrar_mensaje("Dispositivo agregado exitosamente!", "exito")
-                    sleep(2)
+                try:
+                    with punto_deshacer(dispositivos):
+                        dispositivos.agregar(dispositivo)
+                    avisar("Dispositivo agregado exitosamente!", "exito")
+                except ValueError as e:
+                    avisar(f"No se pudo agregar el dispositivo: {str(e)}", "error")
         
         elif opcion == "2":
             mostrar_dispositivos(dispositivos)
@@ -633,43 +6643,84 @@ def main():
             buscar_dispositivo(dispositivos)
         
         elif opcion == "4":
-            agregar_servicio_dispositivo(dispositivos)
+            with punto_deshacer(dispositivos):
+                agregar_servicio_dispositivo(dispositivos)
         
         elif opcion == "5":
-            agregar_ip_dispositivo(dispositivos)
+            with punto_deshacer(dispositivos):
+                agregar_ip_dispositivo(dispositivos)
         
         elif opcion == "6":
-            eliminar_dispositivo(dispositivos)
+            with punto_deshacer(dispositivos):
+                eliminar_dispositivo(dispositivos)
         
         elif opcion == "7":
-            if guardar_dispositivos(dispositivos):
-                mostrar_mensaje("Dispositivos guardados exitosamente en 'dispositivos.json'", "exito")
+            if guardar_dispositivos(dispositivos, archivo):
+                avisar(f"Dispositivos guardados exitosamente en {destino}", "exito")
             else:
-                mostrar_mensaje("Error al guardar los dispositivos", "error")
-            sleep(2)
+                avisar("Error al guardar los dispositivos", "error")
         
         elif opcion == "8":
-            # Preguntar si desea guardar antes de salir
-            guardar = input(f"{Color.YELLOW}¿Desea guardar los cambios antes de salir? (s/n): {Color.END}").lower()
+            filtrar_dispositivos(dispositivos)
+        
+        elif opcion == "9":
+            with punto_deshacer(dispositivos):
+                importar_inventario_interactivo(dispositivos)
+        
+        elif opcion == "10":
+            administrar_subredes(dispositivos)
+        
+        elif opcion == "11":
+            mostrar_estadisticas()
+        
+        elif opcion == "12":
+            revisar_salud_interactivo(dispositivos)
+        
+        elif opcion == "13":
+            administrar_topologia(dispositivos)
+        
+        elif opcion == "14":
+            with punto_deshacer(dispositivos):
+                renombrar_dispositivo(dispositivos)
+        
+        elif opcion == "15":
+            with punto_deshacer(dispositivos):
+                editar_en_lote_interactivo(dispositivos)
+        
+        elif opcion == "16":
+            administrar_historial(dispositivos)
+        
+        elif opcion == "17":
+            if autoguardado is not None:
+                # Los cambios ya se guardan solos: se termina lo pendiente y se guardan enlaces e historial
+                autoguardado.vaciar()
+                guardar = 's'
+            else:
+                # Preguntar si desea guardar antes de salir
+                guardar = input(f"{Color.YELLOW}¿Desea guardar los cambios antes de salir? (s/n): {Color.END}").lower()
             if guardar == 's':
-                if guardar_dispositivos(dispositivos):
+                if guardar_dispositivos(dispositivos, archivo):
                     mostrar_mensaje("Dispositivos guardados exitosamente", "exito")
                 else:
                     mostrar_mensaje("Error al guardar los dispositivos", "error")
+            elif dispositivos.diario is not None:
+                # Los cambios sin plegar del diario se descartan
+                dispositivos.diario.descartar()
+            dispositivos.cerrar()
+            if volcar_estadisticas():
+                mostrar_mensaje(f"Estadísticas guardadas en '{INSTRUMENTACION['archivo']}'", "info")
             
+            mostrar_avisos()
             mostrar_mensaje("Saliendo del sistema... ¡Hasta pronto! 👋", "info")
-            sleep(2)
-            limpiar_pantalla()
             break
         
         else:
-            mostrar_mensaje("Opción inválida. Por favor seleccione 1-8", "error")
-            sleep(2)
+            avisar("Opción inválida. Por favor seleccione 1-17", "error")
 
 if __name__ == "__main__":
-    limpiar_pantalla()
-    print(f"\n{Color.BLUE}{'═' * 60}{Color.END}")
-    print(f"{Color.BOLD}{Color.PURPLE}{'BIENVENIDO AL SISTEMA DE GESTIÓN DE DISPOSITIVOS'.center(60)}{Color.END}")
-    print(f"{Color.BLUE}{'═' * 60}{Color.END}")
-    sleep(2)
-    main()
+    args = crear_parser_lotes().parse_args(extraer_opciones_perfil(sys.argv[1:]))
+    if args.comando:
+        sys.exit(main_lotes(args))
+    avisar("Bienvenido al sistema de gestión de dispositivos 👋", "info")
+    with TERMINAL.pantalla():
+        main(args.archivo, args.servidor, args.autoguardado)
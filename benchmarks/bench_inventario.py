@@ -0,0 +1,295 @@
+# ⏱️ Micro-benchmarks de las rutas críticas de P-1.py
+#
+# Uso:
+#   python benchmarks/bench_inventario.py                      # 1k, 10k y 100k contra base.json
+#   python benchmarks/bench_inventario.py --tamanos 1000 1000000
+#   python benchmarks/bench_inventario.py --nombres 100000 1000000   # búsqueda por nombre, consulta a consulta
+#   python benchmarks/bench_inventario.py --guardar-base       # reemplaza la línea base
+#
+# La salida es JSON; si una medición empeora más que la tolerancia (y más que el piso en
+# segundos) respecto de la línea base, o la búsqueda por nombre con 1M de nombres pasa del
+# objetivo, ese tamaño se mide otra vez; si sigue igual, el proceso termina con código 1.
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'base.json')
+
+def cargar_modulo():
+    # P-1.py no es importable por nombre: se carga desde su ruta
+    spec = importlib.util.spec_from_file_location('p1', os.path.join(RAIZ, 'P-1.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules['p1'] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+# Mezcla aproximada de un inventario real
+PESOS_TIPO = {'PC': 50, 'IMPRESORA': 5, 'SERVIDOR': 15, 'SWITCH': 15, 'ROUTER': 10, 'FIREWALL': 5}
+PESOS_CAPA = {'NUCLEO': 10, 'DISTRIBUCION': 30, 'ACCESO': 60}
+
+def generar_inventario(p1, cantidad, semilla=42):
+    azar = random.Random(semilla)
+    tipos = azar.choices(list(PESOS_TIPO), weights=list(PESOS_TIPO.values()), k=cantidad)
+    servicios = list(p1.SERVICIOS_VALIDOS.values())
+    inventario = p1.Inventario()
+    host = 0
+    for i, tipo in enumerate(tipos):
+        tipo_visible = p1.TIPOS_DISPOSITIVO[tipo]
+        ip = None
+        if azar.random() < 0.9:
+            # IPs únicas 10.x.y.z sin .0 ni .255
+            host += 1
+            ip = f"10.{host // 64516 % 256}.{host // 254 % 254 + 1}.{host % 254 + 1}"
+        capa = None
+        if tipo_visible in p1.TIPOS_CON_CAPA:
+            capa = p1.CAPAS_RED[azar.choices(list(PESOS_CAPA), weights=list(PESOS_CAPA.values()))[0]]
+        lista = azar.sample(servicios, azar.randint(1, 3)) if tipo_visible in p1.TIPOS_CON_SERVICIOS else []
+        inventario.agregar(p1.Dispositivo(tipo_visible, f"{tipo.lower()}-{i}", ip, capa, lista, "2024-01-01 00:00:00"))
+    return inventario
+
+def generar_nombres(cantidad, semilla=42):
+    # Los mismos nombres que generar_inventario, sin crear los dispositivos
+    azar = random.Random(semilla)
+    tipos = azar.choices(list(PESOS_TIPO), weights=list(PESOS_TIPO.values()), k=cantidad)
+    return [f"{tipo.lower()}-{i}" for i, tipo in enumerate(tipos)]
+
+def cronometrar(funcion, repeticiones):
+    """Mejor tiempo de varias repeticiones, en segundos; sin el recolector de basura, como timeit"""
+    mejor = float('inf')
+    recolector = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            mejor = min(mejor, time.perf_counter() - inicio)
+    finally:
+        if recolector:
+            gc.enable()
+    return mejor
+
+def medir(p1, cantidad, repeticiones, consultas=200):
+    inventario = generar_inventario(p1, cantidad)
+    azar = random.Random(cantidad)
+    dispositivos = list(inventario)
+    muestra = [azar.choice(dispositivos) for _ in range(consultas)]
+    # Mitad IPs/nombres en uso y mitad nuevos
+    ips = [disp.ip or '172.16.0.1' for disp in muestra[::2]] + [f"172.16.{i // 250}.{i % 250 + 1}" for i in range(consultas // 2)]
+    nombres = [disp.nombre for disp in muestra[::2]] + [f"nuevo-{i}" for i in range(consultas // 2)]
+    textos = [disp.nombre[:-1] for disp in muestra[:20]]
+
+    def validar_todas(validador, valores):
+        for valor in valores:
+            try:
+                validador(valor, inventario)
+            except ValueError:
+                pass
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as carpeta:
+        archivo = os.path.join(carpeta, 'dispositivos.json')
+        resultados['guardar_dispositivos'] = cronometrar(lambda: p1.guardar_dispositivos(inventario, archivo), repeticiones)
+        resultados['cargar_dispositivos'] = cronometrar(lambda: p1.cargar_dispositivos(archivo, con_diario=False), repeticiones)
+        binario = os.path.join(carpeta, 'dispositivos.bin')
+        resultados['guardar_binario'] = cronometrar(lambda: p1.guardar_dispositivos(inventario, binario), repeticiones)
+        
+        def abrir_binario():
+            # Arranque típico: abrir, contar, primera página y una búsqueda por IP
+            abierto = p1.cargar_dispositivos(binario, con_diario=False)
+            len(abierto), abierto[0:10], abierto.buscar_por_ip(ips[0])
+            abierto.cerrar()
+        resultados['abrir_binario'] = cronometrar(abrir_binario, repeticiones)
+        # Zonas por /16: abrir, contar y validar un nombre en uso y una IP libre sin leer todo
+        zonas = os.path.join(carpeta, 'dispositivos.zonas')
+        particion = p1.InventarioZonas(zonas)
+        for segundo in range(4):
+            particion.crear_zona(f"z{segundo}", [f"10.{segundo}.0.0/16"])
+        particion.guardar()
+        p1.migrar_almacen(archivo, zonas)
+        
+        def abrir_zonas():
+            abierto = p1.cargar_dispositivos(zonas)
+            len(abierto), abierto.buscar_por_nombre(nombres[0]), abierto.buscar_por_ip(ips[-1])
+        resultados['abrir_zonas'] = cronometrar(abrir_zonas, repeticiones)
+        # Exportación en streaming, comprimida y sin comprimir
+        csv_plano = os.path.join(carpeta, 'dispositivos.csv')
+        resultados['exportar_csv'] = cronometrar(lambda: p1.exportar(inventario, 'csv', csv_plano), repeticiones)
+        resultados['exportar_csv_gzip'] = cronometrar(lambda: p1.exportar(inventario, 'csv', csv_plano + '.gz', True), repeticiones)
+        # Reconciliar el inventario con su propio volcado: todo duplicado, sin cambios
+        resultados['reconciliar'] = cronometrar(lambda: p1.reconciliar_fuentes([archivo], inventario, simular=True), repeticiones)
+        # Versión del historial tras una edición: cuesta según el cambio, no según el inventario
+        historial = p1.cargar_historial(inventario, archivo)
+        historial.confirmar()
+        renumerado = dispositivos[0]
+        direcciones = iter(f"172.31.{i // 250}.{i % 250 + 1}" for i in range(repeticiones * 2))
+        
+        def versionar():
+            with historial.accion():
+                inventario.cambiar_ip(renumerado, next(direcciones))
+            historial.confirmar()
+        resultados['confirmar_version'] = cronometrar(versionar, repeticiones)
+        inventario.oyentes.remove(historial)
+    # Por llamada, para que sean comparables entre tamaños
+    resultados['validar_ip'] = cronometrar(lambda: validar_todas(p1.validar_ip, ips), repeticiones) / len(ips)
+    resultados['validar_nombre'] = cronometrar(lambda: validar_todas(p1.validar_nombre, nombres), repeticiones) / len(nombres)
+    resultados['obtener_ips_dispositivos'] = cronometrar(lambda: p1.obtener_ips_dispositivos(inventario), repeticiones)
+    resultados['buscar_dispositivo'] = cronometrar(lambda: [inventario.buscar_texto(texto) for texto in textos], repeticiones) / len(textos)
+    # Búsqueda clasificada: el índice de trigramas se construye una vez y luego se consulta
+    resultados['indexar_nombres'] = cronometrar(lambda: p1.IndiceNombres(inventario.por_nombre), 1)
+    erratas = [nombre[:2] + nombre[3:] for nombre in nombres[:consultas // 2]]
+    inventario.indice_nombres()
+    resultados['buscar_nombres'] = cronometrar(lambda: [inventario.buscar_nombres(texto) for texto in textos + erratas], repeticiones) / (len(textos) + len(erratas))
+    return resultados
+
+def medir_nombres(p1, cantidad, repeticiones, consultas=50):
+    """Búsqueda clasificada por nombre consulta a consulta: media y peor caso por clase de texto"""
+    nombres = generar_nombres(cantidad)
+    indice = p1.IndiceNombres(nombres)
+    azar = random.Random(cantidad)
+    muestra = azar.sample(nombres, consultas)
+
+    def transponer(nombre):
+        i = azar.randrange(len(nombre) - 1)
+        return nombre[:i] + nombre[i + 1] + nombre[i] + nombre[i + 2:]
+
+    def borrar(nombre):
+        i = azar.randrange(len(nombre))
+        return nombre[:i] + nombre[i + 1:]
+
+    def sustituir(nombre):
+        i = azar.randrange(len(nombre))
+        return nombre[:i] + 'x' + nombre[i + 1:]
+
+    clases = {
+        'fijos': ['pc-12345', 'sw-cor1', 'switch-cor1', 'router-1', 'servidor-99999', 'firewall', 'pc', 'zzzz'],
+        'exactos': muestra,
+        'prefijos': [nombre[:-1] for nombre in muestra],
+        'transpuestos': [transponer(nombre) for nombre in muestra],
+        'borrados': [borrar(nombre) for nombre in muestra],
+        'sustituidos': [sustituir(nombre) for nombre in muestra]
+    }
+    resultados = {}
+    peor = 0
+    for clase, textos in clases.items():
+        tiempos = [cronometrar(lambda: indice.buscar(texto), repeticiones) for texto in textos]
+        resultados[f'buscar_nombres_{clase}'] = sum(tiempos) / len(tiempos)
+        peor = max(peor, max(tiempos))
+    resultados['buscar_nombres_peor'] = peor
+    return resultados
+
+def comparar(resultados, base, tolerancia, piso=0.0):
+    """Cociente actual/base por medición; marca las que superan la tolerancia y además
+    empeoran más de 'piso' segundos (por debajo de eso manda el ruido de la máquina)"""
+    comparacion = {}
+    regresiones = []
+    afectados = set()
+    for tamano, mediciones in resultados.items():
+        for nombre, segundos in mediciones.items():
+            anterior = base.get(tamano, {}).get(nombre)
+            if not anterior:
+                continue
+            cociente = segundos / anterior
+            comparacion.setdefault(tamano, {})[nombre] = round(cociente, 3)
+            if cociente > tolerancia and segundos - anterior > piso:
+                regresiones.append(f"{nombre} con {tamano} dispositivos: x{cociente:.2f}")
+                afectados.add(tamano)
+    return comparacion, regresiones, afectados
+
+def fuera_de_objetivo(resultados, objetivo):
+    """Clases de búsqueda por nombre cuya media por consulta pasa del objetivo"""
+    return [f"{nombre} con {tamano} nombres: {segundos * 1000:.3f} ms"
+            for tamano, mediciones in resultados.items() for nombre, segundos in mediciones.items()
+            if nombre.startswith('buscar_nombres_') and nombre != 'buscar_nombres_peor' and segundos > objetivo]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de escalabilidad del inventario")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="cantidades de dispositivos (por ejemplo 1000 10000 100000 1000000)")
+    parser.add_argument('--repeticiones', type=int, default=7, help="se toma el mejor tiempo de estas repeticiones")
+    parser.add_argument('--nombres', type=int, nargs='*', default=[1000000],
+                        help="cantidades de nombres para la búsqueda clasificada consulta a consulta")
+    parser.add_argument('--objetivo-nombres', type=float, default=0.001,
+                        help="segundos máximos por búsqueda de nombre (media de cada clase de texto)")
+    parser.add_argument('--base', default=BASE_POR_DEFECTO, help="línea base JSON contra la que comparar")
+    parser.add_argument('--tolerancia', type=float, default=1.5, help="cociente máximo aceptado respecto de la base")
+    parser.add_argument('--piso', type=float, default=0.0005,
+                        help="segundos que una medición puede empeorar sin contar como regresión, sea cual sea el cociente")
+    parser.add_argument('--guardar-base', action='store_true', help="guardar estos resultados como nueva línea base")
+    parser.add_argument('--salida', help="archivo JSON de resultados (por defecto la salida estándar)")
+    args = parser.parse_args(argv)
+
+    p1 = cargar_modulo()
+
+    def medir_tamano(tamano):
+        mediciones = {}
+        if tamano in args.tamanos:
+            print(f"Midiendo {tamano} dispositivos...", file=sys.stderr)
+            mediciones.update(medir(p1, tamano, args.repeticiones))
+        if tamano in args.nombres:
+            print(f"Midiendo la búsqueda entre {tamano} nombres...", file=sys.stderr)
+            mediciones.update(medir_nombres(p1, tamano, args.repeticiones))
+        return mediciones
+
+    resultados = {str(tamano): medir_tamano(tamano) for tamano in dict.fromkeys(args.tamanos + args.nombres)}
+    base = None
+    if os.path.exists(args.base) and not args.guardar_base:
+        with open(args.base, 'r') as f:
+            base = json.load(f).get('resultados', {})
+        _, regresiones, afectados = comparar(resultados, base, args.tolerancia, args.piso)
+    else:
+        afectados = set()
+    afectados |= {tamano for tamano, mediciones in resultados.items() if fuera_de_objetivo({tamano: mediciones}, args.objetivo_nombres)}
+    # Una regresión se confirma midiendo otra vez ese tamaño: el ruido de la máquina rara vez se
+    # repite en la misma medición, y de las dos corridas vale la mejor
+    for tamano in sorted(afectados, key=int):
+        print(f"Confirmando {tamano}...", file=sys.stderr)
+        repetidas = medir_tamano(int(tamano))
+        resultados[tamano] = {nombre: min(segundos, repetidas.get(nombre, segundos)) for nombre, segundos in resultados[tamano].items()}
+
+    informe = {
+        'meta': {
+            'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'repeticiones': args.repeticiones
+        },
+        'resultados': resultados
+    }
+
+    regresiones = []
+    if base is not None:
+        informe['comparacion'], regresiones, _ = comparar(resultados, base, args.tolerancia, args.piso)
+        informe['regresiones'] = regresiones
+    lentas = fuera_de_objetivo(resultados, args.objetivo_nombres)
+    if lentas:
+        informe['fuera_de_objetivo'] = lentas
+
+    texto = json.dumps(informe, indent=4)
+    if args.salida:
+        with open(args.salida, 'w') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+
+    if args.guardar_base:
+        with open(args.base, 'w') as f:
+            json.dump({'meta': informe['meta'], 'resultados': resultados}, f, indent=4)
+            f.write('\n')
+
+    for regresion in regresiones:
+        print(f"⚠️ Regresión: {regresion}", file=sys.stderr)
+    for medicion in lentas:
+        print(f"⚠️ Fuera de objetivo: {medicion}", file=sys.stderr)
+    return 1 if regresiones or lentas else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
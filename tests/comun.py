@@ -0,0 +1,29 @@
+# Utilidades compartidas por las pruebas
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def cargar_modulo():
+    # P-1.py no es importable por nombre: se carga desde su ruta, una vez para todas las pruebas
+    if 'p1' in sys.modules:
+        return sys.modules['p1']
+    spec = importlib.util.spec_from_file_location('p1', os.path.join(RAIZ, 'P-1.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules['p1'] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+class ConDirectorio(unittest.TestCase):
+    """Cada prueba trabaja en su propio directorio temporal"""
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, True)
+
+    def ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
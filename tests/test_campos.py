@@ -0,0 +1,44 @@
+# 🧪 Pruebas de las reglas de capa y servicios por tipo en el menú y la edición masiva
+import unittest
+from unittest import mock
+
+from comun import cargar_modulo
+
+p1 = cargar_modulo()
+
+class PruebasCamposSegunTipo(unittest.TestCase):
+
+    def setUp(self):
+        self.inventario = p1.Inventario([
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc1', '10.0.0.10'),
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['SERVIDOR'], 'srv1', '10.0.0.1'),
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['SWITCH'], 'sw1', '10.0.0.2', p1.CAPAS_RED['ACCESO'])])
+
+    def test_estricto_y_permisivo(self):
+        with self.assertRaises(ValueError):
+            p1.campos_segun_tipo(p1.TIPOS_DISPOSITIVO['PC'], p1.CAPAS_RED['NUCLEO'])
+        capa, servicios, avisos = p1.campos_segun_tipo(p1.TIPOS_DISPOSITIVO['PC'], p1.CAPAS_RED['NUCLEO'],
+                                                       [p1.SERVICIOS_VALIDOS['DNS']], estricto=False)
+        self.assertEqual((capa, servicios, len(avisos)), (None, [], 2))
+
+    def test_menu_no_agrega_servicios_a_un_tipo_que_no_los_admite(self):
+        # Elegir el dispositivo 1 (pc1) y el primer servicio
+        with mock.patch('builtins.input', side_effect=['1', '1']), mock.patch.object(p1, 'avisar') as avisar:
+            p1.agregar_servicio_dispositivo(self.inventario)
+        self.assertEqual(self.inventario.buscar_por_nombre('pc1').servicios, [])
+        self.assertEqual(avisar.call_args.args[1], 'error')
+        with mock.patch('builtins.input', side_effect=['2', '1']), mock.patch.object(p1, 'avisar') as avisar:
+            p1.agregar_servicio_dispositivo(self.inventario)
+        self.assertEqual(self.inventario.buscar_por_nombre('srv1').servicios, [p1.SERVICIOS_VALIDOS['DNS']])
+        self.assertEqual(avisar.call_args.args[1], 'exito')
+
+    def test_edicion_masiva_aplica_las_mismas_reglas(self):
+        with self.assertRaisesRegex(ValueError, "'pc1'.*no admite servicios"):
+            p1.planificar_edicion(self.inventario, 'add-service', p1.SERVICIOS_VALIDOS['DNS'])
+        with self.assertRaisesRegex(ValueError, "'pc1'.*no admite capa"):
+            p1.planificar_edicion(self.inventario, 'set-layer', p1.CAPAS_RED['NUCLEO'])
+        cambios = p1.planificar_edicion(self.inventario, 'set-layer', p1.CAPAS_RED['NUCLEO'], tipo=p1.TIPOS_DISPOSITIVO['SWITCH'])
+        self.assertEqual([disp.nombre for disp, _, _ in cambios], ['sw1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+# 🧪 Pruebas del diario de cambios, del plegado y de la lectura de instantáneas de P-1.py
+#
+# Uso:
+#   python -m pytest tests
+#   python -m unittest discover tests
+import os
+import shutil
+import time
+import unittest
+from unittest import mock
+
+import comun
+
+p1 = comun.cargar_modulo()
+TIPO = p1.TIPOS_DISPOSITIVO
+CAPA = p1.CAPAS_RED
+SERVICIO = p1.SERVICIOS_VALIDOS
+
+def dispositivos_base():
+    return [p1.crear_dispositivo(TIPO['SERVIDOR'], 'srv1', '10.0.0.1', None, [SERVICIO['DNS']]),
+            p1.crear_dispositivo(TIPO['ROUTER'], 'r1', '10.0.0.254', CAPA['NUCLEO'], [SERVICIO['VPN']]),
+            p1.crear_dispositivo(TIPO['PC'], 'pc1', '10.0.0.10'),
+            p1.crear_dispositivo(TIPO['PC'], 'pc2', '10.0.0.11'),
+            p1.crear_dispositivo(TIPO['SWITCH'], 'sw1', None, CAPA['ACCESO'])]
+
+class ConDirectorio(comun.ConDirectorio):
+    """Cada prueba trabaja con su propio dispositivos.json en un directorio temporal"""
+
+    def setUp(self):
+        super().setUp()
+        self.archivo = self.ruta('dispositivos.json')
+        p1.escribir_instantanea(self.archivo, dispositivos_base())
+
+    def abrir(self, **opciones):
+        inventario = p1.cargar_dispositivos(self.archivo, **opciones)
+        self.addCleanup(inventario.cerrar)
+        return inventario
+
+    def en_archivo(self):
+        return {registro['NOMBRE']: registro for registro in p1.iterar_registros_json(self.archivo, estricto=True)}
+
+    def en_memoria(self, inventario):
+        return {disp.nombre: p1.dispositivo_a_dict(disp) for disp in inventario}
+
+    def escribir_desde_fuera(self, cambiar):
+        # Otro proceso (o una persona) reescribe la instantánea mientras la sesión sigue abierta
+        otro = p1.cargar_dispositivos(self.archivo, con_diario=False)
+        cambiar(otro)
+        p1.escribir_instantanea(self.archivo, otro)
+
+class PruebasPlegado(ConDirectorio):
+
+    OPERACIONES = {
+        'agregar': lambda inv: inv.agregar(p1.crear_dispositivo(TIPO['FIREWALL'], 'fw1', '10.0.0.2', None, [SERVICIO['VPN']])),
+        'ip': lambda inv: inv.cambiar_ip(inv.buscar_por_nombre('pc1'), '10.0.0.20'),
+        'servicio': lambda inv: inv.agregar_servicio(inv.buscar_por_nombre('srv1'), SERVICIO['WEB']),
+        'quitar_servicio': lambda inv: inv.quitar_servicio(inv.buscar_por_nombre('srv1'), SERVICIO['DNS']),
+        'capa': lambda inv: inv.cambiar_capa(inv.buscar_por_nombre('sw1'), CAPA['DISTRIBUCION']),
+        'renombrar': lambda inv: inv.renombrar(inv.buscar_por_nombre('pc2'), 'pc-recepcion'),
+        'eliminar': lambda inv: inv.eliminar(inv.buscar_por_nombre('pc1')),
+        'salud': lambda inv: inv.registrar_salud(inv.buscar_por_nombre('r1'), {'estado': p1.SALUD_ACTIVO, 'latencia_ms': 0.4}),
+    }
+
+    def test_cada_operacion_se_pliega_en_la_instantanea(self):
+        original = self.archivo
+        for operacion, aplicar in self.OPERACIONES.items():
+            with self.subTest(operacion=operacion):
+                self.archivo = os.path.join(self.directorio, operacion, 'dispositivos.json')
+                os.makedirs(os.path.dirname(self.archivo))
+                shutil.copy(original, self.archivo)
+                inventario = self.abrir()
+                aplicar(inventario)
+                self.assertEqual([entrada['op'] for entrada in p1.leer_diario(inventario.diario.ruta)], [operacion])
+
+                inventario.diario.compactar(esperar=True)
+                self.assertEqual(self.en_archivo(), self.en_memoria(inventario))
+                self.assertFalse(os.path.exists(inventario.diario.ruta_compactando))
+                # Recargar desde el archivo plegado da lo mismo que había en memoria
+                self.assertEqual(self.en_memoria(self.abrir(con_diario=False)), self.en_memoria(inventario))
+
+    def test_reproducir_el_diario_sin_plegar(self):
+        inventario = self.abrir()
+        for aplicar in self.OPERACIONES.values():
+            aplicar(inventario)
+        esperado = self.en_memoria(inventario)
+        inventario.cerrar()
+        self.assertEqual(self.en_memoria(self.abrir()), esperado)
+
+class PruebasPlegadoInterrumpido(ConDirectorio):
+
+    def test_se_reproduce_el_diario_rotado_y_despues_el_actual(self):
+        inventario = self.abrir()
+        inventario.cambiar_ip(inventario.buscar_por_nombre('pc1'), '10.0.0.30')
+        inventario.agregar_servicio(inventario.buscar_por_nombre('srv1'), SERVICIO['BD'])
+        inventario.cerrar()
+        # El plegado rotó el diario y el proceso terminó antes de escribir la instantánea
+        diario = p1.Diario(self.archivo)
+        os.replace(diario.ruta, diario.ruta_compactando)
+        with open(diario.ruta_compactando, 'a') as f:
+            f.write('{"op": "ip", "nombre": "srv1", "ip": "10.0')
+
+        inventario = self.abrir()
+        self.assertEqual(inventario.buscar_por_nombre('pc1').ip, '10.0.0.30')
+        # Los cambios de la sesión nueva van al diario actual y se aplican después del rotado
+        inventario.cambiar_ip(inventario.buscar_por_nombre('pc1'), '10.0.0.31')
+        inventario.eliminar(inventario.buscar_por_nombre('pc2'))
+        esperado = self.en_memoria(inventario)
+        inventario.cerrar()
+        self.assertTrue(os.path.exists(diario.ruta_compactando))
+        self.assertTrue(os.path.exists(diario.ruta))
+
+        inventario = self.abrir()
+        self.assertEqual(self.en_memoria(inventario), esperado)
+        inventario.diario.compactar(esperar=True)
+        self.assertEqual(self.en_archivo(), esperado)
+        self.assertFalse(os.path.exists(diario.ruta_compactando))
+        self.assertFalse(os.path.exists(diario.ruta))
+
+    def test_una_linea_cortada_al_final_del_diario_se_ignora(self):
+        inventario = self.abrir()
+        inventario.cambiar_ip(inventario.buscar_por_nombre('pc1'), '10.0.0.30')
+        inventario.cerrar()
+        with open(inventario.diario.ruta, 'a') as f:
+            f.write('{"op": "ip", "nombre": "pc2", "ip": "10.0')
+        inventario = self.abrir()
+        self.assertEqual(inventario.buscar_por_nombre('pc1').ip, '10.0.0.30')
+        self.assertEqual(inventario.buscar_por_nombre('pc2').ip, '10.0.0.11')
+
+class PruebasAgrupado(ConDirectorio):
+
+    def test_un_solo_fsync_por_grupo(self):
+        inventario = self.abrir()
+        with mock.patch.object(p1.os, 'fsync', wraps=os.fsync) as fsync:
+            with p1.agrupar_cambios(inventario):
+                for i in range(20):
+                    inventario.cambiar_ip(inventario.buscar_por_nombre('pc1'), f"10.0.1.{i + 1}")
+                # Un grupo anidado no confirma nada al cerrarse
+                with p1.agrupar_cambios(inventario):
+                    inventario.cambiar_capa(inventario.buscar_por_nombre('sw1'), CAPA['NUCLEO'])
+                self.assertEqual(fsync.call_count, 0)
+            self.assertEqual(fsync.call_count, 1)
+        self.assertEqual(len(list(p1.leer_diario(inventario.diario.ruta))), 21)
+
+    def test_sin_grupo_cada_cambio_es_durable(self):
+        inventario = self.abrir()
+        with mock.patch.object(p1.os, 'fsync', wraps=os.fsync) as fsync:
+            for i in range(5):
+                inventario.cambiar_ip(inventario.buscar_por_nombre('pc1'), f"10.0.1.{i + 1}")
+        self.assertEqual(fsync.call_count, 5)
+
+class PruebasAutoguardado(ConDirectorio):
+
+    def test_no_guarda_un_grupo_a_medias(self):
+        inventario = self.abrir()
+        nombres = [disp.nombre for disp in inventario if disp.ip]
+        autoguardado = p1.Autoguardado(inventario.diario, demora=0.02, espera_maxima=0.05)
+        inventario.oyentes.append(autoguardado)
+        self.addCleanup(autoguardado.vaciar)
+        with p1.agrupar_cambios(inventario):
+            for i, nombre in enumerate(nombres):
+                inventario.cambiar_ip(inventario.buscar_por_nombre(nombre), f"10.1.0.{i + 1}")
+                # Vence la espera máxima con el grupo abierto: el archivo sigue todo viejo
+                time.sleep(0.1)
+                redes = {registro['IP'].rsplit('.', 2)[0] for registro in self.en_archivo().values() if 'IP' in registro}
+                self.assertEqual(redes, {'10.0'})
+        self.assertTrue(autoguardado.vaciar())
+        self.assertGreaterEqual(autoguardado.guardados, 1)
+        self.assertEqual(self.en_archivo(), self.en_memoria(inventario))
+
+class PruebasInstantanea(ConDirectorio):
+
+    def setUp(self):
+        super().setUp()
+        with open(self.archivo, encoding='utf-8') as f:
+            self.texto = f.read()
+        self.registros = list(p1.iterar_registros_json(self.archivo, estricto=True))
+
+    def reescribir(self, texto):
+        with open(self.archivo, 'w', encoding='utf-8') as f:
+            f.write(texto)
+
+    def test_corte_en_cualquier_punto(self):
+        fin = self.texto.rindex(']')
+        for corte in range(fin):
+            self.reescribir(self.texto[:corte])
+            for tam_bloque in (16, 64, 1 << 16):
+                with self.subTest(corte=corte, tam_bloque=tam_bloque):
+                    avisos = []
+                    leidos = list(p1.iterar_registros_json(self.archivo, tam_bloque, al_truncar=avisos.append))
+                    # Los registros completos antes del corte, y un único aviso
+                    self.assertEqual(leidos, self.registros[:len(leidos)])
+                    self.assertEqual(len(avisos), 1)
+                    self.assertIn('incompleto', avisos[0])
+                    with self.assertRaisesRegex(ValueError, 'incompleto'):
+                        list(p1.iterar_registros_json(self.archivo, tam_bloque, estricto=True))
+
+    def test_registro_mal_formado(self):
+        danado = self.texto.replace('"NOMBRE": "pc1"', '"NOMBRE" "pc1"')
+        self.assertNotEqual(danado, self.texto)
+        self.reescribir(danado)
+        posicion = danado.index('"NOMBRE" "pc1"') + len('"NOMBRE" ')
+        for tam_bloque in (16, 64, 1 << 16):
+            with self.subTest(tam_bloque=tam_bloque):
+                avisos = []
+                leidos = []
+                with self.assertRaisesRegex(ValueError, f"mal formado en el carácter {posicion} "):
+                    for registro in p1.iterar_registros_json(self.archivo, tam_bloque, al_truncar=avisos.append):
+                        leidos.append(registro)
+                self.assertEqual(leidos, self.registros[:2])
+                self.assertEqual(avisos, [])
+
+    def test_cargar_y_plegar_una_instantanea_truncada(self):
+        cortado = self.texto[:self.texto.index('"pc2"')]
+        self.reescribir(cortado)
+        with mock.patch.object(p1, 'mostrar_mensaje') as mensaje:
+            inventario = self.abrir()
+        self.assertEqual([disp.nombre for disp in inventario], ['srv1', 'r1', 'pc1'])
+        texto = mensaje.call_args[0][0]
+        self.assertIn('incompleto', texto)
+        self.assertIn('solo se cargaron los 3 dispositivos', texto)
+        self.assertNoPlegarSobre(inventario, cortado)
+
+    def test_cargar_y_plegar_una_instantanea_mal_formada(self):
+        danado = self.texto.replace('"NOMBRE": "pc1"', '"NOMBRE" "pc1"')
+        self.reescribir(danado)
+        with mock.patch.object(p1, 'mostrar_mensaje') as mensaje:
+            inventario = self.abrir()
+        self.assertEqual([disp.nombre for disp in inventario], ['srv1', 'r1'])
+        texto = mensaje.call_args[0][0]
+        self.assertIn('mal formado', texto)
+        self.assertNotIn('incompleto', texto)
+        self.assertNoPlegarSobre(inventario, danado)
+
+    def assertNoPlegarSobre(self, inventario, texto):
+        # El plegado lee en modo estricto: falla, el archivo queda como estaba y el diario se conserva
+        inventario.cambiar_ip(inventario.buscar_por_nombre('srv1'), '10.0.0.40')
+        with self.assertRaises(ValueError):
+            inventario.diario.compactar(esperar=True)
+        with open(self.archivo, encoding='utf-8') as f:
+            self.assertEqual(f.read(), texto)
+        self.assertEqual([entrada['op'] for entrada in p1.leer_diario(inventario.diario.ruta_compactando)], ['ip'])
+
+class PruebasVigilante(ConDirectorio):
+
+    def test_trae_los_cambios_de_fuera_y_conserva_los_locales(self):
+        inventario = self.abrir()
+        inventario.cambiar_ip(inventario.buscar_por_nombre('pc1'), '10.0.0.50')
+        self.escribir_desde_fuera(lambda otro: otro.agregar_servicio(otro.buscar_por_nombre('srv1'), SERVICIO['CORREO']))
+
+        self.assertTrue(inventario.vigilante.cambiado())
+        informe = inventario.vigilante.revisar()
+        self.assertEqual(informe, {'aplicados': 1, 'conflictos': [], 'rechazados': []})
+        self.assertIn(SERVICIO['CORREO'], inventario.buscar_por_nombre('srv1').servicios)
+        self.assertEqual(inventario.buscar_por_nombre('pc1').ip, '10.0.0.50')
+
+        inventario.diario.compactar(esperar=True)
+        self.assertEqual(self.en_archivo(), self.en_memoria(inventario))
+        # La escritura propia no cuenta como cambio de fuera
+        self.assertFalse(inventario.vigilante.cambiado())
+        self.assertIsNone(inventario.vigilante.revisar())
+
+    def test_conflicto_sin_decidir_conserva_el_local(self):
+        inventario = self.abrir()
+        inventario.cambiar_ip(inventario.buscar_por_nombre('pc1'), '10.0.0.50')
+        self.escribir_desde_fuera(lambda otro: otro.cambiar_ip(otro.buscar_por_nombre('pc1'), '10.0.0.60'))
+
+        informe = inventario.vigilante.revisar()
+        self.assertEqual(informe['conflictos'], [('pc1', False)])
+        self.assertEqual(informe['aplicados'], 0)
+        self.assertEqual(inventario.buscar_por_nombre('pc1').ip, '10.0.0.50')
+        inventario.diario.compactar(esperar=True)
+        self.assertEqual(self.en_archivo()['pc1']['IP'], '10.0.0.50')
+
+    def test_conflicto_decidido_por_el_archivo(self):
+        inventario = self.abrir()
+        inventario.cambiar_ip(inventario.buscar_por_nombre('pc1'), '10.0.0.50')
+        self.escribir_desde_fuera(lambda otro: otro.cambiar_ip(otro.buscar_por_nombre('pc1'), '10.0.0.60'))
+
+        vistos = []
+        def decidir(clave, local, del_archivo):
+            vistos.append((clave, local['IP'], del_archivo['IP']))
+            return True
+        informe = inventario.vigilante.revisar(decidir)
+        self.assertEqual(vistos, [('pc1', '10.0.0.50', '10.0.0.60')])
+        self.assertEqual(informe['conflictos'], [('pc1', True)])
+        self.assertEqual(inventario.buscar_por_nombre('pc1').ip, '10.0.0.60')
+        # El cambio local quedó en el diario, pero el plegado no lo vuelve a aplicar
+        inventario.diario.compactar(esperar=True)
+        self.assertEqual(self.en_archivo(), self.en_memoria(inventario))
+        self.assertEqual(self.en_archivo()['pc1']['IP'], '10.0.0.60')
+
+    def test_rechaza_una_ip_que_en_memoria_tiene_otro(self):
+        inventario = self.abrir()
+        inventario.cambiar_ip(inventario.buscar_por_nombre('pc2'), '10.0.0.70')
+        self.escribir_desde_fuera(lambda otro: otro.cambiar_ip(otro.buscar_por_nombre('srv1'), '10.0.0.70'))
+
+        informe = inventario.vigilante.revisar()
+        self.assertEqual(informe['aplicados'], 0)
+        self.assertEqual([clave for clave, _ in informe['rechazados']], ['srv1'])
+        self.assertEqual(inventario.buscar_por_nombre('srv1').ip, '10.0.0.1')
+        inventario.diario.compactar(esperar=True)
+        self.assertEqual(self.en_archivo(), self.en_memoria(inventario))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+# 🧪 Pruebas del mapa persistente y del historial de versiones (deshacer, rehacer y restaurar)
+import random
+import unittest
+from unittest import mock
+
+from comun import ConDirectorio, cargar_modulo
+
+p1 = cargar_modulo()
+
+class PruebasMapaPersistente(unittest.TestCase):
+
+    def revisar(self, mapa, esperado):
+        self.assertEqual(len(mapa), len(esperado))
+        self.assertEqual(dict(mapa), esperado)
+        for clave, valor in esperado.items():
+            self.assertEqual(mapa.obtener(clave), valor)
+        self.assertIsNone(mapa.obtener('no-esta'))
+
+    def corrida(self, semilla, claves):
+        azar = random.Random(semilla)
+        mapa, esperado = p1.MapaPersistente(), {}
+        versiones = []
+        for paso in range(1500):
+            clave = f"k{azar.randrange(claves)}"
+            if azar.random() < 0.3:
+                mapa, esperado = mapa.quitar(clave), {k: v for k, v in esperado.items() if k != clave}
+            else:
+                mapa, esperado = mapa.asignar(clave, paso), {**esperado, clave: paso}
+            if paso % 100 == 0:
+                versiones.append((mapa, esperado))
+        # Las versiones viejas siguen intactas y las diferencias entre ellas son las de los dicts
+        for (viejo, antes), (nuevo, despues) in zip(versiones, versiones[1:]):
+            self.revisar(viejo, antes)
+            diferencias = {clave: (a, d) for clave, a, d in viejo.diferencias(nuevo)}
+            esperadas = {clave: (antes.get(clave), despues.get(clave)) for clave in antes.keys() | despues.keys()
+                         if antes.get(clave) != despues.get(clave)}
+            self.assertEqual(diferencias, esperadas)
+        self.revisar(mapa, esperado)
+        self.revisar(p1.MapaPersistente.desde(esperado.items()), esperado)
+        self.assertEqual(list(mapa.diferencias(p1.MapaPersistente.desde(esperado.items()))), [])
+
+    def test_como_un_diccionario(self):
+        for semilla in range(3):
+            with self.subTest(semilla=semilla):
+                self.corrida(semilla, 300)
+
+    def test_con_colisiones_de_hash(self):
+        # Con un hash de 6 bits casi todo colisiona: se prueban los nodos de colisión
+        with mock.patch.object(p1, '_hash_clave', lambda clave: hash(clave) & 0x3F):
+            self.corrida(7, 200)
+
+    def test_asignar_lo_mismo_devuelve_el_mismo_mapa(self):
+        mapa = p1.MapaPersistente.desde({'a': 1, 'b': 2}.items())
+        self.assertIs(mapa.asignar('a', 1), mapa)
+        self.assertIs(mapa.quitar('zzz'), mapa)
+        self.assertEqual(len(mapa.aplicar({'a': None, 'c': 3})), 2)
+        self.assertEqual(dict(mapa), {'a': 1, 'b': 2})
+
+class PruebasHistorial(ConDirectorio):
+
+    def setUp(self):
+        super().setUp()
+        self.archivo = self.ruta('dispositivos.json')
+        p1.escribir_instantanea(self.archivo, [
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], f"pc{i}", f"10.0.0.{i + 1}") for i in range(5)])
+        self.inventario = self.abrir()
+
+    def abrir(self):
+        inventario = p1.cargar_dispositivos(self.archivo)
+        self.addCleanup(inventario.cerrar)
+        return inventario
+
+    def estado(self, inventario=None):
+        return sorted((disp.nombre, disp.ip) for disp in (inventario or self.inventario))
+
+    def test_versiones_y_diferencias(self):
+        historial = self.inventario.historial
+        self.assertEqual(historial.confirmar(), 1)
+        self.assertIsNone(historial.confirmar())
+        self.inventario.cambiar_ip(self.inventario.buscar_por_nombre('pc0'), '10.0.0.50')
+        self.inventario.eliminar(self.inventario.buscar_por_nombre('pc1'))
+        self.assertEqual(historial.confirmar(), 2)
+        self.assertEqual([(clave, bool(antes), bool(despues)) for clave, antes, despues in historial.diferencias(1, 2)],
+                         [('pc0', True, True), ('pc1', True, False)])
+        self.assertEqual(historial.version(2)[3], 2)
+        with self.assertRaises(ValueError):
+            historial.version(9)
+        self.assertEqual(historial.version(fecha='2999-01-01')[0], 2)
+
+        # Releídas del archivo, las versiones son las mismas
+        self.inventario.cerrar()
+        releido = self.abrir().historial
+        self.assertEqual([numero for numero, _, _, _ in releido.versiones()], [1, 2])
+        self.assertEqual(dict(releido.version(1)[2]), dict(historial.version(1)[2]))
+
+    def test_restaurar_una_version(self):
+        historial = self.inventario.historial
+        historial.confirmar()
+        antes = self.estado()
+        self.inventario.renombrar(self.inventario.buscar_por_nombre('pc2'), 'pc-caja')
+        # pc0 y pc1 intercambian IPs: al restaurar hay que soltarlas antes de reasignarlas
+        pc0, pc1 = self.inventario.buscar_por_nombre('pc0'), self.inventario.buscar_por_nombre('pc1')
+        self.inventario.cambiar_ip(pc0, None)
+        self.inventario.cambiar_ip(pc1, '10.0.0.1')
+        self.inventario.cambiar_ip(pc0, '10.0.0.2')
+        self.inventario.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc9'))
+        pc_caja = self.inventario.buscar_por_nombre('pc-caja')
+        historial.restaurar(historial.version(1)[2])
+        self.assertEqual(self.estado(), antes)
+        # El cambio de nombre se deshace renombrando, no con un dispositivo nuevo
+        self.assertIs(self.inventario.buscar_por_nombre('pc2'), pc_caja)
+        self.inventario.cerrar()
+        self.assertEqual(self.estado(self.abrir()), antes)
+
+    def test_deshacer_y_rehacer(self):
+        historial = self.inventario.historial
+        inicial = self.estado()
+        with historial.accion():
+            self.inventario.cambiar_ip(self.inventario.buscar_por_nombre('pc3'), '10.0.1.1')
+        with historial.accion():
+            self.inventario.eliminar(self.inventario.buscar_por_nombre('pc4'))
+        with historial.accion():
+            pass   # sin cambios no hay punto para deshacer
+        self.assertEqual(historial.pendientes(), (2, 0))
+        intermedio = self.estado()
+        historial.deshacer()
+        self.assertEqual(len(self.inventario), 5)
+        historial.deshacer()
+        self.assertEqual(self.estado(), inicial)
+        with self.assertRaisesRegex(ValueError, "deshacer"):
+            historial.deshacer()
+        historial.rehacer()
+        historial.rehacer()
+        self.assertEqual(self.estado(), intermedio)
+        self.assertEqual(historial.pendientes(), (2, 0))
+        # Una acción nueva descarta lo que se podía rehacer
+        historial.deshacer()
+        with historial.accion():
+            self.inventario.cambiar_ip(self.inventario.buscar_por_nombre('pc0'), None)
+        self.assertEqual(historial.pendientes(), (2, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# 🧪 Pruebas de las ediciones masivas: vista previa, todo o nada y vuelta atrás si algo falla
+import unittest
+from unittest import mock
+
+from comun import ConDirectorio, cargar_modulo
+
+p1 = cargar_modulo()
+
+def servidores(cantidad):
+    return [p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['SERVIDOR'], f"srv{i}", f"10.0.0.{i + 1}", None, [p1.SERVICIOS_VALIDOS['DNS']])
+            for i in range(cantidad)]
+
+def estado(inventario):
+    return sorted((disp.nombre, disp.ip, disp.capa, tuple(disp.servicios)) for disp in inventario)
+
+class PruebasEdicionMasiva(ConDirectorio):
+
+    def abrir(self, archivo):
+        inventario = p1.cargar_dispositivos(archivo)
+        self.addCleanup(inventario.cerrar)
+        return inventario
+
+    def preparar(self, nombre):
+        archivo = self.ruta(nombre)
+        if p1.es_sqlite(archivo):
+            base = p1.InventarioSQLite(archivo)
+            base.agregar_lote(servidores(6))
+            base.cerrar()
+        else:
+            p1.escribir_instantanea(archivo, servidores(6))
+        return archivo
+
+    def test_simular_no_cambia_nada(self):
+        inventario = self.abrir(self.preparar('dispositivos.json'))
+        antes = estado(inventario)
+        cambios = inventario.editar_lote('add-service', p1.SERVICIOS_VALIDOS['WEB'], simular=True)
+        self.assertEqual(len(cambios), 6)
+        self.assertEqual(estado(inventario), antes)
+
+    def test_un_fallo_a_mitad_deshace_lo_aplicado(self):
+        for nombre in ('dispositivos.json', 'dispositivos.db'):
+            with self.subTest(almacen=nombre):
+                archivo = self.preparar(nombre)
+                inventario = self.abrir(archivo)
+                antes = estado(inventario)
+                original = inventario.agregar_servicio
+                llamadas = []
+
+                def agregar_servicio(disp, servicio):
+                    llamadas.append(disp.nombre)
+                    if len(llamadas) == 4:
+                        raise OSError("disco lleno")
+                    original(disp, servicio)
+
+                with mock.patch.object(inventario, 'agregar_servicio', agregar_servicio):
+                    with self.assertRaises(OSError):
+                        inventario.editar_lote('add-service', p1.SERVICIOS_VALIDOS['WEB'])
+                self.assertEqual(estado(inventario), antes)
+                inventario.cerrar()
+                # Lo escrito (diario o base) tampoco conserva los primeros cambios
+                self.assertEqual(estado(self.abrir(archivo)), antes)
+
+    def test_renumerar_con_una_ip_ocupada_entre_vista_y_aplicacion(self):
+        inventario = self.abrir(self.preparar('dispositivos.json'))
+        inventario.subredes.agregar('10.9.0.0/29')
+        antes = estado(inventario)
+        cambios = p1.planificar_edicion(inventario, 'renumber', '10.9.0.0/29')
+        self.assertEqual(len(cambios), 6)
+        # Otro operador toma la cuarta dirección antes de confirmar
+        inventario.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'intruso', cambios[3][2]))
+        with self.assertRaises(ValueError):
+            p1.aplicar_edicion(inventario, 'renumber', cambios)
+        self.assertEqual([fila for fila in estado(inventario) if fila[0] != 'intruso'], antes)
+        # De la subred solo queda reservada la dirección del intruso
+        subred = inventario.subredes.obtener('10.9.0.0/29')
+        self.assertEqual(subred.utilizacion()[0], 1)
+        self.assertFalse(subred.esta_libre(cambios[3][2]))
+
+    def test_sin_espacio_no_se_aplica_nada(self):
+        inventario = self.abrir(self.preparar('dispositivos.json'))
+        inventario.subredes.agregar('10.9.0.0/30')
+        antes = estado(inventario)
+        with self.assertRaisesRegex(ValueError, "direcciones libres"):
+            inventario.editar_lote('renumber', '10.9.0.0/30')
+        self.assertEqual(estado(inventario), antes)
+
+if __name__ == '__main__':
+    unittest.main()
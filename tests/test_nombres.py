@@ -0,0 +1,56 @@
+# 🧪 Pruebas del índice de nombres (búsqueda clasificada y tolerante a erratas)
+import unittest
+
+from comun import cargar_modulo
+
+p1 = cargar_modulo()
+
+class PruebasIndiceNombres(unittest.TestCase):
+
+    def setUp(self):
+        self.indice = p1.IndiceNombres(['sw-core1', 'sw-core2', 'sw-acceso1', 'router-borde', 'srv-dns'] +
+                                       [f"pc-{i}" for i in range(20000)])
+
+    def test_orden_exacto_prefijo_subcadena(self):
+        self.assertEqual(self.indice.buscar('SW-CORE1'), ['sw-core1', 'sw-core2'])
+        self.assertEqual(self.indice.buscar('sw-', 2), ['sw-acceso1', 'sw-core1'])
+        self.assertEqual(self.indice.buscar('borde'), ['router-borde'])
+        self.assertEqual(self.indice.buscar('   '), [])
+
+    def test_erratas_a_una_edicion(self):
+        for errata in ('sw-cor1', 'sw-croe1', 'sw-corex1', 'sw-cxre1'):
+            with self.subTest(errata=errata):
+                self.assertIn('sw-core1', self.indice.buscar(errata))
+        self.assertIn('pc-12345', self.indice.vecinos('pc-1234x'))
+        # Si el texto ya es un nombre, va primero y sus vecinos después
+        self.assertEqual(self.indice.buscar('pc-12354')[0], 'pc-12354')
+        self.assertIn('pc-12345', self.indice.buscar('pcx-12345'))
+
+    def test_agregar_y_quitar_tras_la_primera_errata(self):
+        # La primera errata arma la tabla de letras intermedias; lo agregado después debe verse
+        self.indice.buscar('sw-cor1')
+        self.indice.agregar('Qz-Bodega')
+        self.assertIn('qz-bodega', self.indice.vecinos('qz-bodeja'))
+        self.assertIn('qz-bodega', self.indice.buscar('qz-bdega'))
+        self.indice.quitar('sw-core1')
+        self.assertNotIn('sw-core1', self.indice.buscar('sw-cor1'))
+        self.assertIn('sw-core2', self.indice.buscar('sw-cor1'))
+
+    def test_subcadena_con_presupuesto(self):
+        # Con presupuesto solo se miran los primeros ids, pero lo encontrado contiene el texto
+        encontrados = self.indice.contienen('pc-1', presupuesto=50)
+        self.assertTrue(encontrados)
+        self.assertTrue(all('pc-1' in nombre for nombre in encontrados))
+        self.assertLessEqual(len(encontrados), 50)
+        self.assertIsNone(self.indice.contienen('pc'))
+        self.assertEqual(self.indice.contienen('zzz'), [])
+
+    def test_reconstruir_tras_muchos_huecos(self):
+        for i in range(15000):
+            self.indice.quitar(f"pc-{i}")
+        self.assertEqual(len(self.indice), 5005)
+        self.assertEqual(self.indice.buscar('pc-19999')[0], 'pc-19999')
+        self.assertNotIn('pc-14990', self.indice.buscar('pc-1499'))
+
+if __name__ == '__main__':
+    unittest.main()
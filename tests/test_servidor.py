@@ -0,0 +1,85 @@
+# 🧪 Pruebas del servidor de inventario compartido (versiones por registro y errores)
+import asyncio
+import json
+import unittest
+
+from comun import ConDirectorio, cargar_modulo
+
+p1 = cargar_modulo()
+
+class PruebasServidor(ConDirectorio):
+
+    def setUp(self):
+        super().setUp()
+        self.archivo = self.ruta('dispositivos.json')
+        p1.escribir_instantanea(self.archivo, [
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['SERVIDOR'], 'srv1', '10.0.0.1', None, [p1.SERVICIOS_VALIDOS['DNS']]),
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc1', '10.0.0.10')])
+        self.inventario = p1.cargar_dispositivos(self.archivo)
+        self.addCleanup(self.inventario.cerrar)
+        self.servidor = p1.ServidorInventario(self.inventario, self.archivo)
+
+    def pedir(self, **solicitud):
+        linea = asyncio.run(self.servidor.responder(json.dumps(solicitud).encode('utf-8')))
+        return json.loads(linea)
+
+    def test_cambio_con_version_vieja_es_un_conflicto(self):
+        leido = self.pedir(op='get', nombre='pc1')['dispositivo']
+        primero = self.pedir(op='set-ip', nombre='pc1', ip='10.0.0.20', version=leido['version'])
+        self.assertTrue(primero['ok'])
+        self.assertGreater(primero['dispositivo']['version'], leido['version'])
+
+        # Otro operador todavía tiene la versión leída antes del cambio
+        segundo = self.pedir(op='set-ip', nombre='pc1', ip='10.0.0.30', version=leido['version'])
+        self.assertFalse(segundo['ok'])
+        self.assertTrue(segundo['conflicto'])
+        self.assertEqual(segundo['dispositivo']['IP'], '10.0.0.20')
+        self.assertEqual(self.inventario.buscar_por_nombre('pc1').ip, '10.0.0.20')
+
+        # Con la versión actual el cambio entra
+        tercero = self.pedir(op='set-ip', nombre='pc1', ip='10.0.0.30', version=segundo['dispositivo']['version'])
+        self.assertTrue(tercero['ok'])
+
+    def test_la_version_solo_cambia_con_el_registro_propio(self):
+        pc1 = self.pedir(op='get', nombre='pc1')['dispositivo']
+        self.assertTrue(self.pedir(op='add-service', nombre='srv1', servicio='web')['ok'])
+        self.assertTrue(self.pedir(op='set-ip', nombre='pc1', ip='10.0.0.21', version=pc1['version'])['ok'])
+
+    def test_renombrar_y_eliminar_olvidan_la_version(self):
+        leido = self.pedir(op='get', nombre='pc1')['dispositivo']
+        self.assertTrue(self.pedir(op='rename', nombre='pc1', nuevo='pc-caja', version=leido['version'])['ok'])
+        self.assertFalse(self.pedir(op='set-ip', nombre='pc1', ip='10.0.0.22')['ok'])
+        renombrado = self.pedir(op='get', nombre='pc-caja')['dispositivo']
+        self.assertTrue(self.pedir(op='delete', nombre='pc-caja', version=renombrado['version'])['ok'])
+        self.assertNotIn('pc-caja', self.servidor.versiones)
+
+    def test_salud_invalida_se_rechaza_sin_tocar_la_memoria(self):
+        for salud in ('basura', ['activo'], {'estado': 'quizas'}, {'estado': 'activo', 'latencia_ms': 'lento'},
+                      {'estado': 'activo', 'servicios': {'DNS': 'arriba'}}):
+            with self.subTest(salud=salud):
+                respuesta = self.pedir(op='health', nombre='srv1', salud=salud)
+                self.assertFalse(respuesta['ok'])
+                self.assertIn('inválido', respuesta['error'])
+                self.assertIsNone(self.inventario.buscar_por_nombre('srv1').salud)
+        salud = {'estado': p1.SALUD_ACTIVO, 'latencia_ms': 0.4, 'servicios': {'DNS': {'estado': p1.SALUD_ACTIVO}}}
+        self.assertTrue(self.pedir(op='health', nombre='srv1', salud=salud)['ok'])
+        self.assertEqual(self.inventario.buscar_por_nombre('srv1').salud, salud)
+        self.assertTrue(self.pedir(op='health', nombre='srv1', salud=None)['ok'])
+        self.assertIsNone(self.inventario.buscar_por_nombre('srv1').salud)
+
+    def test_un_fallo_inesperado_se_responde_sin_cortar(self):
+        def fallar(solicitud):
+            raise KeyError('roto')
+        self.servidor.procesar = fallar
+        respuesta = self.pedir(op='count')
+        self.assertFalse(respuesta['ok'])
+        self.assertIn('KeyError', respuesta['error'])
+
+    def test_solicitudes_invalidas(self):
+        self.assertFalse(self.pedir(op='desconocida')['ok'])
+        self.assertFalse(self.pedir(op='add', nombre='sin-tipo')['ok'])
+        linea = asyncio.run(self.servidor.responder(b'no es json\n'))
+        self.assertEqual(json.loads(linea)['error'], "Solicitud inválida: no es JSON")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# 🧪 Pruebas del inventario en SQLite: consultas en la base, unicidad y transacciones
+import unittest
+
+from comun import ConDirectorio, cargar_modulo
+
+p1 = cargar_modulo()
+
+class PruebasSQLite(ConDirectorio):
+
+    def setUp(self):
+        super().setUp()
+        self.archivo = self.ruta('dispositivos.db')
+        self.base = self.abrir()
+        self.base.agregar_lote([
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['ROUTER'], 'r1', '10.0.0.1', p1.CAPAS_RED['NUCLEO'], [p1.SERVICIOS_VALIDOS['VPN']]),
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['SERVIDOR'], 'srv1', '10.0.0.2', None, [p1.SERVICIOS_VALIDOS['DNS']]),
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc1')])
+
+    def abrir(self):
+        base = p1.cargar_dispositivos(self.archivo)
+        self.addCleanup(base.cerrar)
+        return base
+
+    def test_cambios_persisten_al_reabrir(self):
+        srv1 = self.base.buscar_por_nombre('srv1')
+        self.base.cambiar_ip(srv1, '10.0.0.20')
+        self.base.agregar_servicio(srv1, p1.SERVICIOS_VALIDOS['WEB'])
+        self.base.renombrar(self.base.buscar_por_nombre('pc1'), 'pc-caja')
+        self.base.eliminar(self.base.buscar_por_nombre('r1'))
+        self.base.cerrar()
+
+        reabierta = self.abrir()
+        self.assertEqual(len(reabierta), 2)
+        self.assertEqual(reabierta.buscar_por_ip('10.0.0.20').nombre, 'srv1')
+        self.assertEqual(len(reabierta.buscar_por_nombre('srv1').servicios), 2)
+        self.assertIsNotNone(reabierta.buscar_por_nombre('PC-CAJA'))
+        self.assertIsNone(reabierta.buscar_por_nombre('r1'))
+        # Los servicios de un eliminado se borran en cascada
+        self.assertEqual(reabierta.filtrar(servicio=p1.SERVICIOS_VALIDOS['VPN']), [])
+        self.assertEqual([disp.nombre for disp in reabierta.filtrar(servicio=p1.SERVICIOS_VALIDOS['WEB'])], ['srv1'])
+
+    def test_unicidad_de_nombre_e_ip(self):
+        with self.assertRaises(ValueError):
+            self.base.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'PC1'))
+        with self.assertRaises(ValueError):
+            self.base.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc2', '10.0.0.1'))
+        with self.assertRaises(ValueError):
+            self.base.cambiar_ip(self.base.buscar_por_nombre('pc1'), '10.0.0.2')
+        with self.assertRaises(ValueError):
+            self.base.renombrar(self.base.buscar_por_nombre('pc1'), 'SRV1')
+        self.assertEqual(len(self.base), 3)
+
+    def test_consultas_resueltas_por_la_base(self):
+        self.assertEqual([disp.nombre for disp in self.base.filtrar(tipo='router', capa='nucleo')], ['r1'])
+        self.assertEqual([disp.nombre for disp in self.base.filtrar(servicio=p1.SERVICIOS_VALIDOS['DNS'])], ['srv1'])
+        self.base.registrar_salud(self.base.buscar_por_nombre('r1'), {'estado': p1.SALUD_ACTIVO})
+        self.assertEqual([disp.nombre for disp in self.base.filtrar(salud=p1.SALUD_ACTIVO)], ['r1'])
+        self.assertEqual(len(self.base.filtrar(salud=p1.SALUD_SIN_REVISAR)), 2)
+        self.assertEqual([disp.nombre for disp in self.base.buscar_texto('_')], [])
+        self.assertEqual([disp.nombre for disp in self.base[1:3]], ['srv1', 'pc1'])
+        self.assertEqual(self.base[-1].nombre, 'pc1')
+        self.assertEqual(sorted(self.base.ips()), ['10.0.0.1', '10.0.0.2'])
+
+    def test_un_mismo_objeto_por_fila(self):
+        self.assertIs(self.base.buscar_por_nombre('srv1'), self.base.buscar_por_ip('10.0.0.2'))
+        self.assertIn(self.base.buscar_por_nombre('srv1'), self.base)
+
+    def test_transaccion_todo_o_nada(self):
+        with self.assertRaises(ValueError):
+            with self.base.transaccion():
+                self.base.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc2', '10.0.0.9'))
+                self.base.cambiar_ip(self.base.buscar_por_nombre('pc1'), '10.0.0.10')
+                self.base.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc3', '10.0.0.1'))
+        self.assertEqual(len(self.base), 3)
+        self.assertIsNone(self.base.buscar_por_nombre('pc2'))
+        self.assertIsNone(self.base.buscar_por_nombre('pc1').ip)
+
+    def test_migrar_desde_json_y_volver(self):
+        origen = self.ruta('origen.json')
+        p1.escribir_instantanea(origen, [p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], f"pc{i}", f"10.1.0.{i}") for i in range(1, 51)])
+        destino = self.ruta('migrada.db')
+        self.assertEqual(p1.migrar_almacen(origen, destino), 50)
+        with self.assertRaises(ValueError):
+            p1.migrar_almacen(origen, destino)
+        vuelta = self.ruta('vuelta.json')
+        self.assertEqual(p1.migrar_almacen(destino, vuelta), 50)
+        self.assertEqual([registro['NOMBRE'] for registro in p1.iterar_instantanea(vuelta)], [f"pc{i}" for i in range(1, 51)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# 🧪 Pruebas de subredes: árbol de segmentos de libres y archivo propio de cada inventario
+import json
+import os
+import random
+import unittest
+
+from comun import ConDirectorio, cargar_modulo
+
+p1 = cargar_modulo()
+
+class PruebasSubred(unittest.TestCase):
+
+    def test_libres_en_orden_sin_red_ni_difusion(self):
+        subred = p1.Subred('10.1.0.0/29')
+        self.assertEqual(subred.libres(10), [f"10.1.0.{i}" for i in range(1, 7)])
+        self.assertEqual(subred.utilizacion(), (0, 6, 0.0))
+        self.assertFalse(subred.contiene('10.1.0.9'))
+
+    def test_reservar_y_liberar(self):
+        subred = p1.Subred('10.1.0.0/29')
+        self.assertTrue(subred.reservar('10.1.0.1'))
+        self.assertFalse(subred.reservar('10.1.0.1'))
+        self.assertTrue(subred.reservar('10.1.0.3'))
+        self.assertEqual(subred.siguiente_libre(), '10.1.0.2')
+        self.assertEqual(subred.libres(2), ['10.1.0.2', '10.1.0.4'])
+        self.assertTrue(subred.liberar('10.1.0.1'))
+        self.assertEqual(subred.siguiente_libre(), '10.1.0.1')
+        self.assertFalse(subred.reservar('10.2.0.1'))
+        for i in range(1, 7):
+            subred.reservar(f"10.1.0.{i}")
+        self.assertIsNone(subred.siguiente_libre())
+        self.assertEqual(subred.libres(3), [])
+        self.assertEqual(subred.utilizacion()[2], 100.0)
+
+    def test_nunca_ofrece_las_terminadas_en_255(self):
+        subred = p1.Subred('10.1.0.0/23')
+        self.assertNotIn('10.1.0.255', subred.libres(510))
+        self.assertFalse(subred.esta_libre('10.1.0.255'))
+        self.assertFalse(subred.liberar('10.1.0.255'))
+        self.assertEqual(subred.utilizacion()[1], 509)
+
+    def test_coincide_con_un_recorrido_directo(self):
+        subred = p1.Subred('10.3.0.0/22')
+        todas = [f"10.3.{i // 256}.{i % 256}" for i in range(1, 1023) if i % 256 != 255]
+        libres = set(todas)
+        azar = random.Random(8)
+        for _ in range(3000):
+            ip = azar.choice(todas)
+            if azar.random() < 0.6:
+                subred.reservar(ip)
+                libres.discard(ip)
+            else:
+                subred.liberar(ip)
+                libres.add(ip)
+            esperadas = [ip for ip in todas if ip in libres]
+            self.assertEqual(subred.siguiente_libre(), esperadas[0] if esperadas else None)
+        self.assertEqual(subred.libres(2000), esperadas)
+
+    def test_subredes_invalidas(self):
+        for cidr in ('10.0.0.1/24', '10.0.0.0/8', '0.0.0.0/24', 'basura'):
+            with self.subTest(cidr=cidr):
+                with self.assertRaises(ValueError):
+                    p1.Subred(cidr)
+
+class PruebasGestorSubredes(ConDirectorio):
+
+    def setUp(self):
+        super().setUp()
+        self.archivo = self.ruta('dispositivos.json')
+        p1.escribir_instantanea(self.archivo, [
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc1', '10.0.0.1'),
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc2', '10.0.0.2')])
+
+    def abrir(self, archivo=None):
+        inventario = p1.cargar_dispositivos(archivo or self.archivo)
+        self.addCleanup(inventario.cerrar)
+        return inventario
+
+    def test_sigue_los_cambios_del_inventario(self):
+        inventario = self.abrir()
+        inventario.subredes.agregar('10.0.0.0/29')
+        self.assertEqual(inventario.subredes.asignar('10.0.0.0/29'), '10.0.0.3')
+        pc1 = inventario.buscar_por_nombre('pc1')
+        inventario.cambiar_ip(pc1, '10.0.0.5')
+        inventario.eliminar(inventario.buscar_por_nombre('pc2'))
+        subred = inventario.subredes.obtener('10.0.0.0/29')
+        self.assertEqual(subred.libres(10), ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4', '10.0.0.6'])
+        self.assertIs(inventario.subredes.subred_de('10.0.0.6'), subred)
+        self.assertIsNone(inventario.subredes.subred_de('10.9.0.1'))
+        with self.assertRaises(ValueError):
+            inventario.subredes.agregar('10.0.0.0/24')
+
+    def test_cada_inventario_tiene_sus_subredes(self):
+        otro = self.ruta('otro.json')
+        p1.escribir_instantanea(otro, [])
+        self.abrir().subredes.agregar('10.0.0.0/24')
+        self.assertTrue(os.path.exists(self.archivo + '.subredes'))
+        self.assertEqual(len(self.abrir(otro).subredes), 0)
+        self.assertEqual([str(subred) for subred in self.abrir().subredes], ['10.0.0.0/24'])
+
+    def test_hereda_el_archivo_compartido_de_antes(self):
+        with open(self.ruta('subredes.json'), 'w') as f:
+            json.dump(['10.0.0.0/24'], f)
+        inventario = self.abrir()
+        self.assertEqual(inventario.subredes.obtener('10.0.0.0/24').utilizacion()[0], 2)
+        inventario.subredes.eliminar('10.0.0.0/24')
+        # Desde ahí manda el archivo propio, aunque el compartido siga ahí
+        self.assertEqual(len(self.abrir().subredes), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# 🧪 Pruebas de la topología: enlaces propios de cada inventario y árboles incrementales
+import json
+import os
+import random
+import unittest
+
+from comun import ConDirectorio, cargar_modulo
+
+p1 = cargar_modulo()
+
+def equipos():
+    return [p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['ROUTER'], 'r1', '10.0.0.1', p1.CAPAS_RED['NUCLEO']),
+            p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['SWITCH'], 's1', '10.0.0.2', p1.CAPAS_RED['ACCESO'])]
+
+class PruebasArchivoEnlaces(ConDirectorio):
+
+    def setUp(self):
+        super().setUp()
+        self.archivo = self.ruta('dispositivos.json')
+        p1.escribir_instantanea(self.archivo, equipos())
+
+    def abrir(self, archivo=None):
+        inventario = p1.cargar_dispositivos(archivo or self.archivo)
+        self.addCleanup(inventario.cerrar)
+        return inventario
+
+    def test_cada_inventario_tiene_sus_enlaces(self):
+        otro = self.ruta('otro.json')
+        p1.escribir_instantanea(otro, equipos())
+        self.abrir().topologia.enlazar('s1', 'r1')
+        self.assertTrue(os.path.exists(self.archivo + '.enlaces'))
+        self.assertEqual(len(self.abrir(otro).topologia), 0)
+        self.assertEqual(list(self.abrir().topologia.enlaces()), [('s1', 'r1', 'uplink')])
+
+    def test_hereda_el_archivo_compartido_de_antes(self):
+        with open(self.ruta('enlaces.json'), 'w') as f:
+            json.dump([{'origen': 's1', 'destino': 'r1', 'tipo': 'uplink'}], f)
+        inventario = self.abrir()
+        self.assertEqual(len(inventario.topologia), 1)
+        inventario.topologia.desenlazar('s1', 'r1')
+        self.assertEqual(len(self.abrir().topologia), 0)
+
+    def test_migrar_lleva_subredes_y_enlaces(self):
+        inventario = self.abrir()
+        inventario.topologia.enlazar('s1', 'r1')
+        inventario.subredes.agregar('10.0.0.0/24')
+        inventario.cerrar()
+        for destino in ('dispositivos.db', 'dispositivos.bin', 'dispositivos.zonas'):
+            with self.subTest(destino=destino):
+                p1.migrar_almacen(self.archivo, self.ruta(destino))
+                migrado = self.abrir(self.ruta(destino))
+                self.assertEqual(len(migrado.topologia), 1)
+                if migrado.subredes is not None:
+                    self.assertEqual([str(subred) for subred in migrado.subredes], ['10.0.0.0/24'])
+
+CAPAS = [p1.CAPAS_RED['NUCLEO'], p1.CAPAS_RED['DISTRIBUCION'], p1.CAPAS_RED['ACCESO'], None]
+
+class PruebasArbolesIncrementales(ConDirectorio):
+    """Tras cada cambio, dominadores, conteos por capa y saltos deben ser los de reconstruir desde cero"""
+
+    def reconstruida(self, inventario, topologia):
+        nueva = p1.Topologia(inventario, self.ruta('reconstruida.json'))
+        for origen, destino, tipo in topologia.enlaces():
+            nueva.enlazar(origen, destino, tipo, guardar=False)
+        nueva._preparar()
+        nueva._preparar_rutas()
+        return nueva
+
+    def comparar(self, inventario, topologia, contexto):
+        if topologia._idom is None or topologia._padre is None:
+            self.descartados += 1
+        topologia._preparar()
+        topologia._preparar_rutas()
+        nueva = self.reconstruida(inventario, topologia)
+
+        def sin_ceros(debajo):
+            limpio = {clave: {capa: n for capa, n in capas.items() if n} for clave, capas in debajo.items()}
+            return {clave: capas for clave, capas in limpio.items() if capas}
+
+        self.assertEqual(topologia._idom, nueva._idom, contexto)
+        self.assertEqual(topologia._nivel, nueva._nivel, contexto)
+        self.assertEqual(sin_ceros(topologia._debajo), sin_ceros(nueva._debajo), contexto)
+        self.assertEqual(topologia._saltos, nueva._saltos, contexto)
+
+    def corrida(self, semilla, cantidad, pasos=150):
+        azar = random.Random(semilla)
+        inventario = p1.Inventario()
+        for i in range(cantidad):
+            inventario.agregar(p1.Dispositivo(p1.TIPOS_DISPOSITIVO['SWITCH'], f"n{i}", None, azar.choice(CAPAS)))
+        # Renombrar guarda los enlaces: que sea en el directorio de la prueba
+        topologia = p1.Topologia(inventario, self.ruta('dispositivos.json'))
+        inventario.oyentes.append(topologia)
+        inventario.topologia = topologia
+        topologia._preparar()
+        topologia._preparar_rutas()
+        for paso in range(pasos):
+            nombres = [disp.nombre for disp in inventario]
+            disp = inventario.buscar_por_nombre(azar.choice(nombres))
+            sorteo = azar.random()
+            try:
+                if sorteo < 0.5:
+                    origen, destino = azar.sample(nombres, 2)
+                    operacion = f"enlazar {origen} {destino}"
+                    topologia.enlazar(origen, destino, azar.choice(['uplink', 'uplink', 'troncal']), guardar=False)
+                elif sorteo < 0.75:
+                    enlaces = list(topologia.enlaces())
+                    if not enlaces:
+                        continue
+                    origen, destino, _ = azar.choice(enlaces)
+                    operacion = f"desenlazar {origen} {destino}"
+                    topologia.desenlazar(origen, destino, guardar=False)
+                elif sorteo < 0.85:
+                    capa = azar.choice(CAPAS)
+                    if topologia.problemas_capas({disp.nombre.lower(): capa}):
+                        continue
+                    operacion = f"capa {disp.nombre} {capa}"
+                    inventario.cambiar_capa(disp, capa)
+                elif sorteo < 0.92:
+                    operacion = f"renombrar {disp.nombre}"
+                    inventario.renombrar(disp, disp.nombre + 'x')
+                else:
+                    operacion = f"eliminar {disp.nombre}"
+                    inventario.eliminar(disp)
+                    inventario.agregar(p1.Dispositivo(p1.TIPOS_DISPOSITIVO['SWITCH'], f"m{paso}", None, azar.choice(CAPAS)))
+            except ValueError:
+                # Ciclos y enlaces repetidos se rechazan sin tocar nada
+                operacion = "rechazado"
+            self.comparar(inventario, topologia, f"semilla {semilla}, paso {paso}: {operacion}")
+
+    def test_secuencias_al_azar(self):
+        self.descartados = 0
+        for semilla in range(30):
+            cantidad = random.Random(semilla).choice([8, 15, 40])
+            with self.subTest(semilla=semilla, cantidad=cantidad):
+                self.corrida(semilla, cantidad)
+        # Si los árboles se descartaran a cada paso, la comparación no probaría lo incremental
+        self.assertLess(self.descartados, 30 * 150 // 10)
+
+if __name__ == '__main__':
+    unittest.main()
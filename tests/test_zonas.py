@@ -0,0 +1,100 @@
+# 🧪 Pruebas del inventario por zonas: filtros de Bloom, carga perezosa y cambios de zona
+import unittest
+
+from comun import ConDirectorio, cargar_modulo
+
+p1 = cargar_modulo()
+
+class PruebasFiltroBloom(unittest.TestCase):
+
+    def test_sin_falsos_negativos_y_pocos_positivos(self):
+        filtro = p1.FiltroBloom(5000)
+        for i in range(5000):
+            filtro.agregar(f"pc-{i}")
+        self.assertTrue(all(f"pc-{i}" in filtro for i in range(5000)))
+        falsos = sum(f"otro-{i}" in filtro for i in range(20000))
+        self.assertLess(falsos / 20000, 0.03)
+
+    def test_ida_y_vuelta_por_texto(self):
+        filtro = p1.FiltroBloom(100)
+        filtro.agregar('10.0.0.1')
+        copia = p1.FiltroBloom.desde_texto(filtro.a_texto())
+        self.assertIn('10.0.0.1', copia)
+        self.assertEqual(copia.bits, filtro.bits)
+        # La huella es estable entre procesos: sirve para cualquier filtro
+        self.assertTrue(copia.contiene(p1.FiltroBloom.huella('10.0.0.1')))
+
+class PruebasZonas(ConDirectorio):
+
+    def setUp(self):
+        super().setUp()
+        self.archivo = self.ruta('red.zonas')
+        zonas = p1.InventarioZonas(self.archivo, procesos=1)
+        zonas.crear_zona('norte', ['10.1.0.0/16'])
+        zonas.crear_zona('sur', ['10.2.0.0/16'])
+        for i in range(20):
+            zonas.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], f"pc-n{i}", f"10.1.0.{i + 1}"))
+            zonas.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], f"pc-s{i}", f"10.2.0.{i + 1}"))
+        zonas.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc-suelto'))
+        zonas.guardar()
+
+    def abrir(self):
+        return p1.InventarioZonas(self.archivo, procesos=1)
+
+    def cantidades(self, zonas):
+        return {zona: cantidad for zona, cantidad, _, _ in zonas.zonas()}
+
+    def test_buscar_abre_solo_la_zona_posible(self):
+        zonas = self.abrir()
+        self.assertEqual(len(zonas), 41)
+        self.assertEqual(zonas.buscar_por_nombre('PC-S3').ip, '10.2.0.4')
+        self.assertEqual({zona for zona, _, _, cargada in zonas.zonas() if cargada}, {'sur'})
+        self.assertIsNone(zonas.buscar_por_ip('10.1.9.9'))
+        self.assertNotIn('sur', [zona for zona, _, _, cargada in zonas.zonas() if not cargada])
+
+    def test_unicidad_entre_zonas(self):
+        zonas = self.abrir()
+        with self.assertRaises(ValueError):
+            zonas.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc-n5', '10.2.9.9'))
+        with self.assertRaises(ValueError):
+            zonas.agregar(p1.crear_dispositivo(p1.TIPOS_DISPOSITIVO['PC'], 'pc-nuevo', '10.1.0.5'))
+
+    def test_cambiar_ip_a_otra_subred_muda_de_zona(self):
+        zonas = self.abrir()
+        disp = zonas.buscar_por_nombre('pc-n0')
+        zonas.cambiar_ip(disp, '10.2.5.5')
+        self.assertEqual(zonas.zona_de[disp], 'sur')
+        self.assertEqual(self.cantidades(zonas), {'norte': 19, 'sur': 21, 'general': 1})
+        zonas.guardar()
+
+        reabierto = self.abrir()
+        self.assertEqual(self.cantidades(reabierto), {'norte': 19, 'sur': 21, 'general': 1})
+        self.assertEqual(reabierto.buscar_por_ip('10.2.5.5').nombre, 'pc-n0')
+        self.assertEqual(reabierto.zona_de[reabierto.buscar_por_nombre('pc-n0')], 'sur')
+        reabierto.cargar_zonas()
+        self.assertEqual(len(reabierto), 41)
+        self.assertEqual(sorted(disp.nombre for disp, zona in reabierto.zona_de.items() if zona == 'norte'),
+                         sorted(f"pc-n{i}" for i in range(1, 20)))
+
+    def test_cambiar_ip_sin_subred_conserva_la_zona(self):
+        zonas = self.abrir()
+        disp = zonas.buscar_por_nombre('pc-n1')
+        zonas.cambiar_ip(disp, '172.16.0.1')
+        self.assertEqual(zonas.zona_de[disp], 'norte')
+        zonas.cambiar_ip(disp, None)
+        self.assertEqual(zonas.zona_de[disp], 'norte')
+        suelto = zonas.buscar_por_nombre('pc-suelto')
+        zonas.cambiar_ip(suelto, '10.1.7.7')
+        self.assertEqual(zonas.zona_de[suelto], 'norte')
+
+    def test_cambiar_ip_rechazada_no_muda(self):
+        zonas = self.abrir()
+        disp = zonas.buscar_por_nombre('pc-n2')
+        with self.assertRaises(ValueError):
+            zonas.cambiar_ip(disp, '10.2.0.1')   # en uso por pc-s0
+        self.assertEqual(zonas.zona_de[disp], 'norte')
+        self.assertEqual(disp.ip, '10.1.0.3')
+        self.assertEqual(self.cantidades(zonas), {'norte': 20, 'sur': 20, 'general': 1})
+
+if __name__ == '__main__':
+    unittest.main()